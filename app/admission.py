@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from app import keys, metrics
+
+
+# Admission queue priorities; lower numbers get LLM slots first
+PRIORITY_CHAT = 0
+PRIORITY_QUEST = 1
+PRIORITY_BACKGROUND = 2
+
+
+class AdmissionRejected(Exception):
+    """An LLM call that can't be served in time; the caller degrades instead"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        # "queue_full" or "deadline"
+        self.reason = reason
+
+
+def deadline_after(seconds: float) -> Optional[float]:
+    """Event loop time `seconds` from now, or None (no deadline) for 0"""
+    if seconds <= 0:
+        return None
+    return asyncio.get_running_loop().time() + seconds
+
+
+class AdmissionQueue:
+    """Bounded priority queue in front of the LLM concurrency slots
+
+    At most `slots` calls run at once. The rest wait by priority, then
+    arrival, up to `max_queue` of them (0 means no bound); when the queue
+    is full the least urgent request is turned away, which may be the
+    newcomer. A request whose deadline passes while it waits, or that
+    couldn't start before its deadline given the requests ahead of it and
+    the average time a slot is held, is rejected at once instead of being
+    left to time out.
+    """
+
+    # Weight of the latest slot hold time in the running average
+    SERVICE_TIME_ALPHA = 0.1
+
+    def __init__(self, slots: int, max_queue: int = 0):
+        self.slots = max(1, slots)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        # Heap of [priority, arrival, deadline, future], pending futures only
+        self._waiters: List[list] = []
+        self._arrivals = itertools.count()
+        self.service_time: Optional[float] = None
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def rejection(self, reason: str) -> AdmissionRejected:
+        """Count a rejection and build the exception for it"""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.count_admission_rejection(reason)
+        return AdmissionRejected(reason)
+
+    def _expected_wait(self, priority: int) -> float:
+        """Rough seconds until a slot frees up for a request of this priority"""
+        if self.service_time is None:
+            return 0.0
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+        return (ahead + 1) * self.service_time / self.slots
+
+    def _make_room(self, priority: int) -> None:
+        """Turn away the least urgent waiter of a full queue, or raise if that is the newcomer"""
+        worst = max(self._waiters, key=lambda waiter: (waiter[0], waiter[1]))
+        if worst[0] <= priority:
+            raise self.rejection("queue_full")
+        self._waiters.remove(worst)
+        heapq.heapify(self._waiters)
+        worst[3].set_exception(self.rejection("queue_full"))
+
+    async def acquire(self, priority: int, deadline: Optional[float] = None) -> None:
+        """Wait for an LLM slot; raises AdmissionRejected when none comes in time"""
+        loop = asyncio.get_running_loop()
+        if self.active < self.slots and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if deadline is not None and loop.time() + self._expected_wait(priority) > deadline:
+            raise self.rejection("deadline")
+        if self.max_queue and len(self._waiters) >= self.max_queue:
+            self._make_room(priority)
+
+        future = loop.create_future()
+        waiter = [priority, next(self._arrivals), deadline, future]
+        heapq.heappush(self._waiters, waiter)
+        start = time.perf_counter()
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            await asyncio.wait([future], timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        metrics.observe_stage("admission_wait", time.perf_counter() - start)
+        if not future.done():
+            self._abandon(waiter)
+            raise self.rejection("deadline")
+        # Re-raises a rejection set while waiting
+        future.result()
+
+    def _abandon(self, waiter: list) -> None:
+        """Drop a waiter that gave up, handing its slot on if it was just granted one"""
+        future = waiter[3]
+        if not future.done():
+            future.cancel()
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+        elif future.exception() is None:
+            self.release()
+
+    def release(self) -> None:
+        """Free a slot and hand it to the most urgent waiter whose deadline hasn't passed"""
+        self.active -= 1
+        now = asyncio.get_running_loop().time()
+        while self._waiters and self.active < self.slots:
+            _, _, deadline, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            if deadline is not None and deadline <= now:
+                future.set_exception(self.rejection("deadline"))
+                continue
+            self.active += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def _observe(self, seconds: float) -> None:
+        if self.service_time is None:
+            self.service_time = seconds
+        else:
+            self.service_time += self.SERVICE_TIME_ALPHA * (seconds - self.service_time)
+
+    @asynccontextmanager
+    async def slot(self, priority: int, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold an LLM slot for the duration of the block"""
+        await self.acquire(priority, deadline)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(time.perf_counter() - start)
+            self.release()
+
+    def stats(self) -> Dict:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_slot_seconds": round(self.service_time, 4) if self.service_time is not None else None
+        }
+
+
+class RateLimiter:
+    """Per-player and per-NPC token buckets kept in the storage backend
+
+    Buckets live in the shared store, so every worker draws from the same
+    ones. A rate of 0 turns that limit off. If the store can't be reached
+    the request is let through rather than turning every player away.
+    """
+
+    def __init__(
+        self,
+        storage,
+        player_rate: float,
+        player_burst: int,
+        npc_rate: float,
+        npc_burst: int
+    ):
+        self.storage = storage
+        self.limits = {
+            "player": (player_rate, max(1, player_burst)),
+            "npc": (npc_rate, max(1, npc_burst))
+        }
+        self.checks = 0
+        self.limited = {"player": 0, "npc": 0}
+
+    async def _take(self, scope: str, owner_id: str) -> float:
+        rate, burst = self.limits[scope]
+        if rate <= 0:
+            return 0.0
+        self.checks += 1
+        try:
+            retry_after = await self.storage.take_token(keys.rate_limit(scope, owner_id), rate, burst)
+        except Exception as e:
+            print(f"Rate limit check error: {e}")
+            return 0.0
+        if retry_after:
+            self.limited[scope] += 1
+            metrics.count_rate_limited(scope)
+        return retry_after
+
+    async def check_player(self, player_id: str) -> float:
+        """0.0 if the player may send another request, else seconds to wait"""
+        return await self._take("player", player_id)
+
+    async def check_npc(self, npc_id: str) -> float:
+        """0.0 if the NPC may make another LLM call, else seconds until it can"""
+        return await self._take("npc", npc_id)
+
+    def stats(self) -> Dict:
+        return {
+            "player": {"rate": self.limits["player"][0], "burst": self.limits["player"][1]},
+            "npc": {"rate": self.limits["npc"][0], "burst": self.limits["npc"][1]},
+            "checks": self.checks,
+            "limited": dict(self.limited)
+        }
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Dict, Optional
+
+
+class CascadeDeleter:
+    """Background removal of the player data left behind by deletes
+
+    Deleting an NPC (or player) only removes its own keys and stages the
+    affected player-NPC pairs in a durable job; this worker then removes
+    each pair's conversation, summary and reputation in batches of
+    `batch_size`, pausing between batches so a popular NPC never ties up
+    the store. Jobs live in the storage backend, so a restart picks up
+    where the last worker stopped. Backends that delete inline never
+    produce jobs and the worker just idles.
+    """
+
+    # Seconds between checks for jobs queued by other workers
+    IDLE_INTERVAL = 5.0
+
+    def __init__(self, storage, batch_size: int = 500, pause: float = 0.01):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.pause = pause
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.jobs_completed = 0
+        self.pairs_deleted = 0
+        self.batches = 0
+
+    async def start(self) -> None:
+        """Start the worker (called from the app lifespan)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the worker; unfinished jobs are resumed on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self) -> None:
+        """Wake the worker right away, e.g. after this worker staged a job"""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self.storage.next_cascade_job()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.IDLE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cascade delete error: {e}")
+                await asyncio.sleep(1.0)
+
+    async def run_job(self, job: str) -> int:
+        """Work through one job until it is finished; returns the pairs deleted"""
+        deleted = 0
+        while True:
+            count = await self.storage.cascade_delete_batch(job, self.batch_size)
+            if count == 0:
+                self.jobs_completed += 1
+                return deleted
+            deleted += count
+            self.pairs_deleted += count
+            self.batches += 1
+            await asyncio.sleep(self.pause)
+
+    def stats(self) -> Dict:
+        return {
+            "jobs_completed": self.jobs_completed,
+            "pairs_deleted": self.pairs_deleted,
+            "batches": self.batches
+        }
@@ -0,0 +1,137 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Union
+
+import msgpack
+
+from app.models import MemoryEntry
+
+
+# Binary entries start with a version byte and a flags byte. Legacy JSON
+# entries always start with "{", so both formats can share one list.
+FORMAT_VERSION = 1
+FLAG_ZLIB = 0x01
+_LEGACY_JSON_PREFIX = ord("{")
+
+
+# Timestamps are naive local wall-clock times (datetime.now()), so they are
+# stored as microseconds since a naive epoch; this round-trips exactly
+# without touching the system timezone database
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+_ENTRY_FIELDS = frozenset(MemoryEntry.model_fields)
+
+
+def _timestamp_to_micros(timestamp: str) -> Union[int, str]:
+    """ISO timestamp -> integer microseconds (anything else is kept as a string)"""
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return timestamp
+    # Timezone-aware stamps keep their offset by staying strings
+    if moment.tzinfo is not None:
+        return timestamp
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def _micros_to_timestamp(value: Union[int, str]) -> str:
+    if isinstance(value, int):
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+def _construct_entry(fields: Dict) -> MemoryEntry:
+    """Build a MemoryEntry from trusted, complete fields without validation
+
+    Cheaper than both validation and `model_construct`, which still walks
+    the field defaults.
+    """
+    entry = MemoryEntry.__new__(MemoryEntry)
+    object.__setattr__(entry, "__dict__", fields)
+    object.__setattr__(entry, "__pydantic_fields_set__", set(_ENTRY_FIELDS))
+    object.__setattr__(entry, "__pydantic_extra__", None)
+    object.__setattr__(entry, "__pydantic_private__", None)
+    return entry
+
+
+def encode_entry(entry: MemoryEntry, compress_threshold: int = 512) -> bytes:
+    """Encode a memory entry as versioned msgpack
+
+    Fields are stored positionally with an integer timestamp. Payloads
+    whose text exceeds `compress_threshold` bytes are zlib-compressed when
+    that actually saves space.
+    """
+    payload = msgpack.packb(
+        [
+            _timestamp_to_micros(entry.timestamp),
+            entry.player_message,
+            entry.npc_response,
+            entry.context or None
+        ],
+        use_bin_type=True
+    )
+    flags = 0
+    if compress_threshold and len(payload) > compress_threshold:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= FLAG_ZLIB
+    return bytes((FORMAT_VERSION, flags)) + payload
+
+
+def encode_entry_json(entry: MemoryEntry) -> bytes:
+    """Encode a memory entry in the legacy pydantic JSON format"""
+    return entry.model_dump_json().encode("utf-8")
+
+
+def decode_entry(raw: Union[bytes, str], validate: bool = False) -> MemoryEntry:
+    """Decode a stored memory entry in either format
+
+    Binary entries written by this service are trusted and built without
+    pydantic validation unless `validate` is set. Legacy JSON entries are
+    always validated.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if not raw or raw[0] == _LEGACY_JSON_PREFIX:
+        return MemoryEntry(**json.loads(raw))
+
+    version, flags = raw[0], raw[1]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported memory entry format version: {version}")
+
+    payload = raw[2:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    timestamp, player_message, npc_response, context = msgpack.unpackb(payload, raw=False)
+
+    fields = {
+        "timestamp": _micros_to_timestamp(timestamp),
+        "player_message": player_message,
+        "npc_response": npc_response,
+        "context": context or {}
+    }
+    if validate:
+        return MemoryEntry(**fields)
+    return _construct_entry(fields)
+
+
+def is_legacy_entry(raw: Union[bytes, str]) -> bool:
+    """True for entries still stored as pydantic JSON"""
+    if isinstance(raw, str):
+        return raw.startswith("{")
+    return bool(raw) and raw[0] == _LEGACY_JSON_PREFIX
+
+
+def decode_entries(raws: Iterable[Union[bytes, str]]) -> List[MemoryEntry]:
+    """Decode stored entries, skipping (and reporting) any that are corrupt
+    or in an unknown format instead of failing the whole read"""
+    entries = []
+    for raw in raws:
+        try:
+            entries.append(decode_entry(raw))
+        except Exception as e:
+            print(f"Skipping undecodable memory entry ({len(raw)} bytes): {e!r}")
+    return entries
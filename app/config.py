@@ -1,21 +1,141 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Any, Dict, List
 
 
 class Settings(BaseSettings):
     # OpenAI
     openai_api_key: str = ""
     openai_model: str = "gpt-3.5-turbo"
+    openai_base_url: str = ""  # Override for OpenAI-compatible servers
     
     # Ollama
     use_ollama: bool = False
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama2"
+    ollama_max_connections: int = 100
+    ollama_max_keepalive_connections: int = 20
+    ollama_keepalive_expiry: float = 60.0
+    ollama_connect_timeout: float = 5.0
+    ollama_read_timeout: float = 30.0
+    ollama_write_timeout: float = 10.0
+    ollama_pool_timeout: float = 5.0
+    
+    # LLM concurrency
+    llm_max_concurrency: int = 16  # Max provider calls in flight per worker
+    
+    # LLM backends behind the router (JSON list); empty uses the single
+    # provider above, e.g. [{"name": "gpu1", "provider": "ollama",
+    # "base_url": "http://gpu1:11434", "weight": 2}, {"provider": "openai", "tier": 1}]
+    llm_backends: List[Dict[str, Any]] = []
+    llm_circuit_failure_threshold: int = 5  # Consecutive failures that eject a backend
+    llm_circuit_reset_timeout: float = 30.0  # Seconds before an ejected backend is probed again
+    llm_hedge_enabled: bool = False  # Duplicate slow non-streaming calls on another backend
+    llm_hedge_quantile: float = 0.95  # Hedge once a call outlasts this latency quantile
+    llm_hedge_min_samples: int = 20  # Calls observed per backend before hedging starts
+    
+    # Admission control (opt-in): per-player and per-NPC token buckets in the
+    # storage backend, and a bounded priority queue with deadlines in front of
+    # the LLM_MAX_CONCURRENCY slots. Requests that can't be served in time get
+    # an in-character fallback reply (or a generic quest) instead of waiting.
+    admission_enabled: bool = False
+    admission_max_queue: int = 200  # Requests waiting for an LLM slot per worker; 0 = unbounded
+    admission_chat_deadline: float = 8.0  # Seconds a chat turn may take before it degrades; 0 = none
+    admission_quest_deadline: float = 20.0  # Same for quest generation
+    admission_player_rate: float = 0.5  # Requests per second per player (0 disables)
+    admission_player_burst: int = 5
+    admission_npc_rate: float = 20.0  # LLM replies per second per NPC before it degrades (0 disables)
+    admission_npc_burst: int = 40
+    
+    # Conversation history sent to the LLM
+    history_token_budget: int = 1024  # Estimated tokens of history per prompt
+    history_token_budgets: Dict[str, int] = {}  # Per-model overrides, e.g. {"llama2": 512}
+    history_max_turns: int = 10  # Cap on exchanges read per chat turn; fewer when long ones fill the budget
+    
+    # Rolling summary of older conversation turns (opt-in; each compaction is
+    # an extra LLM call, queued at background priority behind chat and quests)
+    summary_enabled: bool = False
+    summary_threshold: int = 30  # Stored turns that trigger compaction
+    summary_keep_recent: int = 10  # Turns kept verbatim after compaction
+    summary_max_chars: int = 1500
+    
+    # Storage format of conversation entries
+    conversation_encoding: str = "msgpack"  # "msgpack" or legacy "json"
+    conversation_compress_threshold: int = 512  # zlib entries larger than this (bytes); 0 disables
+    
+    # Long-term memory (local vector index of past exchanges). Opt-in: each
+    # worker holds about ltm_max_cached_entries * (4 * ltm_dim + ~500) bytes,
+    # roughly 30 MB with the defaults
+    ltm_enabled: bool = False
+    ltm_dim: int = 256  # Hashing embedder dimensions
+    ltm_max_entries: int = 2000  # Exchanges kept per player-NPC pair
+    ltm_ttl: int = 2592000  # Drop a pair's log this long after its last exchange (seconds)
+    ltm_max_cached_entries: int = 20000  # Exchanges indexed in memory per worker, across all pairs
+    ltm_top_k: int = 3  # Relevant exchanges injected into the prompt
+    ltm_min_score: float = 0.2  # Minimum cosine similarity
+    
+    # Single-flight coalescing of identical in-flight chat replies (quests are never shared)
+    single_flight_enabled: bool = True
+    single_flight_scope: str = "exact"  # "exact" or "normalized"
+    single_flight_timeout: float = 30.0  # Max seconds a follower waits on the shared call
+    
+    # LLM response cache (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_backend: str = "memory"  # "memory" or "redis"
+    response_cache_ttl: float = 3600.0
+    response_cache_max_size: int = 10000  # Memory backend only
+    response_cache_variants: int = 3  # Distinct replies kept per key
+    
+    # Write-behind persistence of chat turns (opt-in)
+    write_behind_enabled: bool = False
+    write_behind_max_batch: int = 100  # Turns committed per MULTI/EXEC
+    write_behind_flush_interval: float = 0.005  # Seconds to wait for a batch to fill
+    write_behind_max_pending: int = 10000  # Queue bound; chat waits when full
+    write_behind_max_retries: int = 3  # Then the batch's turns are tried one at a time
+    
+    # Quest generation
+    quest_response_format: str = "json_object"  # "json_schema", "json_object" or "none"
+    quest_max_repairs: int = 2  # Follow-up calls for missing or invalid fields
+    
+    # Pre-generated quest pools (opt-in)
+    quest_pool_enabled: bool = False
+    quest_pool_size: int = 5  # Quests kept ready per NPC
+    quest_pool_low_watermark: int = 2  # Refill when fewer remain
+    quest_pool_workers: int = 2  # Background refill tasks per worker
+    quest_pool_ttl: int = 86400  # Seconds before an untouched pool expires
+    
+    # Storage backend for NPCs, conversations, reputation and quest pools
+    storage_backend: str = "redis"  # "redis", "memory" (single worker, not persisted) or "sqlite"
+    sqlite_path: str = "data/npc.db"
+    sqlite_max_batch: int = 100  # Writes grouped into one SQLite transaction
+    sqlite_read_threads: int = 4
+    
+    # Background cleanup of player data after NPC/player deletes (Redis)
+    cascade_delete_batch_size: int = 500  # Player-NPC pairs removed per batch
+    cascade_delete_pause: float = 0.01  # Seconds between batches
     
     # Redis
     redis_host: str = "redis"
     redis_port: int = 6379
     redis_db: int = 0
+    redis_cluster: bool = False  # REDIS_HOST/REDIS_PORT is then any cluster node; REDIS_DB is ignored
+    redis_max_connections: int = 100
+    redis_socket_timeout: float = 5.0
+    redis_socket_connect_timeout: float = 2.0
+    redis_health_check_interval: int = 30
+    
+    # NPC definition cache (per worker, invalidated via Redis pub/sub or the SQLite log)
+    npc_cache_enabled: bool = True
+    npc_cache_max_size: int = 1024
+    npc_cache_ttl: float = 300.0
+    
+    # Reputation scoring
+    reputation_lexicon_path: str = ""  # JSON file with weighted lexicons per personality
+    
+    # Observability
+    metrics_enabled: bool = True  # Prometheus text format on /metrics
+    otel_enabled: bool = False  # OpenTelemetry spans per stage (needs opentelemetry-api)
+    otel_service_name: str = "ai-npc-system"
     
     # API
     api_host: str = "0.0.0.0"
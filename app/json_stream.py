@@ -0,0 +1,123 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """Incremental parser for a single JSON object arriving in chunks
+
+    `feed()` returns events as soon as they are complete:
+
+      ("field", key, value)  a top-level member finished
+      ("item", key, value)   an element of a top-level array finished
+
+    Text before the opening brace (e.g. a markdown fence) and after the
+    closing brace is ignored. Members whose key isn't a string (an
+    unquoted word is accepted) or whose value isn't valid JSON are left
+    out of `result` and recorded in `errors`.
+    """
+
+    def __init__(self):
+        self.result: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_valid = True
+        self._buffer: List[str] = []
+        self._item: Optional[List[str]] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        for ch in chunk:
+            if self.done:
+                break
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._push(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._push(ch)
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2 and ch == "[":
+                    self._buffer.append(ch)
+                    self._item = []
+                else:
+                    self._push(ch)
+            elif ch in "}]":
+                if self._depth == 1:
+                    self._flush_member(events)
+                    self._depth = 0
+                    self.done = True
+                    continue
+                if self._depth == 2 and self._item is not None:
+                    self._flush_item(events)
+                    self._item = None
+                    self._buffer.append(ch)
+                else:
+                    self._push(ch)
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._flush_member(events)
+            elif ch == "," and self._depth == 2 and self._item is not None:
+                self._flush_item(events)
+                self._buffer.append(ch)
+            elif ch == ":" and self._depth == 1 and self._key is None:
+                raw = "".join(self._buffer).strip()
+                try:
+                    key = json.loads(raw)
+                except ValueError:
+                    key = raw
+                # A number, list or object key would be unusable (or unhashable)
+                self._key_valid = isinstance(key, str)
+                self._key = key if self._key_valid else raw
+                self._buffer = []
+            else:
+                self._push(ch)
+        return events
+
+    def _push(self, ch: str) -> None:
+        self._buffer.append(ch)
+        if self._item is not None:
+            self._item.append(ch)
+
+    def _flush_item(self, events: List[Tuple[str, str, Any]]) -> None:
+        text = "".join(self._item).strip()
+        self._item = []
+        if not text or self._key is None or not self._key_valid:
+            return
+        try:
+            events.append(("item", self._key, json.loads(text)))
+        except ValueError:
+            pass
+
+    def _flush_member(self, events: List[Tuple[str, str, Any]]) -> None:
+        key, text, key_valid = self._key, "".join(self._buffer).strip(), self._key_valid
+        self._key, self._buffer, self._item, self._key_valid = None, [], None, True
+        if key is None:
+            return
+        if not key_valid:
+            self.errors[key] = text
+            return
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.errors[key] = text
+            return
+        self.result[key] = value
+        events.append(("field", key, value))
+
@@ -0,0 +1,139 @@
+import uuid
+
+
+# Every Redis key the service uses is built here. The part in braces is the
+# Redis Cluster hash tag: only it is hashed, so keys that share a tag share a
+# slot and can be used together in one script or transaction.
+#
+#   {npc_id}             the NPC definition, stats, quest pool, player index
+#                        and cascade state of one NPC
+#   {player_id:npc_id}   the conversation, summary, reputation and long-term
+#                        memory of one player-NPC pair, updated together by
+#                        a chat turn
+#   {player_id}          the NPC index of one player
+#
+# Ids are embedded as-is. An id containing "}" ends its tag early, which
+# still keeps the keys built from the same ids together, unless the id
+# starts with "}" (an empty tag hashes the whole key).
+
+# Queue of pending cascade deletes (JSON jobs), shared by every worker
+CASCADE_JOBS_KEY = "cascade_delete_jobs"
+
+# Prefixes of the keys that belong to a player-NPC pair
+PAIR_KEY_PREFIXES = ("conversation", "summary", "reputation", "ltm", "ltm_count")
+
+
+def _pair_tag(player_id: str, npc_id: str) -> str:
+    return "{" + player_id + ":" + npc_id + "}"
+
+
+def _tag(value: str) -> str:
+    return "{" + value + "}"
+
+
+# NPC keys
+
+def npc(npc_id: str) -> str:
+    return f"npc:{_tag(npc_id)}"
+
+
+def npc_conversation_count(npc_id: str) -> str:
+    return f"npc_stats:{_tag(npc_id)}:conversations"
+
+
+def quest_pool(npc_id: str) -> str:
+    return f"quest_pool:{_tag(npc_id)}"
+
+
+def quest_pool_lock(npc_id: str) -> str:
+    return f"quest_pool_lock:{_tag(npc_id)}"
+
+
+def npc_players(npc_id: str) -> str:
+    """Set of players who have a conversation or reputation with the NPC"""
+    return f"npc_players:{_tag(npc_id)}"
+
+
+def cascade_pending(npc_id: str) -> str:
+    return f"cascade_pending:{_tag(npc_id)}"
+
+
+def counted_turn(npc_id: str, turn_id: str) -> str:
+    """Short-lived marker of a chat turn already added to the conversation count"""
+    return f"counted_turn:{_tag(npc_id)}:{turn_id}"
+
+
+def npc_owned_keys(npc_id: str) -> tuple:
+    """The NPC's own keys, removed at once when it is deleted"""
+    return (npc(npc_id), npc_conversation_count(npc_id), quest_pool(npc_id))
+
+
+# Player-NPC pair keys
+
+def conversation(player_id: str, npc_id: str) -> str:
+    return f"conversation:{_pair_tag(player_id, npc_id)}"
+
+
+def summary(player_id: str, npc_id: str) -> str:
+    return f"summary:{_pair_tag(player_id, npc_id)}"
+
+
+def reputation(player_id: str, npc_id: str) -> str:
+    return f"reputation:{_pair_tag(player_id, npc_id)}"
+
+
+def ltm(player_id: str, npc_id: str) -> str:
+    """Long-term memory log of the pair's exchanges"""
+    return f"ltm:{_pair_tag(player_id, npc_id)}"
+
+
+def ltm_count(player_id: str, npc_id: str) -> str:
+    """Records ever appended to the pair's long-term memory log"""
+    return f"ltm_count:{_pair_tag(player_id, npc_id)}"
+
+
+def compaction_lock(player_id: str, npc_id: str) -> str:
+    return f"compaction_lock:{_pair_tag(player_id, npc_id)}"
+
+
+def chat_turn(player_id: str, npc_id: str, turn_id: str) -> str:
+    """Short-lived marker of a committed chat turn, so a retried commit skips it"""
+    return f"chat_turn:{_pair_tag(player_id, npc_id)}:{turn_id}"
+
+
+def pair_keys(player_id: str, npc_id: str) -> tuple:
+    """Keys removed when a player-NPC pair is deleted"""
+    return (
+        conversation(player_id, npc_id),
+        summary(player_id, npc_id),
+        reputation(player_id, npc_id),
+        ltm(player_id, npc_id),
+        ltm_count(player_id, npc_id)
+    )
+
+
+# Player keys
+
+def player_npcs(player_id: str) -> str:
+    """Set of NPCs the player has a conversation or reputation with"""
+    return f"player_npcs:{_tag(player_id)}"
+
+
+# Cascade deletes
+
+def cascade_staging(kind: str, owner_id: str) -> str:
+    """A fresh staging set in the same slot as the index it replaces"""
+    return f"cascade:{kind}:{_tag(owner_id)}:{uuid.uuid4().hex}"
+
+
+# Rate limits
+
+def rate_limit(scope: str, owner_id: str) -> str:
+    """Token bucket of one player or NPC (`scope` is "player" or "npc")"""
+    return f"rate_limit:{scope}:{_tag(owner_id)}"
+
+
+# Response cache entries are single keys and need no tag
+
+def llm_cache(key: str) -> str:
+    return f"llm_cache:{key}"
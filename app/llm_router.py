@@ -0,0 +1,544 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from app import metrics
+
+
+# Recent successful call durations kept per backend and kind of call
+LATENCY_WINDOW = 200
+
+# Builds the provider-specific structured output setting for a provider name
+OutputFormat = Optional[Callable[[str], Any]]
+
+
+class NoBackendAvailable(Exception):
+    """Every LLM backend is failing or ejected by its circuit breaker"""
+
+
+class CircuitBreaker:
+    """Ejects a backend after consecutive failures
+
+    Closed: calls flow. After `failure_threshold` failures in a row it
+    opens and the backend gets no traffic for `reset_timeout` seconds,
+    then half-opens: a single probe call decides whether it closes again
+    or stays open for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def start_call(self) -> bool:
+        """Note a call starting; returns whether it is the half-open probe"""
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self, probe: bool) -> None:
+        """A call ended without a verdict (e.g. a cancelled hedge); only the
+        probe itself lets another probe go out"""
+        if probe:
+            self.probing = False
+
+
+class LLMBackend:
+    """One LLM endpoint behind the router"""
+
+    backend = "base"
+
+    def __init__(self, name: str, model: str, weight: float = 1.0, tier: int = 0):
+        self.name = name
+        self.model = model
+        self.weight = weight
+        self.tier = tier
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+        self.breaker = CircuitBreaker()
+        self.latencies: Dict[str, Deque[float]] = {}
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> str:
+        raise NotImplementedError
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def observe(self, kind: str, seconds: float) -> None:
+        samples = self.latencies.get(kind)
+        if samples is None:
+            samples = self.latencies[kind] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+
+    def latency_quantile(self, kind: str, quantile: float, min_samples: int) -> Optional[float]:
+        """Nearest-rank quantile of recent call durations, None until there are enough"""
+        samples = self.latencies.get(kind)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)]
+
+    def stats(self) -> Dict:
+        p95 = self.latency_quantile("chat", 0.95, 1)
+        return {
+            "name": self.name,
+            "provider": self.backend,
+            "model": self.model,
+            "tier": self.tier,
+            "weight": self.weight,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "failures": self.failures,
+            "chat_p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI or any OpenAI-compatible server"""
+
+    backend = "openai"
+
+    def __init__(self, name: str, model: str, api_key: str, base_url: str = "", weight: float = 1.0, tier: int = 0):
+        super().__init__(name, model, weight, tier)
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url or None)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> str:
+        options = {"response_format": output_format} if output_format else {}
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **options
+        )
+        return response.choices[0].message.content.strip()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> AsyncIterator[str]:
+        options = {"response_format": output_format} if output_format else {}
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            **options
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OllamaBackend(LLMBackend):
+    """An Ollama server; generation length and temperature are the model's defaults"""
+
+    backend = "ollama"
+
+    def __init__(self, name: str, model: str, base_url: str, settings, weight: float = 1.0, tier: int = 0):
+        super().__init__(name, model, weight, tier)
+        self.base_url = base_url
+        self.settings = settings
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self._get_http_client()
+
+    async def close(self) -> None:
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, creating it on first use"""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.settings.ollama_max_connections,
+                    max_keepalive_connections=self.settings.ollama_max_keepalive_connections,
+                    keepalive_expiry=self.settings.ollama_keepalive_expiry
+                ),
+                timeout=httpx.Timeout(
+                    connect=self.settings.ollama_connect_timeout,
+                    read=self.settings.ollama_read_timeout,
+                    write=self.settings.ollama_write_timeout,
+                    pool=self.settings.ollama_pool_timeout
+                )
+            )
+        return self.http_client
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool, output_format: Any) -> Dict:
+        payload = {"model": self.model, "messages": messages, "stream": stream}
+        if output_format is not None:
+            payload["format"] = output_format
+        return payload
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> str:
+        response = await self._get_http_client().post(
+            "/api/chat", json=self._payload(messages, False, output_format)
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"].strip()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: Any = None
+    ) -> AsyncIterator[str]:
+        """Stream tokens from newline-delimited JSON"""
+        payload = self._payload(messages, True, output_format)
+        async with self._get_http_client().stream("POST", "/api/chat", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                content = data.get("message", {}).get("content")
+                if content:
+                    yield content
+                if data.get("done"):
+                    break
+
+
+class LLMRouter:
+    """Spreads LLM calls over several backends
+
+    Backends are tried tier by tier: lower tiers take all traffic while
+    any of their backends is healthy, higher tiers are overflow for when
+    they are all ejected or failing. Within a tier the backend with the
+    fewest outstanding calls per unit of weight wins. A failed call moves
+    on to the next backend; streams only before their first chunk.
+
+    With hedging on, a non-streaming call still running after its
+    backend's recent `hedge_quantile` latency gets a duplicate on another
+    backend and the first good answer wins, so one slow box no longer sets
+    the tail latency. This costs roughly (1 - hedge_quantile) extra calls.
+    """
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        hedge_enabled: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20
+    ):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def primary(self) -> LLMBackend:
+        """The first backend of the lowest tier"""
+        return min(self.backends, key=lambda backend: backend.tier)
+
+    async def start(self) -> None:
+        for backend in self.backends:
+            await backend.start()
+
+    async def close(self) -> None:
+        for backend in self.backends:
+            await backend.close()
+
+    def pick(self, exclude: Set[str] = frozenset()) -> Optional[LLMBackend]:
+        """The least loaded healthy backend of the lowest tier that has one"""
+        candidates = [
+            backend for backend in self.backends
+            if backend.name not in exclude and backend.breaker.available()
+        ]
+        if not candidates:
+            return None
+        tier = min(backend.tier for backend in candidates)
+        return min(
+            (backend for backend in candidates if backend.tier == tier),
+            # Random tie-break so idle backends share the first calls
+            key=lambda backend: ((backend.outstanding + 1) / backend.weight, random.random())
+        )
+
+    def _begin(self, backend: LLMBackend) -> Tuple[float, bool]:
+        """Start time of a call and whether it is the backend's half-open probe"""
+        backend.outstanding += 1
+        backend.calls += 1
+        probe = backend.breaker.start_call()
+        return time.perf_counter(), probe
+
+    def _fail(self, backend: LLMBackend, kind: str, error: Exception) -> None:
+        print(f"LLM backend {backend.name} error: {error}")
+        backend.failures += 1
+        backend.breaker.record_failure()
+        metrics.count_provider_error(backend.backend, kind)
+        metrics.count_backend_call(backend.name, "error")
+
+    def _succeed(self, backend: LLMBackend, kind: str, start: float) -> None:
+        backend.breaker.record_success()
+        backend.observe(kind, time.perf_counter() - start)
+        metrics.count_backend_call(backend.name, "success")
+
+    async def _call(
+        self,
+        backend: LLMBackend,
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: OutputFormat
+    ) -> str:
+        start, probe = self._begin(backend)
+        try:
+            result = await backend.complete(
+                messages, max_tokens, temperature, output_format(backend.backend) if output_format else None
+            )
+        except asyncio.CancelledError:
+            metrics.count_backend_call(backend.name, "cancelled")
+            raise
+        except Exception as e:
+            self._fail(backend, kind, e)
+            raise
+        else:
+            self._succeed(backend, kind, start)
+            return result
+        finally:
+            backend.outstanding -= 1
+            backend.breaker.release(probe)
+
+    async def complete(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 200,
+        temperature: float = 0.8,
+        output_format: OutputFormat = None
+    ) -> str:
+        """One completion from the first backend that succeeds; raises the last
+        error (or NoBackendAvailable) when they all fail"""
+        tried: Set[str] = set()
+        error: Exception = NoBackendAvailable("No healthy LLM backend")
+        while True:
+            backend = self.pick(tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.failovers += 1
+            tried.add(backend.name)
+            try:
+                return await self._hedged(backend, tried, kind, messages, max_tokens, temperature, output_format)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+
+    async def _hedged(
+        self,
+        backend: LLMBackend,
+        tried: Set[str],
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: OutputFormat
+    ) -> str:
+        """Call `backend`, adding a duplicate on another backend if it runs long"""
+        delay = None
+        if self.hedge_enabled:
+            delay = backend.latency_quantile(kind, self.hedge_quantile, self.hedge_min_samples)
+        if delay is None:
+            return await self._call(backend, kind, messages, max_tokens, temperature, output_format)
+
+        primary = asyncio.ensure_future(
+            self._call(backend, kind, messages, max_tokens, temperature, output_format)
+        )
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            hedge_backend = None if done else self.pick(tried)
+            if hedge_backend is not None:
+                tried.add(hedge_backend.name)
+                self.hedges += 1
+                metrics.count_hedge(kind)
+                pending.add(asyncio.ensure_future(
+                    self._call(hedge_backend, kind, messages, max_tokens, temperature, output_format)
+                ))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 200,
+        temperature: float = 0.8,
+        output_format: OutputFormat = None
+    ) -> AsyncIterator[str]:
+        """Stream from the first backend that produces output; once chunks
+        have been yielded an error is raised instead of failing over"""
+        tried: Set[str] = set()
+        error: Exception = NoBackendAvailable("No healthy LLM backend")
+        while True:
+            backend = self.pick(tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.failovers += 1
+            tried.add(backend.name)
+            emitted = False
+            start, probe = self._begin(backend)
+            try:
+                async for chunk in backend.stream(
+                    messages, max_tokens, temperature, output_format(backend.backend) if output_format else None
+                ):
+                    emitted = True
+                    yield chunk
+            except Exception as e:
+                self._fail(backend, kind, e)
+                if emitted:
+                    raise
+                error = e
+                continue
+            else:
+                self._succeed(backend, kind, start)
+                return
+            finally:
+                backend.outstanding -= 1
+                backend.breaker.release(probe)
+
+    def stats(self) -> Dict:
+        return {
+            "backends": [backend.stats() for backend in self.backends],
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+def create_llm_backends(settings) -> List[LLMBackend]:
+    """Backends from LLM_BACKENDS, or the single provider chosen by USE_OLLAMA"""
+    specs = settings.llm_backends
+    if not specs:
+        if settings.use_ollama:
+            specs = [{"provider": "ollama", "name": "ollama"}]
+        else:
+            specs = [{"provider": "openai", "name": "openai"}]
+
+    backends = []
+    for index, spec in enumerate(specs):
+        provider = spec.get("provider", "ollama")
+        name = spec.get("name", f"{provider}-{index}")
+        weight = float(spec.get("weight", 1.0))
+        tier = int(spec.get("tier", 0))
+        if provider == "ollama":
+            backend = OllamaBackend(
+                name,
+                spec.get("model", settings.ollama_model),
+                spec.get("base_url", settings.ollama_base_url),
+                settings,
+                weight=weight,
+                tier=tier
+            )
+        elif provider == "openai":
+            backend = OpenAIBackend(
+                name,
+                spec.get("model", settings.openai_model),
+                spec.get("api_key", settings.openai_api_key),
+                spec.get("base_url", settings.openai_base_url),
+                weight=weight,
+                tier=tier
+            )
+        else:
+            raise ValueError(f"Unknown LLM backend provider: {provider}")
+        backend.breaker = CircuitBreaker(
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            reset_timeout=settings.llm_circuit_reset_timeout
+        )
+        backends.append(backend)
+    return backends
@@ -1,165 +1,687 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Any, AsyncIterator, Awaitable, Callable, Sequence, Tuple
+import asyncio
+import hashlib
 import json
-from openai import OpenAI
-import httpx
+import math
+import time
 from app.config import get_settings
-from app.models import PersonalityType
+from app import metrics
+from app.admission import (
+    PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_QUEST, AdmissionQueue, AdmissionRejected
+)
+from app.json_stream import IncrementalJSONParser
+from app.llm_router import LLMRouter, OutputFormat, create_llm_backends
+from app.models import MemoryEntry, PersonalityType
+from app.personality import PersonalityEngine
+from app.quest_schema import QUEST_FIELDS, fallback_quest, quest_json_schema, validate_quest_field
+from app.response_cache import ResponseCache, normalize_message
+from app.single_flight import SingleFlight
+from app.tokens import TYPICAL_TURN_TOKENS, estimate_turn_tokens, pack_history
+
+
+FALLBACK_RESPONSE = "I seem to be at a loss for words right now..."
+
+# In-character reply per personality echoing the player's words; demo mode
+# appends its note, and overloaded requests get the reply on its own
+PERSONA_REPLIES = {
+    "friendly": ("Hello there, friend! I heard you say: '{message}...' I'd be happy to help you with that!",
+                 "This is a demo response - connect a real LLM for full conversations."),
+    "aggressive": ("What do you want? You said something about '{message}...' Make it quick!",
+                   "(Demo mode active)"),
+    "mysterious": ("Interesting... your words echo with meaning: '{message}...' Perhaps the answer lies beyond what you seek...",
+                   "(Demo response)"),
+    "merchant": ("Ah, a customer! You mentioned '{message}...' I have just what you need! The finest goods at reasonable prices.",
+                 "(Demo mode)"),
+    "wise": ("Young one, you speak of '{message}...' Let me share some wisdom with you about this matter...",
+             "(Demo response)"),
+    "comedic": ("Ha! You said '{message}...' That reminds me of a joke! Why did the NPC cross the road? To get to the other script!",
+                "(Demo mode)")
+}
+
+# Weight of the latest call in the running average of call latencies
+CALL_LATENCY_ALPHA = 0.1
+
+# Weight of the latest history in the running average of tokens per exchange
+TURN_TOKENS_ALPHA = 0.1
+
+# Admission queue priority per kind of LLM call
+CALL_PRIORITIES = {
+    "chat": PRIORITY_CHAT,
+    "stream": PRIORITY_CHAT,
+    "quest": PRIORITY_QUEST,
+    # Quest pool refills must never get ahead of the players they serve
+    "quest_pool": PRIORITY_BACKGROUND,
+    "summary": PRIORITY_BACKGROUND
+}
+
+# Call kinds whose provider time is reported as the chat turn's llm_* stages
+CHAT_CALL_KINDS = ("chat", "stream")
 
 
 class LLMService:
-    """Service to interact with OpenAI or Ollama LLMs"""
+    """Service to interact with OpenAI or Ollama LLMs through the backend router"""
     
-    def __init__(self):
+    def __init__(self, response_cache: Optional[ResponseCache] = None):
         self.settings = get_settings()
         self.demo_mode = self.settings.demo_mode
+        self.response_cache = response_cache
+        # Bounds concurrent provider calls so bursts queue here instead of
+        # overrunning the provider's rate limits; chat goes first, and with
+        # admission control the queue is bounded and requests have deadlines
+        self.admission = AdmissionQueue(
+            self.settings.llm_max_concurrency,
+            max_queue=self.settings.admission_max_queue if self.settings.admission_enabled else 0
+        )
+        # Running average seconds per (kind, streamed) until a call is useful:
+        # the whole reply, or the first token of a stream. A call that has to
+        # meet a deadline must get its slot at least this long before it.
+        self.call_latency: Dict[Tuple[str, bool], float] = {}
+        # Running average of estimated tokens per stored exchange, which
+        # sizes how much history is read for the token budget
+        self.turn_tokens = float(TYPICAL_TURN_TOKENS)
+        # Shares one generation between identical concurrent requests
+        self.single_flight: Optional[SingleFlight] = None
+        if self.settings.single_flight_enabled:
+            self.single_flight = SingleFlight(timeout=self.settings.single_flight_timeout)
         
+        self.router: Optional[LLMRouter] = None
         if self.demo_mode:
             self.client_type = "demo"
-        elif self.settings.use_ollama:
-            self.client_type = "ollama"
-            self.base_url = self.settings.ollama_base_url
-            self.model = self.settings.ollama_model
         else:
-            self.client_type = "openai"
-            self.client = OpenAI(api_key=self.settings.openai_api_key)
-            self.model = self.settings.openai_model
+            # One backend from USE_OLLAMA/OPENAI_* unless LLM_BACKENDS lists several
+            self.router = LLMRouter(
+                create_llm_backends(self.settings),
+                hedge_enabled=self.settings.llm_hedge_enabled,
+                hedge_quantile=self.settings.llm_hedge_quantile,
+                hedge_min_samples=self.settings.llm_hedge_min_samples
+            )
+            primary = self.router.primary
+            self.client_type = primary.backend if len(self.router.backends) == 1 else "router"
+            self.model = primary.model
+    
+    async def start(self) -> None:
+        """Open long-lived provider connections (called from the app lifespan)"""
+        if self.router is not None:
+            await self.router.start()
+    
+    async def close(self) -> None:
+        """Close provider connections"""
+        if self.router is not None:
+            await self.router.close()
     
     async def generate_response(
         self,
         system_prompt: str,
         user_message: str,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None
     ) -> str:
-        """Generate LLM response"""
+        """Generate LLM response
+        
+        Raises AdmissionRejected when the reply can't be generated before
+        `deadline` (event loop time) or the LLM queue is full.
+        """
         
         # Demo mode - return mock response
         if self.demo_mode:
             return self._generate_demo(system_prompt, user_message)
         
+        cache_key = self._cache_key(system_prompt, user_message, conversation_history, use_cache)
+        if cache_key:
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        messages = self._build_messages(system_prompt, user_message, conversation_history)
+        
+        response = await self._coalesce("chat", messages, lambda: self._generate(messages, deadline), deadline)
+        
+        if response == FALLBACK_RESPONSE:
+            metrics.count_fallback(self.client_type)
+        elif cache_key:
+            await self.response_cache.add(cache_key, response)
+        return response
+    
+    async def stream_response(
+        self,
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Generate LLM response, yielding text chunks as they arrive
+        
+        Raises AdmissionRejected before the first chunk when streaming can't
+        start before `deadline` or the LLM queue is full. A provider error
+        after the first chunk is re-raised so a cut-off reply isn't taken
+        for a whole one.
+        """
+        
+        # Demo mode - replay the mock response word by word
+        if self.demo_mode:
+            words = self._generate_demo(system_prompt, user_message).split(" ")
+            for i, word in enumerate(words):
+                yield word if i == 0 else f" {word}"
+            return
+        
+        cache_key = self._cache_key(system_prompt, user_message, conversation_history, use_cache)
+        if cache_key:
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        messages = self._build_messages(system_prompt, user_message, conversation_history)
+        
+        chunks = self._stream("stream", messages, deadline=deadline)
+        
+        emitted = []
+        span = metrics.start_span("llm_stream")
+        try:
+            async for chunk in chunks:
+                emitted.append(chunk)
+                yield chunk
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Streaming Error: {e}")
+            if emitted:
+                raise
+            metrics.count_fallback(self.client_type)
+            yield FALLBACK_RESPONSE
+            return
+        finally:
+            if span is not None:
+                span.end()
+        
+        if cache_key and emitted:
+            await self.response_cache.add(cache_key, "".join(emitted).strip())
+    
+    async def _coalesce(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        fn: Callable[[], Awaitable],
+        deadline: Optional[float] = None
+    ):
+        """Run a provider call, sharing it with identical concurrent requests
+        
+        A request joining another's call waits no longer than its own
+        `deadline`, and makes its own call if the shared one was rejected
+        by admission control, since that rejection reflects the other
+        request's deadline.
+        """
+        if self.single_flight is None:
+            return await fn()
+        timeout = None if deadline is None else deadline - asyncio.get_running_loop().time()
+        return await self.single_flight.do(
+            self._flight_key(kind, messages), fn, timeout=timeout, retry_on=(AdmissionRejected,)
+        )
+    
+    def _flight_key(self, kind: str, messages: List[Dict[str, str]]) -> str:
+        """Single-flight key for a provider payload
+        
+        The "exact" scope matches the payload byte for byte; the "normalized"
+        scope also treats trivially different final player messages as equal.
+        """
+        if self.settings.single_flight_scope == "normalized" and messages:
+            last = messages[-1]
+            messages = messages[:-1] + [{**last, "content": normalize_message(last["content"])}]
+        payload = json.dumps([kind, self.client_type, getattr(self, "model", None), messages])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def history_token_budget(self) -> int:
+        """Token budget for conversation history with the active model"""
+        model = getattr(self, "model", None)
+        return self.settings.history_token_budgets.get(model, self.settings.history_token_budget)
+    
+    def history_fetch_limit(self) -> int:
+        """How many stored exchanges to read to fill the token budget at the
+        average exchange size seen so far, plus one to spare"""
+        expected = math.ceil(self.history_token_budget() / self.turn_tokens) + 1
+        return max(1, min(self.settings.history_max_turns, expected))
+    
+    def _observe_history(self, conversation_history: List[Dict[str, str]]) -> None:
+        """Fold the size of fetched exchanges into the running average"""
+        if not conversation_history:
+            return
+        average = sum(estimate_turn_tokens(entry) for entry in conversation_history) / len(conversation_history)
+        self.turn_tokens += TURN_TOKENS_ALPHA * (average - self.turn_tokens)
+    
+    def _history_window(
+        self,
+        conversation_history: Optional[List[Dict[str, str]]]
+    ) -> List[Dict[str, str]]:
+        """The most recent exchanges that fit the history token budget (newest first)"""
+        if not conversation_history:
+            return []
+        return pack_history(
+            conversation_history[:self.settings.history_max_turns],
+            self.history_token_budget()
+        )
+    
+    def _cache_key(
+        self,
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, str]]],
+        use_cache: bool
+    ) -> Optional[str]:
+        """Response cache key for this request, or None when caching doesn't apply"""
+        if self.response_cache is None or not use_cache:
+            return None
+        return self.response_cache.make_key(
+            system_prompt,
+            user_message,
+            self._history_window(conversation_history)
+        )
+    
+    def _build_messages(
+        self,
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """Assemble the chat message list sent to the provider"""
         messages = [{"role": "system", "content": system_prompt}]
         
-        # Add conversation history (last 5 exchanges)
+        # Add the most recent exchanges that fit the token budget, oldest first
         if conversation_history:
-            for entry in reversed(conversation_history[-5:]):
+            self._observe_history(conversation_history)
+            for entry in reversed(self._history_window(conversation_history)):
                 messages.append({"role": "user", "content": entry.get("player_message", "")})
                 messages.append({"role": "assistant", "content": entry.get("npc_response", "")})
         
         # Add current message
         messages.append({"role": "user", "content": user_message})
-        
-        if self.client_type == "ollama":
-            return await self._generate_ollama(messages)
-        else:
-            return await self._generate_openai(messages)
+        return messages
     
     def _generate_demo(self, system_prompt: str, user_message: str) -> str:
         """Generate demo response based on personality"""
-        responses = {
-            "friendly": f"Hello there, friend! I heard you say: '{user_message[:30]}...' I'd be happy to help you with that! This is a demo response - connect a real LLM for full conversations.",
-            "aggressive": f"What do you want? You said something about '{user_message[:30]}...' Make it quick! (Demo mode active)",
-            "mysterious": f"Interesting... your words echo with meaning: '{user_message[:30]}...' Perhaps the answer lies beyond what you seek... (Demo response)",
-            "merchant": f"Ah, a customer! You mentioned '{user_message[:30]}...' I have just what you need! The finest goods at reasonable prices. (Demo mode)",
-            "wise": f"Young one, you speak of '{user_message[:30]}...' Let me share some wisdom with you about this matter... (Demo response)",
-            "comedic": f"Ha! You said '{user_message[:30]}...' That reminds me of a joke! Why did the NPC cross the road? To get to the other script! (Demo mode)"
-        }
-        
         # Extract personality from system prompt
-        for personality, response in responses.items():
+        for personality, (reply, demo_note) in PERSONA_REPLIES.items():
             if personality.upper() in system_prompt:
-                return response
+                return f"{reply.format(message=user_message[:30])} {demo_note}"
         
         return f"Greetings! You said: '{user_message[:50]}...' (Demo mode - configure OpenAI or Ollama for real responses)"
     
-    async def _generate_openai(self, messages: List[Dict[str, str]]) -> str:
-        """Generate response using OpenAI"""
+    @staticmethod
+    def persona_reply(personality: PersonalityType, user_message: str, first_meeting: bool = False) -> str:
+        """Cheap in-character reply for when the LLM can't answer in time:
+        the personality's example greeting on a first meeting, otherwise its
+        templated reply to the player's words"""
+        personality = PersonalityType(personality)
+        if first_meeting:
+            return PersonalityEngine.PERSONALITY_PROMPTS[personality]["example"]
+        reply, _ = PERSONA_REPLIES[personality.value]
+        return reply.format(message=user_message[:30])
+    
+    def _start_by(self, kind: str, streamed: bool, deadline: Optional[float]) -> Optional[float]:
+        """Latest time a call can get its slot and still be useful by `deadline`"""
+        if deadline is None:
+            return None
+        return deadline - self.call_latency.get((kind, streamed), 0.0)
+    
+    def _observe_call(self, kind: str, streamed: bool, seconds: float) -> None:
+        previous = self.call_latency.get((kind, streamed))
+        if previous is None:
+            self.call_latency[(kind, streamed)] = seconds
+        else:
+            self.call_latency[(kind, streamed)] = previous + CALL_LATENCY_ALPHA * (seconds - previous)
+    
+    async def _before(self, awaitable: Awaitable, deadline: Optional[float]) -> Any:
+        """Await `awaitable`, giving up with AdmissionRejected at `deadline`"""
+        if deadline is None:
+            return await awaitable
+        remaining = max(0.0, deadline - asyncio.get_running_loop().time())
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=200,
-                temperature=0.8
-            )
-            return response.choices[0].message.content.strip()
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            raise self.admission.rejection("deadline")
+    
+    async def _complete(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        output_format: OutputFormat = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """Run a single completion through the router once the admission queue
+        grants a slot; raises AdmissionRejected if it can't finish by `deadline`"""
+        async with self.admission.slot(CALL_PRIORITIES[kind], self._start_by(kind, False, deadline)):
+            # Timed from the slot on: queueing is the admission_wait stage
+            start = time.perf_counter()
+            try:
+                response = await self._before(
+                    self.router.complete(kind, messages, max_tokens, temperature, output_format), deadline
+                )
+            finally:
+                if kind in CHAT_CALL_KINDS:
+                    metrics.observe_stage("llm_total", time.perf_counter() - start)
+            self._observe_call(kind, False, time.perf_counter() - start)
+            return response
+    
+    async def _generate(self, messages: List[Dict[str, str]], deadline: Optional[float] = None) -> str:
+        """Generate a chat reply; provider errors become the fallback response"""
+        try:
+            return await self._complete("chat", messages, max_tokens=200, temperature=0.8, deadline=deadline)
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            print(f"OpenAI Error: {e}")
-            return "I seem to be at a loss for words right now..."
+            print(f"LLM Error: {e}")
+            return FALLBACK_RESPONSE
     
-    async def _generate_ollama(self, messages: List[Dict[str, str]]) -> str:
-        """Generate response using Ollama"""
+    async def _stream(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 200,
+        temperature: float = 0.8,
+        output_format: OutputFormat = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Stream response tokens through the router once the admission queue
+        grants a slot; raises AdmissionRejected if the first token isn't there
+        by `deadline`"""
+        async with self.admission.slot(CALL_PRIORITIES[kind], self._start_by(kind, True, deadline)):
+            chunks = self.router.stream(kind, messages, max_tokens, temperature, output_format)
+            # Timed from the slot on: queueing is the admission_wait stage
+            start = time.perf_counter()
+            try:
+                try:
+                    first = await self._before(chunks.__anext__(), deadline)
+                except StopAsyncIteration:
+                    return
+                self._observe_call(kind, True, time.perf_counter() - start)
+                if kind in CHAT_CALL_KINDS:
+                    metrics.observe_stage("llm_first_token", time.perf_counter() - start)
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                if kind in CHAT_CALL_KINDS:
+                    metrics.observe_stage("llm_total", time.perf_counter() - start)
+                await chunks.aclose()
+    
+    async def summarize_conversation(
+        self,
+        previous_summary: Optional[str],
+        entries: List[MemoryEntry]
+    ) -> str:
+        """Fold older conversation turns (oldest first) into a rolling summary"""
+        max_chars = self.settings.summary_max_chars
+        if self.demo_mode:
+            return self._extractive_summary(previous_summary, entries, max_chars)
+        
+        transcript = "\n".join(
+            f"Player: {entry.player_message}\nNPC: {entry.npc_response}"
+            for entry in entries
+        )
+        messages = [
+            {
+                "role": "system",
+                "content": "You maintain an NPC's long-term memory of one player. Merge the previous "
+                           "summary and the new conversation into a single summary of at most "
+                           f"{max_chars // 6} words. Keep names, promises, quests, favors, insults and "
+                           "anything else that should shape future conversations. Refer to the "
+                           "player as 'the player' and to the NPC as 'you'. Respond with the summary only."
+            },
+            {
+                "role": "user",
+                "content": f"Previous summary:\n{previous_summary or '(none)'}\n\nConversation:\n{transcript}"
+            }
+        ]
+        
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "stream": False
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["message"]["content"].strip()
+            summary = await self._complete("summary", messages, max_tokens=max_chars // 3, temperature=0.3)
         except Exception as e:
-            print(f"Ollama Error: {e}")
-            return "I seem to be at a loss for words right now..."
+            print(f"Summary generation error: {e}")
+            summary = FALLBACK_RESPONSE
+        
+        if not summary or summary == FALLBACK_RESPONSE:
+            return self._extractive_summary(previous_summary, entries, max_chars)
+        return summary[:max_chars]
+    
+    def _extractive_summary(
+        self,
+        previous_summary: Optional[str],
+        entries: List[MemoryEntry],
+        max_chars: int
+    ) -> str:
+        """LLM-free summary: clipped exchanges appended to the previous summary,
+        keeping the most recent text when over the limit"""
+        lines = [previous_summary] if previous_summary else []
+        lines += [
+            f"The player said \"{entry.player_message[:80]}\" and you replied \"{entry.npc_response[:80]}\""
+            for entry in entries
+        ]
+        summary = "\n".join(lines)
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+            summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+        return summary
     
     async def generate_quest(
         self,
         npc_name: str,
         npc_background: str,
         personality: PersonalityType,
-        player_context: Optional[str] = None
+        player_context: Optional[str] = None,
+        deadline: Optional[float] = None
     ) -> Dict:
-        """Generate a quest for the player"""
+        """Generate a quest for the player; fields the LLM couldn't provide
+        (before `deadline`, if given) fall back to a generic quest"""
+        quest = fallback_quest(npc_name)
+        generated = set()
+        try:
+            async for kind, name, value in self.stream_quest(
+                npc_name, npc_background, personality, player_context, stream=False, deadline=deadline
+            ):
+                if kind == "field":
+                    quest[name] = value
+                    generated.add(name)
+        except Exception as e:
+            print(f"Quest generation error: {e}")
+        missing = [name for name in QUEST_FIELDS if name not in generated]
+        if missing:
+            print(f"Quest generation used fallback values for: {', '.join(missing)}")
+        return quest
+    
+    async def request_quest(
+        self,
+        npc_name: str,
+        npc_background: str,
+        personality: PersonalityType,
+        player_context: Optional[str] = None,
+        call_kind: str = "quest"
+    ) -> Dict:
+        """Ask the LLM for a quest; raises instead of falling back when it fails.
+        `call_kind` "quest_pool" queues the call behind player requests."""
+        quest = {}
+        async for kind, name, value in self.stream_quest(
+            npc_name, npc_background, personality, player_context, stream=False, call_kind=call_kind
+        ):
+            if kind == "field":
+                quest[name] = value
+        missing = [name for name in QUEST_FIELDS if name not in quest]
+        if missing:
+            raise ValueError(f"Quest is missing valid fields: {', '.join(missing)}")
+        return quest
+    
+    async def stream_quest(
+        self,
+        npc_name: str,
+        npc_background: str,
+        personality: PersonalityType,
+        player_context: Optional[str] = None,
+        stream: bool = True,
+        deadline: Optional[float] = None,
+        call_kind: str = "quest"
+    ) -> AsyncIterator[Tuple[str, str, Any]]:
+        """Generate a quest with provider-level structured output
+        
+        Yields ("field", name, value) as soon as each quest field is complete
+        and valid, and ("item", "objectives", text) for every objective as it
+        arrives. Fields that are missing or invalid at the end are requested
+        again, on their own, up to `quest_max_repairs` times. Raises
+        AdmissionRejected when the LLM can't be reached before `deadline`.
+        `call_kind` picks the admission priority (see CALL_PRIORITIES).
+        """
+        if self.demo_mode:
+            quest = self._generate_demo_quest(npc_name, personality, player_context)
+            for name in QUEST_FIELDS:
+                if name == "objectives":
+                    for objective in quest[name]:
+                        yield "item", name, objective
+                yield "field", name, quest[name]
+            return
         
+        messages = self._quest_messages(npc_name, npc_background, personality, player_context)
+        fields: Dict[str, Any] = {}
+        missing = list(QUEST_FIELDS)
+        # Repairs often repeat objectives that were already streamed
+        sent_items = set()
+        for attempt in range(self.settings.quest_max_repairs + 1):
+            request = messages if attempt == 0 else self._quest_repair_messages(messages, fields, missing)
+            parser = IncrementalJSONParser()
+            async for chunk in self._quest_chunks(request, missing, stream, deadline, call_kind):
+                for kind, name, value in parser.feed(chunk):
+                    if name not in missing:
+                        continue
+                    if kind == "item":
+                        if isinstance(value, str) and value.strip() and value.strip() not in sent_items:
+                            sent_items.add(value.strip())
+                            yield "item", name, value.strip()
+                        continue
+                    value = validate_quest_field(name, value)
+                    if value is not None:
+                        fields[name] = value
+                        yield "field", name, value
+            
+            missing = [name for name in QUEST_FIELDS if name not in fields]
+            if not missing:
+                return
+            print(f"Quest generation attempt {attempt + 1} left fields invalid: {', '.join(missing)}")
+    
+    def _quest_messages(
+        self,
+        npc_name: str,
+        npc_background: str,
+        personality: PersonalityType,
+        player_context: Optional[str]
+    ) -> List[Dict[str, str]]:
         prompt = f"""You are {npc_name}, an NPC with the following background: {npc_background}
 
-Your personality is: {personality.value}
+Your personality is: {PersonalityType(personality).value}
 
 Generate a quest that fits your character. The quest should be engaging and appropriate for an RPG game.
 {f"Context: {player_context}" if player_context else ""}
 
-Respond in JSON format:
-{{
-    "title": "Quest Title",
-    "description": "Quest description",
-    "difficulty": "easy/medium/hard",
-    "reward": "Description of reward",
-    "objectives": ["Objective 1", "Objective 2"]
-}}
-
-Only respond with valid JSON."""
+Respond with a JSON object with these fields:
+- "title": quest title
+- "description": quest description
+- "difficulty": "easy", "medium" or "hard"
+- "reward": description of the reward
+- "objectives": list of 1-6 short objectives"""
         
-        messages = [
+        return [
             {"role": "system", "content": "You are a quest generator for an RPG game. Always respond with valid JSON."},
             {"role": "user", "content": prompt}
         ]
-        
-        try:
-            if self.client_type == "ollama":
-                response_text = await self._generate_ollama(messages)
-            else:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                response_text = response.choices[0].message.content.strip()
-            
-            # Extract JSON if wrapped in markdown
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            return json.loads(response_text)
-        except Exception as e:
-            print(f"Quest generation error: {e}")
-            return {
-                "title": "A Simple Task",
-                "description": f"{npc_name} needs your help with something.",
-                "difficulty": "medium",
-                "reward": "Gold and experience",
-                "objectives": ["Talk to the quest giver", "Complete the task"]
+    
+    @staticmethod
+    def _quest_repair_messages(
+        messages: List[Dict[str, str]],
+        fields: Dict[str, Any],
+        missing: Sequence[str]
+    ) -> List[Dict[str, str]]:
+        """Ask again for just the fields that were missing or invalid"""
+        return messages + [
+            {"role": "assistant", "content": json.dumps(fields)},
+            {
+                "role": "user",
+                "content": "Some fields were missing or invalid. Respond with a JSON object containing "
+                           f"only these fields: {', '.join(missing)}. Difficulty must be easy, medium "
+                           "or hard and objectives a list of 1-6 short strings."
             }
+        ]
+    
+    def _quest_output_format(self, fields: Sequence[str], provider: str) -> Any:
+        """Structured output setting for a provider (None disables it)"""
+        mode = self.settings.quest_response_format
+        if mode == "json_schema":
+            schema = quest_json_schema(fields)
+            if provider == "ollama":
+                return schema
+            return {"type": "json_schema", "json_schema": {"name": "quest", "strict": True, "schema": schema}}
+        if mode == "json_object":
+            return "json" if provider == "ollama" else {"type": "json_object"}
+        return None
+    
+    async def _quest_chunks(
+        self,
+        messages: List[Dict[str, str]],
+        fields: Sequence[str],
+        stream: bool,
+        deadline: Optional[float] = None,
+        call_kind: str = "quest"
+    ) -> AsyncIterator[str]:
+        """Raw quest JSON text from the provider, streamed or in one piece"""
+        # Backends may mix providers, so the format is built per backend
+        def output_format(provider: str) -> Any:
+            return self._quest_output_format(fields, provider)
+        
+        if stream:
+            async for chunk in self._stream(
+                call_kind, messages, max_tokens=300, temperature=0.7, output_format=output_format,
+                deadline=deadline
+            ):
+                yield chunk
+        else:
+            # Not coalesced: players asking the same NPC at once should get different quests
+            yield await self._complete(
+                call_kind, messages, max_tokens=300, temperature=0.7, output_format=output_format,
+                deadline=deadline
+            )
+    
+    def _generate_demo_quest(
+        self,
+        npc_name: str,
+        personality: PersonalityType,
+        player_context: Optional[str]
+    ) -> Dict:
+        """Generate a demo quest based on personality"""
+        quests = {
+            "friendly": ("A Helping Hand", "easy", "A warm meal and 50 gold",
+                         "has lost a family keepsake somewhere near the village well.",
+                         ["Search around the village well", "Ask the villagers what they saw", "Return the keepsake"]),
+            "aggressive": ("Clear the Road", "hard", "200 gold and a steel blade",
+                           "wants the bandits camped on the north road gone. Permanently.",
+                           ["Find the bandit camp", "Defeat the bandit leader", "Bring back proof"]),
+            "mysterious": ("The Whispering Stone", "medium", "A secret, and a strange amulet",
+                           "asks you to find a stone that hums beneath the full moon.",
+                           ["Visit the old shrine at night", "Follow the whispers", "Bring the stone back unseen"]),
+            "merchant": ("A Profitable Delivery", "easy", "100 gold and a discount",
+                         "needs a crate of goods delivered to the next town before a rival gets there.",
+                         ["Collect the crate", "Deliver it to the next town", "Collect payment"]),
+            "wise": ("The Forgotten Library", "medium", "Ancient knowledge and a rare tome",
+                     "seeks a book lost in the ruins of the old library.",
+                     ["Travel to the ruins", "Solve the librarian's riddle", "Return with the tome"]),
+            "comedic": ("The Great Chicken Chase", "easy", "25 gold and a terrible joke",
+                        "has lost all of their chickens. Again.",
+                        ["Catch five runaway chickens", "Avoid the angry rooster", "Return them to the coop"])
+        }
+        title, difficulty, reward, description, objectives = quests[PersonalityType(personality).value]
+        if player_context:
+            description += f" ({player_context})"
+        return {
+            "title": title,
+            "description": f"{npc_name} {description}",
+            "difficulty": difficulty,
+            "reward": reward,
+            "objectives": objectives
+        }
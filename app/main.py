@@ -1,6 +1,11 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import math
 import uuid
 from contextlib import asynccontextmanager
 
@@ -8,9 +13,18 @@ from app.models import (
     NPCCreate, NPCResponse, Message, ChatResponse, 
     Quest, QuestRequest, MemoryEntry
 )
-from app.memory import MemoryManager
+from app.memory import MemoryManager, clamp_reputation
 from app.personality import PersonalityEngine
 from app.llm_service import LLMService
+from app.response_cache import create_response_cache
+from app.vector_memory import LongTermMemory
+from app.write_behind import WriteBehindQueue
+from app.quest_pool import QuestPool
+from app.cascade_delete import CascadeDeleter
+from app.admission import AdmissionRejected, RateLimiter, deadline_after
+from app.quest_schema import QUEST_FIELDS, fallback_quest
+from app.config import get_settings
+from app import metrics
 
 
 # Lifespan context manager for startup/shutdown
@@ -18,9 +32,27 @@ from app.llm_service import LLMService
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting AI NPC System...")
+    await memory_manager.start()
+    await cascade_deleter.start()
+    await llm_service.start()
+    if write_behind is not None:
+        await write_behind.start()
+    if quest_pool is not None:
+        await quest_pool.start()
     yield
     # Shutdown
     print("👋 Shutting down AI NPC System...")
+    # Persist queued chat turns before anything else goes away
+    if write_behind is not None:
+        await write_behind.close()
+    if quest_pool is not None:
+        await quest_pool.close()
+    await cascade_deleter.close()
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await llm_service.close()
+    await memory_manager.close()
 
 
 app = FastAPI(
@@ -40,8 +72,104 @@ app.add_middleware(
 )
 
 # Initialize services
+settings = get_settings()
+metrics.configure(settings)
 memory_manager = MemoryManager()
-llm_service = LLMService()
+llm_service = LLMService(
+    response_cache=create_response_cache(settings, memory_manager.redis_client)
+)
+
+long_term_memory = None
+if settings.ltm_enabled:
+    long_term_memory = LongTermMemory(
+        memory_manager.storage,
+        dim=settings.ltm_dim,
+        max_entries=settings.ltm_max_entries,
+        ttl=settings.ltm_ttl,
+        max_cached_entries=settings.ltm_max_cached_entries,
+        top_k=settings.ltm_top_k,
+        min_score=settings.ltm_min_score,
+        compress_threshold=settings.conversation_compress_threshold
+    )
+
+# Fire-and-forget work (e.g. memory compaction), kept referenced until done
+background_tasks: Set[asyncio.Task] = set()
+
+
+def _run_in_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def _after_chat_turn_committed(
+    player_id: str,
+    npc_id: str,
+    player_message: str,
+    npc_response: str,
+    committed: Tuple[int, int]
+) -> None:
+    """Follow-up work once a chat turn is stored: long-term memory and compaction"""
+    if long_term_memory is not None:
+        await long_term_memory.add(
+            player_id,
+            npc_id,
+            player_message,
+            npc_response
+        )
+    
+    # Fold older turns into the rolling summary once the list grows long
+    if settings.summary_enabled and committed[1] >= settings.summary_threshold:
+        _run_in_background(memory_manager.compact_conversation(
+            player_id,
+            npc_id,
+            keep_recent=settings.summary_keep_recent,
+            summarize=llm_service.summarize_conversation
+        ))
+
+
+# Pre-generated quests per NPC, refilled in the background (opt-in)
+quest_pool = None
+if settings.quest_pool_enabled:
+    quest_pool = QuestPool(
+        memory_manager,
+        llm_service,
+        size=settings.quest_pool_size,
+        low_watermark=settings.quest_pool_low_watermark,
+        workers=settings.quest_pool_workers,
+        ttl=settings.quest_pool_ttl
+    )
+
+# Removes player data left behind by NPC and player deletes
+cascade_deleter = CascadeDeleter(
+    memory_manager.storage,
+    batch_size=settings.cascade_delete_batch_size,
+    pause=settings.cascade_delete_pause
+)
+
+# Chat turns persisted off the request path (opt-in)
+write_behind = None
+if settings.write_behind_enabled:
+    write_behind = WriteBehindQueue(
+        memory_manager,
+        max_batch=settings.write_behind_max_batch,
+        flush_interval=settings.write_behind_flush_interval,
+        max_pending=settings.write_behind_max_pending,
+        max_retries=settings.write_behind_max_retries,
+        on_commit=_after_chat_turn_committed
+    )
+
+# Per-player and per-NPC token buckets in the shared store (opt-in); the
+# LLM admission queue itself lives in llm_service
+rate_limiter = None
+if settings.admission_enabled:
+    rate_limiter = RateLimiter(
+        memory_manager.storage,
+        player_rate=settings.admission_player_rate,
+        player_burst=settings.admission_player_burst,
+        npc_rate=settings.admission_npc_rate,
+        npc_burst=settings.admission_npc_burst
+    )
 
 
 @app.get("/", tags=["Root"])
@@ -54,17 +182,78 @@ async def root():
     }
 
 
+@app.get("/stats/cache", tags=["Root"])
+async def cache_stats():
+    """In-process cache hit/miss counters for this worker"""
+    npc_cache = memory_manager.npc_cache
+    response_cache = llm_service.response_cache
+    single_flight = llm_service.single_flight
+    llm_router = llm_service.router
+    return {
+        "npc": npc_cache.stats() if npc_cache is not None else {"enabled": False},
+        "llm_response": response_cache.stats() if response_cache is not None else {"enabled": False},
+        "llm_single_flight": single_flight.stats() if single_flight is not None else {"enabled": False},
+        "write_behind": write_behind.stats() if write_behind is not None else {"enabled": False},
+        "quest_pool": quest_pool.stats() if quest_pool is not None else {"enabled": False},
+        "storage": memory_manager.storage.stats(),
+        "cascade_delete": cascade_deleter.stats(),
+        "llm_router": llm_router.stats() if llm_router is not None else {"enabled": False},
+        "long_term_memory": long_term_memory.stats() if long_term_memory is not None else {"enabled": False},
+        "admission": {
+            "enabled": settings.admission_enabled,
+            "queue": llm_service.admission.stats(),
+            "rate_limits": rate_limiter.stats() if rate_limiter is not None else {"enabled": False}
+        }
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Root"])
+async def prometheus_metrics():
+    """Stage latency histograms and cache/provider counters for this worker, in Prometheus text format"""
+    if not settings.metrics_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics are disabled"
+        )
+    return PlainTextResponse(
+        metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.post("/npc", response_model=NPCResponse, status_code=status.HTTP_201_CREATED, tags=["NPC Management"])
 async def create_npc(npc: NPCCreate):
     """Create a new NPC with personality and background"""
     
     # Check if NPC already exists
-    existing = memory_manager.get_npc(npc.npc_id)
+    existing = await memory_manager.get_npc(npc.npc_id)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"NPC with id '{npc.npc_id}' already exists"
         )
+    if await memory_manager.is_npc_being_deleted(npc.npc_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"NPC with id '{npc.npc_id}' is still being deleted; try again shortly"
+        )
+    
+    # Render the system prompt for every reputation band up front
+    try:
+        if npc.prompt_template:
+            PersonalityEngine.validate_template(npc.prompt_template)
+        system_prompts = PersonalityEngine.compile_system_prompts(
+            personality=npc.personality,
+            npc_name=npc.name,
+            background=npc.background,
+            location=npc.location,
+            template=npc.prompt_template
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     # Create NPC response
     npc_response = NPCResponse(
@@ -73,24 +262,30 @@ async def create_npc(npc: NPCCreate):
         personality=npc.personality,
         background=npc.background,
         location=npc.location,
+        response_cache=npc.response_cache,
+        prompt_template=npc.prompt_template,
         conversation_count=0
     )
     
     # Store in memory
-    success = memory_manager.store_npc(npc_response)
+    success = await memory_manager.store_npc(npc_response, system_prompts)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to store NPC"
         )
     
+    # Stock the quest pool before the first player asks
+    if quest_pool is not None:
+        quest_pool.request_refill(npc.npc_id)
+    
     return npc_response
 
 
 @app.get("/npc/{npc_id}", response_model=NPCResponse, tags=["NPC Management"])
 async def get_npc(npc_id: str):
     """Get NPC details"""
-    npc = memory_manager.get_npc(npc_id)
+    npc = await memory_manager.get_npc(npc_id)
     if not npc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,7 +293,7 @@ async def get_npc(npc_id: str):
         )
     
     # Get conversation count
-    conv_count = memory_manager.get_conversation_count(npc_id)
+    conv_count = await memory_manager.get_conversation_count(npc_id)
     npc["conversation_count"] = conv_count
     
     return npc
@@ -107,56 +302,78 @@ async def get_npc(npc_id: str):
 @app.delete("/npc/{npc_id}", tags=["NPC Management"])
 async def delete_npc(npc_id: str):
     """Delete an NPC"""
-    npc = memory_manager.get_npc(npc_id)
+    npc = await memory_manager.get_npc(npc_id)
     if not npc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"NPC with id '{npc_id}' not found"
         )
     
-    success = memory_manager.delete_npc(npc_id)
+    success = await memory_manager.delete_npc(npc_id)
+    if long_term_memory is not None:
+        long_term_memory.forget(npc_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete NPC"
         )
+    # Player conversations and reputations are removed in the background
+    cascade_deleter.notify()
     
     return {"message": f"NPC '{npc_id}' deleted successfully"}
 
 
-@app.post("/chat", response_model=ChatResponse, tags=["Interaction"])
-async def chat_with_npc(message: Message):
-    """Chat with an NPC - the main interaction endpoint"""
+@app.delete("/player/{player_id}", tags=["Interaction"])
+async def delete_player(player_id: str):
+    """Delete a player's conversations, summaries, reputations and long-term memory with every NPC"""
+    success = await memory_manager.delete_player(player_id)
+    if long_term_memory is not None:
+        long_term_memory.forget_player(player_id)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete player data"
+        )
+    cascade_deleter.notify()
     
-    # Get NPC data
-    npc = memory_manager.get_npc(message.npc_id)
+    return {"message": f"Data for player '{player_id}' deleted successfully"}
+
+
+async def _load_chat_context(message: Message) -> Tuple[Dict, int, str, List[Dict[str, str]]]:
+    """Fetch NPC, history and reputation and build the system prompt for a chat turn"""
+    
+    with metrics.stage("context_load"):
+        # Read-your-writes: make sure this pair's previous turn has been persisted
+        if write_behind is not None:
+            await write_behind.wait_for(message.player_id, message.npc_id)
+        
+        # Get NPC data, conversation history and player reputation in one round trip
+        npc, history, reputation, summary = await memory_manager.load_chat_context(
+            message.player_id,
+            message.npc_id,
+            history_limit=llm_service.history_fetch_limit()
+        )
     if not npc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"NPC with id '{message.npc_id}' not found"
         )
     
-    # Get conversation history
-    history = memory_manager.get_conversation_history(
-        message.player_id, 
-        message.npc_id,
-        limit=10
-    )
+    # Look up the precompiled system prompt for this reputation band
+    with metrics.stage("prompt_build"):
+        system_prompt = PersonalityEngine.select_system_prompt(npc, reputation)
+        system_prompt = PersonalityEngine.add_memory_summary(system_prompt, summary)
     
-    # Get player reputation
-    reputation = memory_manager.get_player_reputation(
-        message.player_id,
-        message.npc_id
-    )
-    
-    # Generate system prompt
-    system_prompt = PersonalityEngine.get_system_prompt(
-        personality=npc["personality"],
-        npc_name=npc["name"],
-        background=npc["background"],
-        location=npc["location"],
-        reputation=reputation
-    )
+    # Add older exchanges relevant to this message from long-term memory
+    if long_term_memory is not None:
+        with metrics.stage("ltm_search"):
+            relevant = await long_term_memory.search(
+                message.player_id,
+                message.npc_id,
+                message.message,
+                exclude=history
+            )
+        system_prompt = PersonalityEngine.add_relevant_memories(system_prompt, relevant)
     
     # Convert history to dict format
     history_dict = [
@@ -167,36 +384,56 @@ async def chat_with_npc(message: Message):
         for entry in history
     ]
     
-    # Generate response using LLM
-    npc_response_text = await llm_service.generate_response(
-        system_prompt=system_prompt,
-        user_message=message.message,
-        conversation_history=history_dict
-    )
+    return npc, reputation, system_prompt, history_dict
+
+
+async def _record_chat_turn(
+    message: Message,
+    npc: Dict,
+    reputation: int,
+    npc_response_text: str
+) -> ChatResponse:
+    """Update reputation, store the exchange and build the chat response"""
     
     # Calculate reputation change
     rep_change = PersonalityEngine.calculate_reputation_change(
         personality=npc["personality"],
         player_message=message.message
     )
-    new_reputation = reputation + rep_change
-    memory_manager.store_player_reputation(
-        message.player_id,
-        message.npc_id,
-        new_reputation
-    )
+    new_reputation = clamp_reputation(reputation + rep_change)
+    context = {"reputation": str(new_reputation)}
     
-    # Store conversation
-    memory_manager.store_conversation(
-        player_id=message.player_id,
-        npc_id=message.npc_id,
-        player_message=message.message,
-        npc_response=npc_response_text,
-        context={"reputation": str(new_reputation)}
-    )
-    
-    # Increment conversation count
-    memory_manager.increment_conversation_count(message.npc_id)
+    # Time spent persisting the turn (only the enqueue in write-behind mode)
+    with metrics.stage("persist"):
+        if write_behind is not None:
+            # Queue the writes; the consumer also runs the follow-up work
+            await write_behind.submit(
+                player_id=message.player_id,
+                npc_id=message.npc_id,
+                player_message=message.message,
+                npc_response=npc_response_text,
+                reputation_change=rep_change,
+                context=context
+            )
+        else:
+            # Apply the reputation change atomically and store the conversation and
+            # conversation count in the same transaction
+            committed = await memory_manager.commit_chat_turn(
+                player_id=message.player_id,
+                npc_id=message.npc_id,
+                player_message=message.message,
+                npc_response=npc_response_text,
+                reputation_change=rep_change,
+                context=context
+            )
+            if committed is not None:
+                await _after_chat_turn_committed(
+                    message.player_id,
+                    message.npc_id,
+                    message.message,
+                    npc_response_text,
+                    committed
+                )
     
     return ChatResponse(
         npc_response=npc_response_text,
@@ -205,10 +442,184 @@ async def chat_with_npc(message: Message):
     )
 
 
+def _deadline(seconds: float) -> Optional[float]:
+    """Deadline for a request arriving now, when admission control is on"""
+    return deadline_after(seconds) if settings.admission_enabled else None
+
+
+async def _check_player_rate(player_id: str) -> None:
+    """Turn away a player sending faster than their token bucket allows"""
+    if rate_limiter is None:
+        return
+    retry_after = await rate_limiter.check_player(player_id)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Player '{player_id}' is sending requests too fast; retry in {retry_after:.1f}s",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+async def _npc_overloaded(npc_id: str) -> bool:
+    """Whether the NPC is over its token bucket and should answer without the LLM"""
+    return rate_limiter is not None and bool(await rate_limiter.check_npc(npc_id))
+
+
+def _degraded_reply(message: Message, npc: Dict, history_dict: List[Dict[str, str]], reason: str) -> ChatResponse:
+    """In-character fallback reply for an overloaded NPC; it is not stored
+    and doesn't change reputation"""
+    metrics.count_degraded_reply(reason)
+    return ChatResponse(
+        npc_response=llm_service.persona_reply(npc["personality"], message.message, first_meeting=not history_dict),
+        npc_emotion=npc["personality"],
+        quest_offered=False,
+        degraded=True
+    )
+
+
+async def _stream_chat_turn(
+    message: Message,
+    npc: Dict,
+    reputation: int,
+    system_prompt: str,
+    history_dict: List[Dict[str, str]],
+    deadline: Optional[float]
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Yield ("token", text) per reply chunk, then ("done", ChatResponse)
+    once the turn has been saved. An overloaded NPC or a missed deadline
+    yields the fallback reply as a single chunk instead; a reply cut off by
+    a provider error ends with ("error", detail) and is not stored."""
+    reply = None
+    if await _npc_overloaded(message.npc_id):
+        reply = _degraded_reply(message, npc, history_dict, "npc_rate_limit")
+    else:
+        chunks = []
+        try:
+            async for chunk in llm_service.stream_response(
+                system_prompt=system_prompt,
+                user_message=message.message,
+                conversation_history=history_dict,
+                use_cache=npc.get("response_cache", True),
+                deadline=deadline
+            ):
+                chunks.append(chunk)
+                yield "token", chunk
+        except AdmissionRejected as e:
+            reply = _degraded_reply(message, npc, history_dict, e.reason)
+        except Exception:
+            yield "error", "The reply was interrupted; please try again"
+            return
+    
+    if reply is not None:
+        yield "token", reply.npc_response
+    else:
+        reply = await _record_chat_turn(message, npc, reputation, "".join(chunks).strip())
+    yield "done", reply
+
+
+@app.post("/chat", response_model=ChatResponse, tags=["Interaction"])
+async def chat_with_npc(message: Message):
+    """Chat with an NPC - the main interaction endpoint"""
+    
+    deadline = _deadline(settings.admission_chat_deadline)
+    await _check_player_rate(message.player_id)
+    npc, reputation, system_prompt, history_dict = await _load_chat_context(message)
+    if await _npc_overloaded(message.npc_id):
+        return _degraded_reply(message, npc, history_dict, "npc_rate_limit")
+    
+    # Generate response using LLM
+    try:
+        npc_response_text = await llm_service.generate_response(
+            system_prompt=system_prompt,
+            user_message=message.message,
+            conversation_history=history_dict,
+            use_cache=npc.get("response_cache", True),
+            deadline=deadline
+        )
+    except AdmissionRejected as e:
+        return _degraded_reply(message, npc, history_dict, e.reason)
+    
+    return await _record_chat_turn(message, npc, reputation, npc_response_text)
+
+
+@app.post("/chat/stream", tags=["Interaction"])
+async def stream_chat_with_npc(message: Message):
+    """Chat with an NPC, streaming the reply as Server-Sent Events
+    
+    Emits one `token` event per text chunk, then a `done` event carrying
+    the full ChatResponse once the turn has been saved, or an `error` event
+    if the reply was cut off.
+    """
+    
+    deadline = _deadline(settings.admission_chat_deadline)
+    await _check_player_rate(message.player_id)
+    npc, reputation, system_prompt, history_dict = await _load_chat_context(message)
+    
+    async def event_stream():
+        async for kind, value in _stream_chat_turn(message, npc, reputation, system_prompt, history_dict, deadline):
+            if kind == "token":
+                yield f"event: token\ndata: {json.dumps({'token': value})}\n\n"
+            elif kind == "error":
+                yield f"event: error\ndata: {json.dumps({'detail': value})}\n\n"
+            else:
+                yield f"event: done\ndata: {value.model_dump_json()}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    """Chat with NPCs over a WebSocket, streaming each reply token by token
+    
+    The client sends one Message JSON object per turn and receives
+    `{"type": "token", "token": ...}` frames followed by a
+    `{"type": "done", ...ChatResponse}` frame, or a `{"type": "error"}`
+    frame if the message was invalid or the reply was cut off.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                # Not JSON, or JSON that isn't an object
+                message = Message(**await websocket.receive_json())
+            except (json.JSONDecodeError, TypeError):
+                await websocket.send_json({"type": "error", "detail": "Each message must be a JSON object"})
+                continue
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": json.loads(e.json())})
+                continue
+            
+            try:
+                deadline = _deadline(settings.admission_chat_deadline)
+                await _check_player_rate(message.player_id)
+                npc, reputation, system_prompt, history_dict = await _load_chat_context(message)
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+            
+            async for kind, value in _stream_chat_turn(
+                message, npc, reputation, system_prompt, history_dict, deadline
+            ):
+                if kind == "token":
+                    await websocket.send_json({"type": "token", "token": value})
+                elif kind == "error":
+                    await websocket.send_json({"type": "error", "detail": value})
+                else:
+                    await websocket.send_json({"type": "done", **value.model_dump()})
+    except WebSocketDisconnect:
+        pass
+
+
 @app.get("/history/{player_id}/{npc_id}", response_model=List[MemoryEntry], tags=["Interaction"])
 async def get_conversation_history(player_id: str, npc_id: str, limit: int = 20):
     """Get conversation history between player and NPC"""
-    history = memory_manager.get_conversation_history(player_id, npc_id, limit)
+    if write_behind is not None:
+        await write_behind.wait_for(player_id, npc_id)
+    history = await memory_manager.get_conversation_history(player_id, npc_id, limit)
     return history
 
 
@@ -216,21 +627,34 @@ async def get_conversation_history(player_id: str, npc_id: str, limit: int = 20)
 async def generate_quest(quest_request: QuestRequest):
     """Generate a quest from an NPC"""
     
+    deadline = _deadline(settings.admission_quest_deadline)
+    await _check_player_rate(quest_request.player_id)
+    
     # Get NPC data
-    npc = memory_manager.get_npc(quest_request.npc_id)
+    npc = await memory_manager.get_npc(quest_request.npc_id)
     if not npc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"NPC with id '{quest_request.npc_id}' not found"
         )
     
-    # Generate quest using LLM
-    quest_data = await llm_service.generate_quest(
-        npc_name=npc["name"],
-        npc_background=npc["background"],
-        personality=npc["personality"],
-        player_context=quest_request.context
-    )
+    # Serve a pre-generated quest; context-specific requests are always generated
+    if quest_pool is not None and not quest_request.context:
+        quest = await quest_pool.pop(quest_request.npc_id)
+        if quest is not None:
+            return quest
+    
+    # Generate quest using LLM; an overloaded NPC hands out the generic quest
+    if await _npc_overloaded(quest_request.npc_id):
+        quest_data = fallback_quest(npc["name"])
+    else:
+        quest_data = await llm_service.generate_quest(
+            npc_name=npc["name"],
+            npc_background=npc["background"],
+            personality=npc["personality"],
+            player_context=quest_request.context,
+            deadline=deadline
+        )
     
     # Create quest object
     quest = Quest(
@@ -245,10 +669,71 @@ async def generate_quest(quest_request: QuestRequest):
     return quest
 
 
+@app.post("/quest/stream", tags=["Quests"])
+async def stream_quest(quest_request: QuestRequest):
+    """Generate a quest from an NPC, streaming fields as Server-Sent Events
+    
+    Emits a `field` event as soon as each quest field is complete and
+    valid, an `objective` event per objective as it arrives, then a `done`
+    event carrying the full Quest.
+    """
+    
+    deadline = _deadline(settings.admission_quest_deadline)
+    await _check_player_rate(quest_request.player_id)
+    
+    npc = await memory_manager.get_npc(quest_request.npc_id)
+    if not npc:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"NPC with id '{quest_request.npc_id}' not found"
+        )
+    
+    pooled = None
+    if quest_pool is not None and not quest_request.context:
+        pooled = await quest_pool.pop(quest_request.npc_id)
+    overloaded = pooled is None and await _npc_overloaded(quest_request.npc_id)
+    
+    async def event_stream():
+        if pooled is not None:
+            for name in QUEST_FIELDS:
+                yield f"event: field\ndata: {json.dumps({'name': name, 'value': getattr(pooled, name)})}\n\n"
+            quest = pooled
+        elif overloaded:
+            # The generic quest, delivered with the done event
+            quest = Quest(quest_id=str(uuid.uuid4()), **fallback_quest(npc["name"]))
+        else:
+            fields = {}
+            try:
+                async for kind, name, value in llm_service.stream_quest(
+                    npc_name=npc["name"],
+                    npc_background=npc["background"],
+                    personality=npc["personality"],
+                    player_context=quest_request.context,
+                    deadline=deadline
+                ):
+                    if kind == "item":
+                        yield f"event: objective\ndata: {json.dumps({'value': value})}\n\n"
+                    else:
+                        fields[name] = value
+                        yield f"event: field\ndata: {json.dumps({'name': name, 'value': value})}\n\n"
+            except Exception as e:
+                print(f"Quest streaming error: {e}")
+            quest = Quest(quest_id=str(uuid.uuid4()), **{**fallback_quest(npc["name"]), **fields})
+        yield f"event: done\ndata: {quest.model_dump_json()}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/reputation/{player_id}/{npc_id}", tags=["Interaction"])
 async def get_reputation(player_id: str, npc_id: str):
     """Get player reputation with an NPC"""
-    reputation = memory_manager.get_player_reputation(player_id, npc_id)
+    if write_behind is not None:
+        await write_behind.wait_for(player_id, npc_id)
+    reputation = await memory_manager.get_player_reputation(player_id, npc_id)
     
     # Determine reputation level
     if reputation > 50:
@@ -272,9 +757,7 @@ async def get_reputation(player_id: str, npc_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    from app.config import get_settings
     
-    settings = get_settings()
     uvicorn.run(
         "app.main:app",
         host=settings.api_host,
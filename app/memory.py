@@ -1,44 +1,123 @@
-import redis
+import asyncio
 import json
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple, Callable, Awaitable
 from datetime import datetime
+from app import keys, metrics
+from app.cache import TTLCache
+from app.codec import decode_entries, encode_entry, encode_entry_json
 from app.config import get_settings
 from app.models import MemoryEntry, NPCResponse
+from app.storage import RedisStorage, StorageBackend, clamp_reputation, create_storage_backend
 
 
 class MemoryManager:
-    def __init__(self):
+    def __init__(self, storage: Optional[StorageBackend] = None):
         settings = get_settings()
-        self.redis_client = redis.Redis(
-            host=settings.redis_host,
-            port=settings.redis_port,
-            db=settings.redis_db,
-            decode_responses=True
-        )
+        # Redis (single node or cluster), in-process or SQLite, as selected by STORAGE_BACKEND
+        self.storage = storage if storage is not None else create_storage_backend(settings)
+        self.conversation_encoding = settings.conversation_encoding
+        self.compress_threshold = settings.conversation_compress_threshold
+        
+        # Parsed NPC definitions, kept coherent across workers by the storage backend
+        self.npc_cache: Optional[TTLCache] = None
+        if settings.npc_cache_enabled:
+            self.npc_cache = TTLCache(
+                max_size=settings.npc_cache_max_size,
+                ttl=settings.npc_cache_ttl
+            )
+        self._invalidation_task: Optional[asyncio.Task] = None
+    
+    @property
+    def redis_client(self):
+        """The shared Redis client (a cluster client with REDIS_CLUSTER) when storage is Redis, else None"""
+        if isinstance(self.storage, RedisStorage):
+            return self.storage.redis_client
+        return None
+    
+    async def start(self) -> None:
+        """Open storage and start background tasks (called from the app lifespan)"""
+        await self.storage.start()
+        if self.npc_cache is not None and self._invalidation_task is None:
+            self._invalidation_task = asyncio.create_task(self._listen_for_invalidations())
+    
+    async def close(self) -> None:
+        """Stop background tasks and close the storage backend"""
+        if self._invalidation_task is not None:
+            self._invalidation_task.cancel()
+            try:
+                await self._invalidation_task
+            except asyncio.CancelledError:
+                pass
+            self._invalidation_task = None
+        await self.storage.close()
+    
+    def _on_invalidation(self, npc_id: Optional[str]) -> None:
+        if npc_id is None:
+            self.npc_cache.clear()
+        else:
+            self.npc_cache.pop(npc_id)
+    
+    async def _listen_for_invalidations(self) -> None:
+        """Drop cached NPCs whenever any worker stores or deletes them"""
+        await self.storage.listen_npc_invalidations(self._on_invalidation)
+    
+    async def _invalidate_npc(self, npc_id: str) -> None:
+        """Drop an NPC from this worker's cache and tell the other workers to do the same"""
+        if self.npc_cache is None:
+            return
+        self.npc_cache.pop(npc_id)
+        try:
+            await self.storage.publish_npc_invalidation(npc_id)
+        except Exception as e:
+            print(f"Error publishing NPC invalidation: {e}")
+    
+    def _get_cached_npc(self, npc_id: str) -> Optional[Dict]:
+        """Return a copy of a cached NPC definition, or None on a miss"""
+        if self.npc_cache is None:
+            return None
+        npc = self.npc_cache.get(npc_id)
+        metrics.count_cache("npc", npc is not None)
+        return dict(npc) if npc is not None else None
     
-    def store_npc(self, npc_data: NPCResponse) -> bool:
-        """Store NPC data in Redis"""
-        key = f"npc:{npc_data.npc_id}"
+    def _cache_npc(self, npc_id: str, npc: Dict) -> None:
+        if self.npc_cache is not None:
+            self.npc_cache.set(npc_id, dict(npc))
+    
+    async def store_npc(
+        self,
+        npc_data: NPCResponse,
+        system_prompts: Optional[Dict[str, str]] = None
+    ) -> bool:
+        """Store NPC data, along with its precompiled system prompts"""
+        record = npc_data.model_dump(mode="json")
+        if system_prompts:
+            record["system_prompts"] = system_prompts
         try:
-            self.redis_client.set(key, npc_data.model_dump_json())
+            await self.storage.set_npc(npc_data.npc_id, json.dumps(record))
+            await self._invalidate_npc(npc_data.npc_id)
             return True
         except Exception as e:
             print(f"Error storing NPC: {e}")
             return False
     
-    def get_npc(self, npc_id: str) -> Optional[Dict]:
-        """Retrieve NPC data from Redis"""
-        key = f"npc:{npc_id}"
+    async def get_npc(self, npc_id: str) -> Optional[Dict]:
+        """Retrieve NPC data, from the in-process cache when possible"""
+        npc = self._get_cached_npc(npc_id)
+        if npc is not None:
+            return npc
+        
         try:
-            data = self.redis_client.get(key)
+            data = await self.storage.get_npc(npc_id)
             if data:
-                return json.loads(data)
+                npc = json.loads(data)
+                self._cache_npc(npc_id, npc)
+                return npc
             return None
         except Exception as e:
             print(f"Error retrieving NPC: {e}")
             return None
     
-    def store_conversation(
+    async def store_conversation(
         self, 
         player_id: str, 
         npc_id: str, 
@@ -46,9 +125,7 @@ class MemoryManager:
         npc_response: str,
         context: Dict[str, str] = None
     ) -> bool:
-        """Store conversation in Redis"""
-        key = f"conversation:{player_id}:{npc_id}"
-        
+        """Store a conversation exchange"""
         memory_entry = MemoryEntry(
             timestamp=datetime.now().isoformat(),
             player_message=player_message,
@@ -57,73 +134,212 @@ class MemoryManager:
         )
         
         try:
-            # Store as list, keep last 50 messages
-            self.redis_client.lpush(key, memory_entry.model_dump_json())
-            self.redis_client.ltrim(key, 0, 49)
-            
-            # Set expiry for 7 days
-            self.redis_client.expire(key, 604800)
+            await self.storage.append_conversation(player_id, npc_id, self._encode_entry(memory_entry))
             return True
         except Exception as e:
             print(f"Error storing conversation: {e}")
             return False
     
-    def get_conversation_history(
+    def _encode_entry(self, memory_entry: MemoryEntry) -> bytes:
+        """Encode a memory entry in the configured storage format"""
+        if self.conversation_encoding == "json":
+            return encode_entry_json(memory_entry)
+        return encode_entry(memory_entry, self.compress_threshold)
+    
+    async def load_chat_context(
+        self,
+        player_id: str,
+        npc_id: str,
+        history_limit: int = 10
+    ) -> Tuple[Optional[Dict], List[MemoryEntry], int, Optional[str]]:
+        """Fetch NPC, conversation history, reputation and the rolling summary
+        of older turns in one round trip"""
+        npc = self._get_cached_npc(npc_id)
+        try:
+            messages, reputation, summary, npc_data = await self.storage.load_chat_context(
+                player_id, npc_id, history_limit, include_npc=npc is None
+            )
+        except Exception as e:
+            print(f"Error loading chat context: {e}")
+            return None, [], 0, None
+        
+        if npc is None and npc_data:
+            npc = json.loads(npc_data)
+            self._cache_npc(npc_id, npc)
+        history = decode_entries(messages)
+        return npc, history, reputation, summary
+    
+    async def commit_chat_turn(
+        self,
+        player_id: str,
+        npc_id: str,
+        player_message: str,
+        npc_response: str,
+        reputation_change: int,
+        context: Dict[str, str] = None
+    ) -> Optional[Tuple[int, int]]:
+        """Apply the reputation change, store the exchange and bump the conversation
+        count in one atomic step. Returns the new reputation and the length of the
+        conversation list, or None on failure."""
+        memory_entry = MemoryEntry(
+            timestamp=datetime.now().isoformat(),
+            player_message=player_message,
+            npc_response=npc_response,
+            context=context or {}
+        )
+        
+        try:
+            return (await self.commit_chat_turns([
+                (player_id, npc_id, memory_entry, reputation_change)
+            ]))[0]
+        except Exception as e:
+            print(f"Error committing chat turn: {e}")
+            return None
+    
+    async def commit_chat_turns(
+        self,
+        turns: List[Tuple[str, str, MemoryEntry, int]],
+        turn_ids: Optional[List[str]] = None
+    ) -> List[Tuple[int, int]]:
+        """Commit many (player_id, npc_id, memory_entry, reputation_change) chat
+        turns in one transaction, in order. Returns the new reputation and the
+        conversation list length for each turn; raises if the batch fails.
+        Turns already committed under the same `turn_ids` are not applied again."""
+        if not turns:
+            return []
+        return await self.storage.commit_chat_turns([
+            (player_id, npc_id, self._encode_entry(memory_entry), reputation_change)
+            for player_id, npc_id, memory_entry, reputation_change in turns
+        ], turn_ids)
+    
+    async def get_conversation_summary(self, player_id: str, npc_id: str) -> Optional[str]:
+        """Get the rolling summary of older turns between a player and NPC"""
+        try:
+            return await self.storage.get_summary(player_id, npc_id)
+        except Exception as e:
+            print(f"Error retrieving conversation summary: {e}")
+            return None
+    
+    async def compact_conversation(
+        self,
+        player_id: str,
+        npc_id: str,
+        keep_recent: int,
+        summarize: Callable[[Optional[str], List[MemoryEntry]], Awaitable[str]]
+    ) -> bool:
+        """Fold all but the most recent turns into the rolling summary
+        
+        `summarize(previous_summary, entries)` receives the older entries
+        oldest-first and returns the new summary. Only the entries that were
+        summarized are trimmed, so turns stored meanwhile are never lost.
+        """
+        lock_name = keys.compaction_lock(player_id, npc_id)
+        
+        try:
+            # Only one worker compacts a conversation at a time
+            if not await self.storage.acquire_lock(lock_name, 120):
+                return False
+            try:
+                messages, previous_summary = await self.storage.get_compaction_input(
+                    player_id, npc_id, keep_recent
+                )
+                if not messages:
+                    return False
+                
+                entries = decode_entries(reversed(messages))
+                summary = await summarize(previous_summary, entries)
+                await self.storage.store_summary(player_id, npc_id, summary, len(messages))
+                return True
+            finally:
+                await self.storage.release_lock(lock_name)
+        except Exception as e:
+            print(f"Error compacting conversation: {e}")
+            return False
+    
+    async def get_conversation_history(
         self, 
         player_id: str, 
         npc_id: str, 
         limit: int = 10
     ) -> List[MemoryEntry]:
         """Retrieve conversation history"""
-        key = f"conversation:{player_id}:{npc_id}"
         try:
-            messages = self.redis_client.lrange(key, 0, limit - 1)
-            return [MemoryEntry(**json.loads(msg)) for msg in messages]
+            messages = await self.storage.get_conversation(player_id, npc_id, limit)
+            return decode_entries(messages)
         except Exception as e:
             print(f"Error retrieving conversation history: {e}")
             return []
     
-    def increment_conversation_count(self, npc_id: str) -> int:
+    async def increment_conversation_count(self, npc_id: str) -> int:
         """Increment and return conversation count for NPC"""
-        key = f"npc_stats:{npc_id}:conversations"
-        return self.redis_client.incr(key)
+        return await self.storage.increment_conversation_count(npc_id)
     
-    def get_conversation_count(self, npc_id: str) -> int:
+    async def get_conversation_count(self, npc_id: str) -> int:
         """Get total conversation count for NPC"""
-        key = f"npc_stats:{npc_id}:conversations"
-        count = self.redis_client.get(key)
-        return int(count) if count else 0
+        return await self.storage.get_conversation_count(npc_id)
     
-    def store_player_reputation(
+    async def store_player_reputation(
         self, 
         player_id: str, 
         npc_id: str, 
         reputation: int
     ) -> bool:
         """Store player reputation with NPC (-100 to 100)"""
-        key = f"reputation:{player_id}:{npc_id}"
         try:
-            self.redis_client.set(key, reputation)
+            await self.storage.set_reputation(player_id, npc_id, reputation)
             return True
         except Exception as e:
             print(f"Error storing reputation: {e}")
             return False
     
-    def get_player_reputation(self, player_id: str, npc_id: str) -> int:
+    async def get_player_reputation(self, player_id: str, npc_id: str) -> int:
         """Get player reputation with NPC"""
-        key = f"reputation:{player_id}:{npc_id}"
-        reputation = self.redis_client.get(key)
-        return int(reputation) if reputation else 0
-    
-    def delete_npc(self, npc_id: str) -> bool:
-        """Delete NPC data"""
-        keys = [
-            f"npc:{npc_id}",
-            f"npc_stats:{npc_id}:conversations"
-        ]
+        return await self.storage.get_reputation(player_id, npc_id)
+    
+    async def adjust_player_reputation(
+        self,
+        player_id: str,
+        npc_id: str,
+        change: int
+    ) -> int:
+        """Atomically add to a player's reputation with an NPC, clamped to -100..100.
+        Returns the new reputation."""
+        return (await self.storage.adjust_reputations([(player_id, npc_id, change)]))[0]
+    
+    async def adjust_player_reputations(
+        self,
+        changes: List[Tuple[str, str, int]]
+    ) -> List[int]:
+        """Apply many (player_id, npc_id, change) reputation updates in one round trip,
+        e.g. for faction-wide events. Returns the new reputations in input order."""
+        if not changes:
+            return []
+        return await self.storage.adjust_reputations(changes)
+    
+    async def delete_npc(self, npc_id: str) -> bool:
+        """Delete NPC data; per-player data may be left to the cascade-delete job"""
         try:
-            self.redis_client.delete(*keys)
+            await self.storage.delete_npc(npc_id)
+            await self._invalidate_npc(npc_id)
             return True
         except Exception as e:
             print(f"Error deleting NPC: {e}")
             return False
+    
+    async def delete_player(self, player_id: str) -> bool:
+        """Delete a player's conversations, summaries, reputations and long-term memory with every NPC"""
+        try:
+            await self.storage.delete_player(player_id)
+            return True
+        except Exception as e:
+            print(f"Error deleting player: {e}")
+            return False
+    
+    async def is_npc_being_deleted(self, npc_id: str) -> bool:
+        """Whether a deleted NPC's player data is still being cleaned up"""
+        try:
+            return await self.storage.cascade_pending(npc_id)
+        except Exception as e:
+            print(f"Error checking NPC deletion: {e}")
+            return False
+
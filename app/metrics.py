@@ -0,0 +1,269 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional
+    otel_trace = None
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Sample value at full precision: integral values as ints (1234567,
+    not 1.23457e+06), others as the shortest exact float"""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets and optional labels"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket counts (last slot is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = state
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return sum(state[0]) if state else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds this worker's metrics and renders the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: List = []
+        self.enabled = True
+        self.tracer = None
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "npc_stage_duration_seconds",
+    "Time spent in each stage of a chat turn",
+    ["stage"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "npc_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+PROVIDER_ERRORS = REGISTRY.counter(
+    "npc_llm_provider_errors_total",
+    "Failed LLM provider calls",
+    ["provider", "operation"]
+)
+FALLBACK_RESPONSES = REGISTRY.counter(
+    "npc_llm_fallback_responses_total",
+    "Replies replaced by the fallback response after a provider error",
+    ["provider"]
+)
+BACKEND_CALLS = REGISTRY.counter(
+    "npc_llm_backend_calls_total",
+    "LLM calls by backend and result (success, error or cancelled)",
+    ["backend", "result"]
+)
+HEDGED_CALLS = REGISTRY.counter(
+    "npc_llm_hedged_calls_total",
+    "Duplicate LLM calls sent because the first one ran past the hedge threshold",
+    ["operation"]
+)
+
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "npc_admission_rejections_total",
+    "LLM calls turned away by the admission queue (queue_full or deadline)",
+    ["reason"]
+)
+RATE_LIMITED = REGISTRY.counter(
+    "npc_rate_limited_total",
+    "Requests over a player or NPC token bucket",
+    ["scope"]
+)
+DEGRADED_REPLIES = REGISTRY.counter(
+    "npc_degraded_replies_total",
+    "Chat replies served from personality templates instead of the LLM",
+    ["reason"]
+)
+
+
+def configure(settings) -> None:
+    """Apply Settings: enable/disable recording and set up optional tracing"""
+    REGISTRY.enabled = settings.metrics_enabled
+    REGISTRY.tracer = None
+    if settings.otel_enabled:
+        if otel_trace is None:
+            print("OTEL_ENABLED is set but opentelemetry-api is not installed; tracing disabled")
+        else:
+            REGISTRY.tracer = otel_trace.get_tracer(settings.otel_service_name)
+
+
+def observe_stage(stage_name: str, seconds: float) -> None:
+    if REGISTRY.enabled:
+        STAGE_SECONDS.observe(seconds, stage=stage_name)
+
+
+def count_cache(cache: str, hit: bool) -> None:
+    if REGISTRY.enabled:
+        CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def count_provider_error(provider: str, operation: str) -> None:
+    if REGISTRY.enabled:
+        PROVIDER_ERRORS.inc(provider=provider, operation=operation)
+
+
+def count_fallback(provider: str) -> None:
+    if REGISTRY.enabled:
+        FALLBACK_RESPONSES.inc(provider=provider)
+
+
+def count_backend_call(backend: str, result: str) -> None:
+    if REGISTRY.enabled:
+        BACKEND_CALLS.inc(backend=backend, result=result)
+
+
+def count_hedge(operation: str) -> None:
+    if REGISTRY.enabled:
+        HEDGED_CALLS.inc(operation=operation)
+
+
+def count_admission_rejection(reason: str) -> None:
+    if REGISTRY.enabled:
+        ADMISSION_REJECTIONS.inc(reason=reason)
+
+
+def count_rate_limited(scope: str) -> None:
+    if REGISTRY.enabled:
+        RATE_LIMITED.inc(scope=scope)
+
+
+def count_degraded_reply(reason: str) -> None:
+    if REGISTRY.enabled:
+        DEGRADED_REPLIES.inc(reason=reason)
+
+
+@contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    """Time a block into the stage histogram, inside an OpenTelemetry span when tracing is on"""
+    start = time.perf_counter()
+    if REGISTRY.tracer is not None:
+        with REGISTRY.tracer.start_as_current_span(f"npc.{stage_name}"):
+            try:
+                yield
+            finally:
+                observe_stage(stage_name, time.perf_counter() - start)
+    else:
+        try:
+            yield
+        finally:
+            observe_stage(stage_name, time.perf_counter() - start)
+
+
+def start_span(name: str) -> Optional[object]:
+    """A span that is not made current, for work spread across an async generator;
+    call .end() on it when done"""
+    if REGISTRY.tracer is None:
+        return None
+    return REGISTRY.tracer.start_span(f"npc.{name}")
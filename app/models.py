@@ -18,6 +18,12 @@ class NPCCreate(BaseModel):
     personality: PersonalityType = Field(..., description="NPC personality type")
     background: str = Field(..., description="NPC background story")
     location: str = Field(default="Unknown", description="NPC location in game")
+    response_cache: bool = Field(default=True, description="Allow cached LLM replies for this NPC")
+    prompt_template: Optional[str] = Field(
+        default=None,
+        description="Custom system prompt template using $npc_name, $personality, $traits, "
+                    "$background, $location, $speaking_style, $relationship and $example"
+    )
 
 
 class NPCResponse(BaseModel):
@@ -26,6 +32,8 @@ class NPCResponse(BaseModel):
     personality: PersonalityType
     background: str
     location: str
+    response_cache: bool = True
+    prompt_template: Optional[str] = None
     conversation_count: int = 0
 
 
@@ -39,6 +47,7 @@ class ChatResponse(BaseModel):
     npc_response: str
     npc_emotion: Optional[str] = None
     quest_offered: bool = False
+    degraded: bool = Field(default=False, description="Fallback reply given because the NPC was overloaded")
 
 
 class Quest(BaseModel):
@@ -1,6 +1,9 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from functools import lru_cache
+from string import Template
 from app.config import get_settings
-from app.models import PersonalityType
+from app.models import MemoryEntry, PersonalityType
+from app.reputation import get_reputation_scorer
 
 
 class PersonalityEngine:
@@ -39,45 +42,28 @@ class PersonalityEngine:
         }
     }
     
-    @staticmethod
-    def get_system_prompt(
-        personality: PersonalityType,
-        npc_name: str,
-        background: str,
-        location: str,
-        reputation: int = 0
-    ) -> str:
-        """Generate system prompt based on personality"""
-        # Handle both enum and string personalities
-        if isinstance(personality, str):
-            personality = PersonalityType(personality)
-        
-        personality_info = PersonalityEngine.PERSONALITY_PROMPTS.get(personality)
-        
-        reputation_context = ""
-        if reputation > 50:
-            reputation_context = "The player is a trusted friend and ally."
-        elif reputation > 0:
-            reputation_context = "The player is known to you, but not yet fully trusted."
-        elif reputation < -50:
-            reputation_context = "The player is an enemy or has wronged you significantly."
-        elif reputation < 0:
-            reputation_context = "The player has a poor reputation with you."
-        else:
-            reputation_context = "The player is a stranger to you."
-        
-        prompt = f"""You are {npc_name}, an NPC in a fantasy RPG game.
-
-PERSONALITY: {personality.value.upper()}
-You are {personality_info['traits']}.
+    # Reputation bands, checked in order: (band, lower bound exclusive, relationship text)
+    REPUTATION_BANDS = [
+        ("ally", 50, "The player is a trusted friend and ally."),
+        ("known", 0, "The player is known to you, but not yet fully trusted."),
+        ("stranger", -1, "The player is a stranger to you."),
+        ("poor", -51, "The player has a poor reputation with you."),
+        ("enemy", None, "The player is an enemy or has wronged you significantly."),
+    ]
+    
+    # Everything that doesn't depend on reputation comes first so that all
+    # bands of an NPC share a long, stable prefix for provider prompt caches.
+    # Custom per-NPC templates use the same $placeholders.
+    DEFAULT_PROMPT_TEMPLATE = """You are $npc_name, an NPC in a fantasy RPG game.
 
-BACKGROUND: {background}
+PERSONALITY: $personality
+You are $traits.
 
-LOCATION: {location}
+BACKGROUND: $background
 
-SPEAKING STYLE: {personality_info['speaking_style']}
+LOCATION: $location
 
-RELATIONSHIP: {reputation_context}
+SPEAKING STYLE: $speaking_style
 
 GUIDELINES:
 - Stay in character at all times
@@ -88,42 +74,128 @@ GUIDELINES:
 - Remember previous conversations with the player
 - You can offer quests or information naturally in conversation
 
-Example response: {personality_info['example']}
+Example response: $example
+
+RELATIONSHIP: $relationship
 
 Respond naturally to the player's messages."""
-        
-        return prompt
+    
+    TEMPLATE_PLACEHOLDERS = (
+        "npc_name", "personality", "traits", "background",
+        "location", "speaking_style", "relationship", "example"
+    )
     
     @staticmethod
-    def calculate_reputation_change(
+    def get_reputation_band(reputation: int) -> str:
+        """Map a reputation value to its band name"""
+        for band, lower_bound, _ in PersonalityEngine.REPUTATION_BANDS:
+            if lower_bound is None or reputation > lower_bound:
+                return band
+        return "stranger"
+    
+    @staticmethod
+    def validate_template(template: str) -> None:
+        """Raise ValueError if a custom prompt template uses unknown placeholders"""
+        try:
+            Template(template).substitute(
+                {name: "" for name in PersonalityEngine.TEMPLATE_PLACEHOLDERS}
+            )
+        except KeyError as e:
+            raise ValueError(f"Unknown placeholder in prompt template: ${e.args[0]}")
+        except ValueError as e:
+            raise ValueError(f"Invalid prompt template: {e}")
+    
+    @staticmethod
+    def compile_system_prompts(
         personality: PersonalityType,
-        player_message: str
-    ) -> int:
-        """Calculate reputation change based on interaction (simplified)"""
+        npc_name: str,
+        background: str,
+        location: str,
+        template: Optional[str] = None
+    ) -> Dict[str, str]:
+        """Render an NPC's system prompt once for every reputation band"""
         # Handle both enum and string personalities
         if isinstance(personality, str):
             personality = PersonalityType(personality)
-        
-        message_lower = player_message.lower()
-        
-        # Positive keywords
-        positive = ["please", "thank", "help", "friend", "honor", "respect"]
-        negative = ["fool", "idiot", "stupid", "hate", "attack", "threat"]
-        
-        change = 0
-        
-        for word in positive:
-            if word in message_lower:
-                change += 2
-        
-        for word in negative:
-            if word in message_lower:
-                change -= 3
-        
-        # Personality modifiers
-        if personality == PersonalityType.FRIENDLY:
-            change += 1  # Friendly NPCs like everyone more
-        elif personality == PersonalityType.AGGRESSIVE:
-            change -= 1  # Aggressive NPCs harder to please
-        
-        return max(min(change, 10), -10)  # Cap between -10 and +10
+        return dict(_compile_system_prompts(personality, npc_name, background, location, template))
+    
+    @staticmethod
+    def select_system_prompt(npc: Dict, reputation: int = 0) -> str:
+        """Look up the precompiled system prompt for an NPC record and reputation"""
+        prompts = npc.get("system_prompts")
+        if not prompts:
+            # NPCs stored before prompts were precompiled
+            prompts = dict(_compile_system_prompts(
+                PersonalityType(npc["personality"]),
+                npc["name"],
+                npc["background"],
+                npc["location"],
+                npc.get("prompt_template")
+            ))
+        return prompts[PersonalityEngine.get_reputation_band(reputation)]
+    
+    @staticmethod
+    def add_memory_summary(system_prompt: str, summary: Optional[str]) -> str:
+        """Append the rolling summary of older conversations to a system prompt"""
+        if not summary:
+            return system_prompt
+        return f"{system_prompt}\n\nMEMORIES OF EARLIER CONVERSATIONS WITH THIS PLAYER:\n{summary}"
+    
+    @staticmethod
+    def add_relevant_memories(system_prompt: str, entries: List[MemoryEntry]) -> str:
+        """Append past exchanges relevant to the current message to a system prompt"""
+        if not entries:
+            return system_prompt
+        moments = "\n".join(
+            f"- The player said \"{entry.player_message}\" and you replied \"{entry.npc_response}\""
+            for entry in entries
+        )
+        return f"{system_prompt}\n\nRELEVANT PAST MOMENTS WITH THIS PLAYER:\n{moments}"
+    
+    @staticmethod
+    def get_system_prompt(
+        personality: PersonalityType,
+        npc_name: str,
+        background: str,
+        location: str,
+        reputation: int = 0
+    ) -> str:
+        """Generate system prompt based on personality"""
+        prompts = PersonalityEngine.compile_system_prompts(
+            personality, npc_name, background, location
+        )
+        return prompts[PersonalityEngine.get_reputation_band(reputation)]
+    
+    @staticmethod
+    def calculate_reputation_change(
+        personality: PersonalityType,
+        player_message: str
+    ) -> int:
+        """Calculate reputation change based on interaction"""
+        return get_reputation_scorer().score(personality, player_message)
+
+
+@lru_cache(maxsize=1024)
+def _compile_system_prompts(
+    personality: PersonalityType,
+    npc_name: str,
+    background: str,
+    location: str,
+    template: Optional[str] = None
+) -> Tuple[Tuple[str, str], ...]:
+    """Render and memoize (band, prompt) pairs for one NPC definition"""
+    personality_info = PersonalityEngine.PERSONALITY_PROMPTS[personality]
+    compiled = Template(template or PersonalityEngine.DEFAULT_PROMPT_TEMPLATE)
+    values = {
+        "npc_name": npc_name,
+        "personality": personality.value.upper(),
+        "traits": personality_info["traits"],
+        "background": background,
+        "location": location,
+        "speaking_style": personality_info["speaking_style"],
+        "example": personality_info["example"]
+    }
+    return tuple(
+        (band, compiled.substitute(values, relationship=relationship))
+        for band, _, relationship in PersonalityEngine.REPUTATION_BANDS
+    )
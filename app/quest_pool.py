@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Set
+
+from app import keys, metrics
+from app.models import Quest
+
+
+class QuestPool:
+    """Per-NPC stock of pre-generated quests kept in the storage backend
+
+    Each NPC has a list of validated Quest JSON (`quest_pool:{npc_id}` in
+    Redis). `pop()` takes one in a single step; whenever a pool runs low,
+    the NPC is queued for refill and background workers top it back up to
+    `size`. A short storage lock keeps workers on different processes from
+    refilling the same NPC at once.
+    """
+
+    def __init__(
+        self,
+        memory_manager,
+        llm_service,
+        size: int = 5,
+        low_watermark: int = 2,
+        workers: int = 2,
+        ttl: int = 86400
+    ):
+        self.memory_manager = memory_manager
+        self.llm_service = llm_service
+        self.size = size
+        self.low_watermark = low_watermark
+        self.workers = workers
+        self.ttl = ttl
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failed = 0
+
+    @property
+    def storage(self):
+        return self.memory_manager.storage
+
+    async def start(self) -> None:
+        """Start the refill workers (called from the app lifespan)"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """Stop the refill workers; half-filled pools are topped up later"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def pop(self, npc_id: str) -> Optional[Quest]:
+        """Take a ready quest for this NPC, or None when the pool is empty"""
+        try:
+            data, remaining = await self.storage.pop_quest(npc_id)
+        except Exception as e:
+            print(f"Error reading quest pool: {e}")
+            return None
+
+        if remaining < self.low_watermark:
+            self.request_refill(npc_id)
+        metrics.count_cache("quest_pool", data is not None)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Quest.model_validate_json(data)
+
+    def request_refill(self, npc_id: str) -> None:
+        """Queue an NPC for a background top-up (no-op if already queued)"""
+        if npc_id not in self._queued:
+            self._queued.add(npc_id)
+            self._queue.put_nowait(npc_id)
+
+    async def _worker(self) -> None:
+        while True:
+            npc_id = await self._queue.get()
+            self._queued.discard(npc_id)
+            try:
+                await self.refill(npc_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error refilling quest pool: {e}")
+
+    async def refill(self, npc_id: str) -> int:
+        """Generate quests until this NPC's pool holds `size`; returns how many were added"""
+        lock_name = keys.quest_pool_lock(npc_id)
+        if not await self.storage.acquire_lock(lock_name, 300):
+            return 0
+        try:
+            npc = await self.memory_manager.get_npc(npc_id)
+            if not npc:
+                return 0
+            added = 0
+            missing = self.size - await self.storage.count_quests(npc_id)
+            for _ in range(max(0, missing)):
+                quest = await self._generate(npc)
+                if quest is None:
+                    # Don't keep hammering a provider that is failing
+                    break
+                await self.storage.push_quest(npc_id, quest.model_dump_json(), self.ttl)
+                added += 1
+            return added
+        finally:
+            await self.storage.release_lock(lock_name)
+
+    async def _generate(self, npc: Dict) -> Optional[Quest]:
+        """One validated quest for an NPC, or None if generation failed"""
+        try:
+            data = await self.llm_service.request_quest(
+                npc_name=npc["name"],
+                npc_background=npc["background"],
+                personality=npc["personality"],
+                call_kind="quest_pool"
+            )
+            quest = Quest(quest_id=str(uuid.uuid4()), **data)
+        except Exception as e:
+            print(f"Quest pool generation error: {e}")
+            self.failed += 1
+            return None
+        self.generated += 1
+        return quest
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "generated": self.generated,
+            "failed": self.failed,
+            "refills_queued": self._queue.qsize()
+        }
@@ -0,0 +1,61 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.models import Quest
+
+
+# Fields the LLM writes; quest_id is assigned by the service
+QUEST_FIELDS: Tuple[str, ...] = tuple(name for name in Quest.model_fields if name != "quest_id")
+
+DIFFICULTIES = ("easy", "medium", "hard")
+MAX_OBJECTIVES = 6
+
+_ADAPTERS = {name: TypeAdapter(Quest.model_fields[name].annotation) for name in QUEST_FIELDS}
+
+
+def quest_json_schema(fields: Sequence[str] = QUEST_FIELDS) -> Dict[str, Any]:
+    """JSON schema for the given quest fields, usable for structured output"""
+    properties = Quest.model_json_schema()["properties"]
+    schema = {
+        "type": "object",
+        "properties": {name: dict(properties[name]) for name in fields},
+        "required": list(fields),
+        "additionalProperties": False
+    }
+    if "difficulty" in fields:
+        schema["properties"]["difficulty"]["enum"] = list(DIFFICULTIES)
+    if "objectives" in fields:
+        schema["properties"]["objectives"].update(minItems=1, maxItems=MAX_OBJECTIVES)
+    return schema
+
+
+def validate_quest_field(name: str, value: Any) -> Optional[Any]:
+    """Validated (and normalized) value for one quest field, or None if it's unusable"""
+    adapter = _ADAPTERS.get(name)
+    if adapter is None:
+        return None
+    try:
+        value = adapter.validate_python(value)
+    except ValidationError:
+        return None
+
+    if name == "objectives":
+        value = [objective.strip() for objective in value if objective.strip()][:MAX_OBJECTIVES]
+        return value or None
+    value = value.strip()
+    if name == "difficulty":
+        value = value.lower()
+        return value if value in DIFFICULTIES else None
+    return value or None
+
+
+def fallback_quest(npc_name: str) -> Dict[str, Any]:
+    """Generic quest used for any field the LLM couldn't provide"""
+    return {
+        "title": "A Simple Task",
+        "description": f"{npc_name} needs your help with something.",
+        "difficulty": "medium",
+        "reward": "Gold and experience",
+        "objectives": ["Talk to the quest giver", "Complete the task"]
+    }
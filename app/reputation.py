@@ -0,0 +1,147 @@
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Pattern, Sequence, Union
+
+from app.config import get_settings
+from app.models import PersonalityType
+
+
+# Weights applied to every personality unless overridden
+DEFAULT_LEXICON: Dict[str, int] = {
+    "please": 2,
+    "thank": 2,
+    "thanks": 2,
+    "thank you": 2,
+    "help": 2,
+    "friend": 2,
+    "friends": 2,
+    "honor": 2,
+    "honour": 2,
+    "respect": 2,
+    "fool": -3,
+    "idiot": -3,
+    "stupid": -3,
+    "hate": -3,
+    "attack": -3,
+    "threat": -3,
+    "threaten": -3,
+}
+
+# Flat adjustment applied to every message for a personality
+DEFAULT_MODIFIERS: Dict[PersonalityType, int] = {
+    PersonalityType.FRIENDLY: 1,  # Friendly NPCs like everyone more
+    PersonalityType.AGGRESSIVE: -1,  # Aggressive NPCs harder to please
+}
+
+MAX_CHANGE = 10
+
+
+class ReputationScorer:
+    """Scores player messages against weighted, per-personality lexicons
+
+    Each personality's lexicon is compiled into a single case-insensitive
+    alternation regex with word boundaries, so a message is scanned once
+    and "helpless" no longer counts as "help". Every distinct term counts
+    once per message, and the total is capped at +/-10.
+    """
+
+    def __init__(
+        self,
+        lexicons: Optional[Dict[PersonalityType, Dict[str, int]]] = None,
+        modifiers: Optional[Dict[PersonalityType, int]] = None,
+        max_change: int = MAX_CHANGE
+    ):
+        lexicons = lexicons or {}
+        self.modifiers = dict(DEFAULT_MODIFIERS if modifiers is None else modifiers)
+        self.max_change = max_change
+        self.lexicons: Dict[PersonalityType, Dict[str, int]] = {}
+        self.patterns: Dict[PersonalityType, Optional[Pattern]] = {}
+        for personality in PersonalityType:
+            lexicon = {
+                term.lower(): weight
+                for term, weight in lexicons.get(personality, DEFAULT_LEXICON).items()
+            }
+            self.lexicons[personality] = lexicon
+            self.patterns[personality] = self._compile(lexicon)
+
+    @staticmethod
+    def _compile(lexicon: Dict[str, int]) -> Optional[Pattern]:
+        if not lexicon:
+            return None
+        # Longest terms first so "thank you" wins over "thank"
+        terms = sorted(lexicon, key=len, reverse=True)
+        alternation = "|".join(re.escape(term).replace(r"\ ", r"\s+") for term in terms)
+        return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+    def score(self, personality: Union[PersonalityType, str], message: str) -> int:
+        """Reputation change for one message"""
+        if isinstance(personality, str):
+            personality = PersonalityType(personality)
+
+        change = self.modifiers.get(personality, 0)
+        pattern = self.patterns[personality]
+        if pattern is not None:
+            lexicon = self.lexicons[personality]
+            matched = {" ".join(term.lower().split()) for term in pattern.findall(message)}
+            change += sum(lexicon[term] for term in matched)
+
+        return max(min(change, self.max_change), -self.max_change)
+
+    def score_batch(
+        self,
+        messages: Sequence[str],
+        personality: Union[PersonalityType, str, Sequence[Union[PersonalityType, str]]]
+    ) -> List[int]:
+        """Score many messages in one call
+
+        `personality` is either one personality for every message or a
+        sequence with one personality per message.
+        """
+        if isinstance(personality, (PersonalityType, str)):
+            personalities: Iterable = [personality] * len(messages)
+        else:
+            if len(personality) != len(messages):
+                raise ValueError("Expected one personality per message")
+            personalities = personality
+        return [self.score(p, message) for p, message in zip(personalities, messages)]
+
+    @classmethod
+    def from_file(cls, path: str) -> "ReputationScorer":
+        """Load lexicons from a JSON file
+
+        Format::
+
+            {
+              "default": {"please": 2, "idiot": -3},
+              "personalities": {"merchant": {"deal": 3, "haggle": -1}},
+              "modifiers": {"friendly": 1, "aggressive": -1},
+              "max_change": 10
+            }
+
+        Personality entries are merged over "default", which itself
+        falls back to the built-in lexicon.
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+
+        default = config.get("default", DEFAULT_LEXICON)
+        overrides = config.get("personalities", {})
+        lexicons = {
+            personality: {**default, **overrides.get(personality.value, {})}
+            for personality in PersonalityType
+        }
+        modifiers = None
+        if "modifiers" in config:
+            modifiers = {
+                PersonalityType(name): value
+                for name, value in config["modifiers"].items()
+            }
+        return cls(lexicons, modifiers, config.get("max_change", MAX_CHANGE))
+
+
+@lru_cache()
+def get_reputation_scorer() -> ReputationScorer:
+    """Shared scorer built from Settings.reputation_lexicon_path"""
+    path = get_settings().reputation_lexicon_path
+    return ReputationScorer.from_file(path) if path else ReputationScorer()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import random
+import re
+from typing import Dict, List, Optional
+
+from app import keys, metrics
+from app.cache import TTLCache
+
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a player message so trivially different openers share a key"""
+    message = _PUNCTUATION.sub(" ", message.lower())
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+class ResponseCache:
+    """Base class for LLM response caches
+
+    Each key holds a small pool of response variants. Lookups miss until
+    the pool is full, so the first few identical requests still reach the
+    LLM; after that a random variant is served.
+    """
+
+    def __init__(self, ttl: float = 3600.0, variants: int = 3):
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Hash the system prompt, the history sent to the LLM and the normalized message"""
+        history = [
+            [entry.get("player_message", ""), entry.get("npc_response", "")]
+            for entry in conversation_history or []
+        ]
+        payload = json.dumps([system_prompt, history, normalize_message(user_message)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached variant once the pool for this key is full"""
+        pool = await self._get_variants(key)
+        hit = len(pool) >= self.variants
+        metrics.count_cache("llm_response", hit)
+        if hit:
+            self.hits += 1
+            return random.choice(pool)
+        self.misses += 1
+        return None
+
+    async def add(self, key: str, response: str) -> None:
+        """Add a freshly generated response to the pool for this key"""
+        raise NotImplementedError
+
+    async def _get_variants(self, key: str) -> List[str]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class MemoryResponseCache(ResponseCache):
+    """Per-worker response cache with LRU eviction"""
+
+    backend = "memory"
+
+    def __init__(self, ttl: float = 3600.0, variants: int = 3, max_size: int = 10000):
+        super().__init__(ttl=ttl, variants=variants)
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def _get_variants(self, key: str) -> List[str]:
+        return self._cache.get(key) or []
+
+    async def add(self, key: str, response: str) -> None:
+        pool = list(self._cache.get(key) or [])
+        if len(pool) < self.variants:
+            pool.append(response)
+            self._cache.set(key, pool)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats["size"] = len(self._cache)
+        return stats
+
+
+class RedisResponseCache(ResponseCache):
+    """Response cache shared by all workers through Redis
+
+    Entries expire after the TTL; configure Redis with an LRU
+    maxmemory-policy to bound total memory.
+    """
+
+    backend = "redis"
+
+    def __init__(self, redis_client, ttl: float = 3600.0, variants: int = 3):
+        super().__init__(ttl=ttl, variants=variants)
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        return keys.llm_cache(key)
+
+    async def _get_variants(self, key: str) -> List[str]:
+        try:
+            return await self.redis_client.lrange(self._redis_key(key), 0, -1)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return []
+
+    async def add(self, key: str, response: str) -> None:
+        redis_key = self._redis_key(key)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(redis_key, response)
+                pipe.ltrim(redis_key, -self.variants, -1)
+                pipe.expire(redis_key, int(self.ttl))
+                await pipe.execute()
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+
+def create_response_cache(settings, redis_client=None) -> Optional[ResponseCache]:
+    """Build the response cache selected in Settings, or None when disabled"""
+    if not settings.response_cache_enabled:
+        return None
+    backend = settings.response_cache_backend
+    if backend == "redis" and redis_client is None:
+        print("RESPONSE_CACHE_BACKEND=redis needs STORAGE_BACKEND=redis; using the memory cache")
+        backend = "memory"
+    if backend == "redis":
+        return RedisResponseCache(
+            redis_client,
+            ttl=settings.response_cache_ttl,
+            variants=settings.response_cache_variants
+        )
+    if backend == "memory":
+        return MemoryResponseCache(
+            ttl=settings.response_cache_ttl,
+            variants=settings.response_cache_variants,
+            max_size=settings.response_cache_max_size
+        )
+    raise ValueError(f"Unknown response cache backend: {settings.response_cache_backend}")
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight call
+
+    The first caller for a key starts the work; callers arriving while it
+    is still running wait for the same result instead of starting their
+    own. Nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    def __init__(self, timeout: float = 30.0):
+        # How long a follower waits on the shared call before running its own
+        self.timeout = timeout
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        retry_on: Tuple[Type[BaseException], ...] = ()
+    ) -> Any:
+        """Run fn() for this key, or join a call for the same key already in flight
+
+        A follower runs fn() itself if the shared call outlasts `timeout`
+        (capped at the instance timeout) or fails with one of `retry_on`,
+        errors that belong to the leader's request rather than to the call.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            wait = self.timeout if timeout is None else max(0.0, min(timeout, self.timeout))
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), wait)
+            except asyncio.TimeoutError:
+                return await fn()
+            except retry_on:
+                self.retried += 1
+                return await fn()
+
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so a leader that is cancelled (e.g. client disconnect)
+        # doesn't cancel the call for everyone waiting on it
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception retrieved; waiters re-raise it themselves
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retried": self.retried
+        }
@@ -0,0 +1,1568 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app import keys
+from app.keys import CASCADE_JOBS_KEY
+
+
+CONVERSATION_MAX_ENTRIES = 50
+CONVERSATION_TTL_SECONDS = 604800  # 7 days
+
+# How long a committed chat turn's id is remembered, to skip it on retries
+CHAT_TURN_MARKER_TTL_SECONDS = 3600
+
+# Pub/sub channel used to tell every worker to drop a cached NPC definition
+NPC_INVALIDATION_CHANNEL = "npc_invalidations"
+
+REPUTATION_MIN = -100
+REPUTATION_MAX = 100
+
+# Adds ARGV[1] to the reputation at KEYS[1], clamps it to [ARGV[2], ARGV[3]]
+# and returns the stored value, all in one atomic server-side step
+ADJUST_REPUTATION_SCRIPT = """
+local value = tonumber(redis.call('GET', KEYS[1]) or '0') + tonumber(ARGV[1])
+value = math.max(tonumber(ARGV[2]), math.min(tonumber(ARGV[3]), value))
+redis.call('SET', KEYS[1], value)
+return value
+"""
+
+# Adds ARGV[1] to the reputation at KEYS[1] (clamped to [ARGV[2], ARGV[3]]),
+# pushes the entry ARGV[4] onto the conversation list KEYS[2], trims it to
+# ARGV[5] entries and sets its TTL to ARGV[6] seconds, as one atomic step.
+# If the turn marker KEYS[3] is given and already set, the turn was committed
+# before and nothing changes; otherwise it is set for ARGV[7] seconds. All
+# keys share the player-NPC hash tag. Returns {reputation, list length,
+# 1 if applied or 0 if skipped}.
+COMMIT_TURN_SCRIPT = """
+if #KEYS == 3 and not redis.call('SET', KEYS[3], 1, 'NX', 'EX', ARGV[7]) then
+    return {tonumber(redis.call('GET', KEYS[1]) or '0'), redis.call('LLEN', KEYS[2]), 0}
+end
+local value = tonumber(redis.call('GET', KEYS[1]) or '0') + tonumber(ARGV[1])
+value = math.max(tonumber(ARGV[2]), math.min(tonumber(ARGV[3]), value))
+redis.call('SET', KEYS[1], value)
+local length = redis.call('LPUSH', KEYS[2], ARGV[4])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[5]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return {value, length, 1}
+"""
+
+# Increments the conversation count at KEYS[1] unless the turn marker KEYS[2]
+# (same NPC hash tag) is already set, then sets it for ARGV[1] seconds.
+# Returns the new count, or 0 if the turn was counted before.
+COUNT_TURN_SCRIPT = """
+if redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[1]) then
+    return redis.call('INCR', KEYS[1])
+end
+return 0
+"""
+
+# Moves the index set at KEYS[1] to the staging set KEYS[2] (same hash tag)
+# and, if KEYS[3] is given, marks the cascade as pending there. The job
+# itself is queued by the caller. Returns 0 when there is nothing to cascade.
+STAGE_CASCADE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+if #KEYS == 3 then
+    redis.call('SET', KEYS[3], 1)
+end
+return 1
+"""
+
+# Token bucket at KEYS[1] (a hash of tokens and last refill time) refilled at
+# ARGV[1] tokens per second up to ARGV[2]: takes one token if there is one.
+# Uses the server clock so every worker sees the same buckets. Returns 0 when
+# a token was taken, otherwise the milliseconds until one is available.
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+# (player_id, npc_id, encoded memory entry, reputation change)
+ChatTurn = Tuple[str, str, bytes, int]
+
+
+def clamp_reputation(reputation: int) -> int:
+    """Clamp a reputation value to the supported -100..100 range"""
+    return max(REPUTATION_MIN, min(REPUTATION_MAX, reputation))
+
+
+def refill_bucket(
+    state: Optional[Tuple[float, float]],
+    now: float,
+    rate: float,
+    burst: int
+) -> Tuple[Tuple[float, float], float]:
+    """Take one token from a (tokens, last refill time) bucket refilled at
+    `rate` per second up to `burst`. Returns the new state and 0.0, or the
+    seconds until a token is available when the bucket is empty."""
+    tokens, updated_at = state if state is not None else (float(burst), now)
+    tokens = min(float(burst), tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def bucket_ttl(rate: float, burst: int) -> float:
+    """Seconds after which an untouched bucket is full again and can be dropped"""
+    return burst / rate + 1
+
+
+def _to_str(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+class StorageBackend:
+    """Base class for the stores behind MemoryManager
+
+    Backends only persist data: NPC definitions as JSON text, conversation
+    entries as already-encoded bytes (newest first), counters, summaries,
+    locks, rate-limit buckets, long-term memory records and quest pools. Caching, entry
+    encoding and validation stay in MemoryManager.
+    """
+
+    backend = ""
+
+    async def start(self) -> None:
+        """Open connections and start background work (called from the app lifespan)"""
+
+    async def close(self) -> None:
+        """Finish pending writes and release connections"""
+
+    # NPCs
+
+    async def get_npc(self, npc_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set_npc(self, npc_id: str, data: str) -> None:
+        raise NotImplementedError
+
+    async def delete_npc(self, npc_id: str) -> None:
+        """Delete an NPC with its stats and quest pool, and every player's
+        conversation, summary, reputation and long-term memory with it (the
+        latter may be left to a cascade job)"""
+        raise NotImplementedError
+
+    async def delete_player(self, player_id: str) -> None:
+        """Delete a player's conversations, summaries, reputations and
+        long-term memory with every NPC (possibly left to a cascade job)"""
+        raise NotImplementedError
+
+    async def cascade_pending(self, npc_id: str) -> bool:
+        """Whether a deleted NPC's player data is still being removed"""
+        return False
+
+    async def next_cascade_job(self) -> Optional[str]:
+        """A pending cascade-delete job, or None; backends that delete
+        everything inline never have any"""
+        return None
+
+    async def cascade_delete_batch(self, job: str, batch_size: int) -> int:
+        """Remove the data of up to `batch_size` player-NPC pairs of a job.
+        Returns how many pairs were handled, or 0 once the job is finished."""
+        return 0
+
+    async def publish_npc_invalidation(self, npc_id: str) -> None:
+        """Tell other workers sharing this store to drop a cached NPC"""
+
+    async def listen_npc_invalidations(self, on_message: Callable[[Optional[str]], None]) -> None:
+        """Call on_message(npc_id) for every invalidation published by any
+        worker, and on_message(None) whenever some may have been missed.
+        Runs until cancelled; stores that no other worker can share have
+        nothing to listen for and return at once."""
+
+    # Conversations
+
+    async def append_conversation(self, player_id: str, npc_id: str, entry: bytes) -> None:
+        raise NotImplementedError
+
+    async def get_conversation(
+        self,
+        player_id: str,
+        npc_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[bytes]:
+        """Stored entries, newest first, skipping `offset` and returning at most `limit`"""
+        raise NotImplementedError
+
+    async def load_chat_context(
+        self,
+        player_id: str,
+        npc_id: str,
+        history_limit: int,
+        include_npc: bool
+    ) -> Tuple[List[bytes], int, Optional[str], Optional[str]]:
+        """Recent entries, reputation, rolling summary and (if asked) the NPC
+        JSON, read together"""
+        raise NotImplementedError
+
+    async def commit_chat_turns(
+        self,
+        turns: List[ChatTurn],
+        turn_ids: Optional[List[str]] = None
+    ) -> List[Tuple[int, int]]:
+        """Atomically apply each turn's reputation change, append its entry and
+        bump the NPC's conversation count, in order. Returns the new reputation
+        and conversation length per turn; raises if the batch fails.
+
+        With `turn_ids`, a turn committed before under the same id is skipped
+        (its current reputation and length are returned), so a batch whose
+        outcome is unknown can be retried. Backends whose failed commits
+        never apply anything may ignore them."""
+        raise NotImplementedError
+
+    async def get_summary(self, player_id: str, npc_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def get_compaction_input(
+        self,
+        player_id: str,
+        npc_id: str,
+        keep_recent: int
+    ) -> Tuple[List[bytes], Optional[str]]:
+        """Entries older than the newest `keep_recent` (newest first) and the current summary"""
+        raise NotImplementedError
+
+    async def store_summary(self, player_id: str, npc_id: str, summary: str, trim: int) -> None:
+        """Replace the summary and drop the `trim` oldest entries in one step"""
+        raise NotImplementedError
+
+    # Counters and reputation
+
+    async def increment_conversation_count(self, npc_id: str) -> int:
+        raise NotImplementedError
+
+    async def get_conversation_count(self, npc_id: str) -> int:
+        raise NotImplementedError
+
+    async def get_reputation(self, player_id: str, npc_id: str) -> int:
+        raise NotImplementedError
+
+    async def set_reputation(self, player_id: str, npc_id: str, reputation: int) -> None:
+        raise NotImplementedError
+
+    async def adjust_reputations(self, changes: List[Tuple[str, str, int]]) -> List[int]:
+        """Add to each (player_id, npc_id) reputation, clamped; returns the new values"""
+        raise NotImplementedError
+
+    # Locks
+
+    async def acquire_lock(self, name: str, ttl: int) -> bool:
+        """Take a named lock that expires after `ttl` seconds; False if already held"""
+        raise NotImplementedError
+
+    async def release_lock(self, name: str) -> None:
+        raise NotImplementedError
+
+    # Rate limits
+
+    async def take_token(self, name: str, rate: float, burst: int) -> float:
+        """Take a token from the named bucket, refilled at `rate` per second up
+        to `burst`. Returns 0.0, or the seconds until a token is available."""
+        raise NotImplementedError
+
+    # Long-term memory log
+
+    async def append_ltm(self, player_id: str, npc_id: str, record: bytes, max_entries: int, ttl: int) -> None:
+        """Append a record to the pair's log, keep the newest `max_entries`, bump
+        the pair's record counter and expire both `ttl` seconds from now"""
+        raise NotImplementedError
+
+    async def read_ltm(self, player_id: str, npc_id: str, last: Optional[int] = None) -> Tuple[int, List[bytes]]:
+        """Records ever appended to the pair's log, and the newest `last` kept
+        records (all when None), oldest first"""
+        raise NotImplementedError
+
+    # Quest pools
+
+    async def pop_quest(self, npc_id: str) -> Tuple[Optional[str], int]:
+        """Take the oldest pooled quest; returns it (or None) and how many remain"""
+        raise NotImplementedError
+
+    async def push_quest(self, npc_id: str, data: str, ttl: int) -> None:
+        """Add a quest and restart the pool's expiry"""
+        raise NotImplementedError
+
+    async def count_quests(self, npc_id: str) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend}
+
+
+class RedisStorage(StorageBackend):
+    """Redis store shared by every worker and node
+
+    With REDIS_CLUSTER the same keys (see app/keys.py) are spread over a
+    Redis Cluster. Cluster clients can't run MULTI, so pipelines there are
+    plain pipelines; the writes that must stay atomic are Lua scripts over
+    keys that share a hash tag.
+    """
+
+    backend = "redis"
+
+    def __init__(self, settings):
+        self.cluster = settings.redis_cluster
+        connection_kwargs = dict(
+            max_connections=settings.redis_max_connections,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_connect_timeout,
+            health_check_interval=settings.redis_health_check_interval
+        )
+        if self.cluster:
+            # The seed node is enough; the client discovers the rest of the cluster
+            self.pool = self.binary_pool = None
+            self.redis_client = redis.RedisCluster(
+                host=settings.redis_host, port=settings.redis_port, decode_responses=True, **connection_kwargs
+            )
+            self.binary_client = redis.RedisCluster(
+                host=settings.redis_host, port=settings.redis_port, decode_responses=False, **connection_kwargs
+            )
+        else:
+            connection_kwargs.update(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
+            # One shared pool per worker; connections are opened lazily on first use
+            self.pool = redis.ConnectionPool(decode_responses=True, **connection_kwargs)
+            self.redis_client = redis.Redis(connection_pool=self.pool)
+            # Conversation lists hold binary entries, so they are read and
+            # written through a second client that doesn't decode responses
+            self.binary_pool = redis.ConnectionPool(decode_responses=False, **connection_kwargs)
+            self.binary_client = redis.Redis(connection_pool=self.binary_pool)
+        self.adjust_reputation_script = self.redis_client.register_script(ADJUST_REPUTATION_SCRIPT)
+        self.commit_turn_script = self.redis_client.register_script(COMMIT_TURN_SCRIPT)
+        self.count_turn_script = self.redis_client.register_script(COUNT_TURN_SCRIPT)
+        self.stage_cascade_script = self.redis_client.register_script(STAGE_CASCADE_SCRIPT)
+        self.take_token_script = self.redis_client.register_script(TAKE_TOKEN_SCRIPT)
+
+    async def close(self) -> None:
+        await self.redis_client.aclose()
+        await self.binary_client.aclose()
+        if not self.cluster:
+            await self.pool.disconnect()
+            await self.binary_pool.disconnect()
+
+    def _pipeline(self, client, transaction: bool):
+        """A pipeline on `client`; MULTI/EXEC only when not on a cluster"""
+        return client.pipeline(transaction=transaction and not self.cluster)
+
+    async def _queue_script(self, pipe, script, keys: List[str], args: List) -> None:
+        """Queue a registered Lua script onto a pipeline"""
+        if self.cluster:
+            # Cluster pipelines can't reload a script a node doesn't know yet,
+            # so they send the body; the node caches it either way
+            pipe.eval(script.script, len(keys), *keys, *args)
+        else:
+            await script(keys=keys, args=args, client=pipe)
+
+    async def get_npc(self, npc_id: str) -> Optional[str]:
+        return await self.redis_client.get(keys.npc(npc_id))
+
+    async def set_npc(self, npc_id: str, data: str) -> None:
+        await self.redis_client.set(keys.npc(npc_id), data)
+
+    async def delete_npc(self, npc_id: str) -> None:
+        """Delete the NPC's own keys and stage its per-player keys for the cascade job"""
+        staging = keys.cascade_staging("npc", npc_id)
+        job = json.dumps({"kind": "npc", "id": npc_id, "staging": staging})
+        async with self._pipeline(self.redis_client, transaction=True) as pipe:
+            pipe.delete(*keys.npc_owned_keys(npc_id))
+            await self._queue_script(
+                pipe,
+                self.stage_cascade_script,
+                [keys.npc_players(npc_id), staging, keys.cascade_pending(npc_id)],
+                []
+            )
+            if not self.cluster:
+                pipe.rpush(CASCADE_JOBS_KEY, job)
+            await pipe.execute()
+        await self._queue_cascade_job(job)
+
+    async def delete_player(self, player_id: str) -> None:
+        staging = keys.cascade_staging("player", player_id)
+        job = json.dumps({"kind": "player", "id": player_id, "staging": staging})
+        async with self._pipeline(self.redis_client, transaction=True) as pipe:
+            await self._queue_script(pipe, self.stage_cascade_script, [keys.player_npcs(player_id), staging], [])
+            if not self.cluster:
+                pipe.rpush(CASCADE_JOBS_KEY, job)
+            await pipe.execute()
+        await self._queue_cascade_job(job)
+
+    async def _queue_cascade_job(self, job: str) -> None:
+        # On a cluster the job list lives in another slot than the staging
+        # set, so the job is queued only once the set is in place; otherwise
+        # a worker could pick it up first and finish it as empty
+        if self.cluster:
+            await self.redis_client.rpush(CASCADE_JOBS_KEY, job)
+
+    async def cascade_pending(self, npc_id: str) -> bool:
+        return bool(await self.redis_client.exists(keys.cascade_pending(npc_id)))
+
+    async def next_cascade_job(self) -> Optional[str]:
+        # Rotate the queue so workers on different processes spread over the jobs
+        return await self.redis_client.rpoplpush(CASCADE_JOBS_KEY, CASCADE_JOBS_KEY)
+
+    async def cascade_delete_batch(self, job: str, batch_size: int) -> int:
+        data = json.loads(job)
+        kind, owner, staging = data["kind"], data["id"], data["staging"]
+        # Members leave the staging set only after their keys are gone, so a
+        # batch interrupted midway is simply redone
+        members = await self.redis_client.srandmember(staging, batch_size)
+        if not members:
+            async with self._pipeline(self.redis_client, transaction=True) as pipe:
+                pipe.lrem(CASCADE_JOBS_KEY, 0, job)
+                pipe.delete(staging)
+                if kind == "npc":
+                    pipe.delete(keys.cascade_pending(owner))
+                await pipe.execute()
+            return 0
+
+        async with self._pipeline(self.redis_client, transaction=False) as pipe:
+            for member in members:
+                player_id, npc_id = (member, owner) if kind == "npc" else (owner, member)
+                pipe.unlink(*keys.pair_keys(player_id, npc_id))
+                if kind == "npc":
+                    pipe.srem(keys.player_npcs(player_id), npc_id)
+                else:
+                    pipe.srem(keys.npc_players(npc_id), player_id)
+            pipe.srem(staging, *members)
+            await pipe.execute()
+        return len(members)
+
+    async def publish_npc_invalidation(self, npc_id: str) -> None:
+        await self.redis_client.publish(NPC_INVALIDATION_CHANNEL, npc_id)
+
+    def _subscriber(self):
+        """A client for pub/sub; cluster clients have none, but any node
+        receives messages published anywhere in the cluster"""
+        if not self.cluster:
+            return self.redis_client
+        node = self.redis_client.get_default_node()
+        return redis.Redis(
+            host=node.host,
+            port=node.port,
+            decode_responses=True,
+            socket_connect_timeout=self.redis_client.connection_kwargs.get("socket_connect_timeout")
+        )
+
+    async def listen_npc_invalidations(self, on_message: Callable[[Optional[str]], None]) -> None:
+        while True:
+            client = None
+            pubsub = None
+            try:
+                if self.cluster:
+                    await self.redis_client.initialize()
+                client = self._subscriber()
+                pubsub = client.pubsub()
+                await pubsub.subscribe(NPC_INVALIDATION_CHANNEL)
+                # Messages may have been missed while (re)connecting
+                on_message(None)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"NPC invalidation listener error: {e}")
+                on_message(None)
+                await asyncio.sleep(1.0)
+            finally:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                if client is not None and client is not self.redis_client:
+                    await client.aclose()
+
+    @staticmethod
+    def _queue_index(pipe, player_id: str, npc_id: str) -> None:
+        """Queue the index updates that let deletes find a player-NPC pair without a SCAN"""
+        pipe.sadd(keys.npc_players(npc_id), player_id)
+        pipe.sadd(keys.player_npcs(player_id), npc_id)
+
+    def _queue_conversation(self, pipe, player_id: str, npc_id: str, entry: bytes) -> None:
+        """Queue the commands that append an entry onto a pipeline"""
+        key = keys.conversation(player_id, npc_id)
+        # Store as list, keep last 50 messages
+        pipe.lpush(key, entry)
+        pipe.ltrim(key, 0, CONVERSATION_MAX_ENTRIES - 1)
+        # Set expiry for 7 days
+        pipe.expire(key, CONVERSATION_TTL_SECONDS)
+        self._queue_index(pipe, player_id, npc_id)
+
+    async def _queue_reputation_change(self, pipe, player_id: str, npc_id: str, change: int) -> None:
+        """Queue an atomic increment-and-clamp of a reputation onto a pipeline"""
+        await self._queue_script(
+            pipe,
+            self.adjust_reputation_script,
+            [keys.reputation(player_id, npc_id)],
+            [change, REPUTATION_MIN, REPUTATION_MAX]
+        )
+
+    async def append_conversation(self, player_id: str, npc_id: str, entry: bytes) -> None:
+        async with self._pipeline(self.binary_client, transaction=False) as pipe:
+            self._queue_conversation(pipe, player_id, npc_id, entry)
+            await pipe.execute()
+
+    async def get_conversation(
+        self,
+        player_id: str,
+        npc_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[bytes]:
+        stop = -1 if limit is None else offset + limit - 1
+        return await self.binary_client.lrange(keys.conversation(player_id, npc_id), offset, stop)
+
+    async def load_chat_context(
+        self,
+        player_id: str,
+        npc_id: str,
+        history_limit: int,
+        include_npc: bool
+    ) -> Tuple[List[bytes], int, Optional[str], Optional[str]]:
+        async with self._pipeline(self.binary_client, transaction=False) as pipe:
+            pipe.lrange(keys.conversation(player_id, npc_id), 0, history_limit - 1)
+            pipe.get(keys.reputation(player_id, npc_id))
+            pipe.get(keys.summary(player_id, npc_id))
+            if include_npc:
+                pipe.get(keys.npc(npc_id))
+            results = await pipe.execute()
+        npc = _to_str(results[3]) if include_npc else None
+        reputation = int(results[1]) if results[1] else 0
+        return results[0], reputation, _to_str(results[2]), npc
+
+    async def commit_chat_turns(
+        self,
+        turns: List[ChatTurn],
+        turn_ids: Optional[List[str]] = None
+    ) -> List[Tuple[int, int]]:
+        if not turns:
+            return []
+        async with self._pipeline(self.binary_client, transaction=True) as pipe:
+            for i, (player_id, npc_id, entry, reputation_change) in enumerate(turns):
+                # Reputation, conversation and turn marker share the pair's
+                # slot, so one script updates them atomically, on a cluster too
+                script_keys = [keys.reputation(player_id, npc_id), keys.conversation(player_id, npc_id)]
+                args = [
+                    reputation_change, REPUTATION_MIN, REPUTATION_MAX,
+                    entry, CONVERSATION_MAX_ENTRIES, CONVERSATION_TTL_SECONDS
+                ]
+                if turn_ids:
+                    script_keys.append(keys.chat_turn(player_id, npc_id, turn_ids[i]))
+                    args.append(CHAT_TURN_MARKER_TTL_SECONDS)
+                await self._queue_script(pipe, self.commit_turn_script, script_keys, args)
+                self._queue_index(pipe, player_id, npc_id)
+                if turn_ids:
+                    # The count lives in the NPC's slot, so it has its own
+                    # marker there; on a cluster each step is then skipped
+                    # on retry independently of the others
+                    await self._queue_script(
+                        pipe,
+                        self.count_turn_script,
+                        [keys.npc_conversation_count(npc_id), keys.counted_turn(npc_id, turn_ids[i])],
+                        [CHAT_TURN_MARKER_TTL_SECONDS]
+                    )
+                else:
+                    pipe.incr(keys.npc_conversation_count(npc_id))
+            results = await pipe.execute()
+        # Per turn: commit script (reputation, list length, applied), 2x SADD,
+        # count script or INCR
+        return [
+            (int(results[i][0]), min(int(results[i][1]), CONVERSATION_MAX_ENTRIES))
+            for i in range(0, len(results), 4)
+        ]
+
+    async def get_summary(self, player_id: str, npc_id: str) -> Optional[str]:
+        return await self.redis_client.get(keys.summary(player_id, npc_id))
+
+    async def get_compaction_input(
+        self,
+        player_id: str,
+        npc_id: str,
+        keep_recent: int
+    ) -> Tuple[List[bytes], Optional[str]]:
+        async with self._pipeline(self.binary_client, transaction=False) as pipe:
+            pipe.lrange(keys.conversation(player_id, npc_id), keep_recent, -1)
+            pipe.get(keys.summary(player_id, npc_id))
+            messages, summary = await pipe.execute()
+        return messages, _to_str(summary)
+
+    async def store_summary(self, player_id: str, npc_id: str, summary: str, trim: int) -> None:
+        # New turns are pushed onto the head, so trimming exactly the
+        # summarized tail is safe against concurrent writes
+        async with self._pipeline(self.redis_client, transaction=True) as pipe:
+            pipe.set(keys.summary(player_id, npc_id), summary)
+            pipe.ltrim(keys.conversation(player_id, npc_id), 0, -(trim + 1))
+            await pipe.execute()
+
+    async def increment_conversation_count(self, npc_id: str) -> int:
+        return await self.redis_client.incr(keys.npc_conversation_count(npc_id))
+
+    async def get_conversation_count(self, npc_id: str) -> int:
+        count = await self.redis_client.get(keys.npc_conversation_count(npc_id))
+        return int(count) if count else 0
+
+    async def get_reputation(self, player_id: str, npc_id: str) -> int:
+        reputation = await self.redis_client.get(keys.reputation(player_id, npc_id))
+        return int(reputation) if reputation else 0
+
+    async def set_reputation(self, player_id: str, npc_id: str, reputation: int) -> None:
+        async with self._pipeline(self.redis_client, transaction=False) as pipe:
+            pipe.set(keys.reputation(player_id, npc_id), clamp_reputation(reputation))
+            self._queue_index(pipe, player_id, npc_id)
+            await pipe.execute()
+
+    async def adjust_reputations(self, changes: List[Tuple[str, str, int]]) -> List[int]:
+        if not changes:
+            return []
+        async with self._pipeline(self.redis_client, transaction=False) as pipe:
+            for player_id, npc_id, change in changes:
+                await self._queue_reputation_change(pipe, player_id, npc_id, change)
+                self._queue_index(pipe, player_id, npc_id)
+            results = await pipe.execute()
+        # Per change: reputation script, 2x SADD
+        return [int(value) for value in results[::3]]
+
+    async def acquire_lock(self, name: str, ttl: int) -> bool:
+        return bool(await self.redis_client.set(name, 1, nx=True, ex=ttl))
+
+    async def release_lock(self, name: str) -> None:
+        await self.redis_client.delete(name)
+
+    async def take_token(self, name: str, rate: float, burst: int) -> float:
+        wait_ms = await self.take_token_script(keys=[name], args=[rate, burst])
+        return int(wait_ms) / 1000
+
+    async def append_ltm(self, player_id: str, npc_id: str, record: bytes, max_entries: int, ttl: int) -> None:
+        list_key = keys.ltm(player_id, npc_id)
+        count_key = keys.ltm_count(player_id, npc_id)
+        async with self._pipeline(self.binary_client, transaction=True) as pipe:
+            pipe.rpush(list_key, record)
+            pipe.ltrim(list_key, -max_entries, -1)
+            pipe.incr(count_key)
+            pipe.expire(list_key, ttl)
+            pipe.expire(count_key, ttl)
+            self._queue_index(pipe, player_id, npc_id)
+            await pipe.execute()
+
+    async def read_ltm(self, player_id: str, npc_id: str, last: Optional[int] = None) -> Tuple[int, List[bytes]]:
+        async with self._pipeline(self.binary_client, transaction=True) as pipe:
+            pipe.get(keys.ltm_count(player_id, npc_id))
+            pipe.lrange(keys.ltm(player_id, npc_id), 0 if last is None else -last, -1)
+            count, records = await pipe.execute()
+        return int(count) if count else 0, records
+
+    async def pop_quest(self, npc_id: str) -> Tuple[Optional[str], int]:
+        key = keys.quest_pool(npc_id)
+        async with self._pipeline(self.redis_client, transaction=True) as pipe:
+            pipe.lpop(key)
+            pipe.llen(key)
+            data, remaining = await pipe.execute()
+        return data, remaining
+
+    async def push_quest(self, npc_id: str, data: str, ttl: int) -> None:
+        key = keys.quest_pool(npc_id)
+        async with self._pipeline(self.redis_client, transaction=True) as pipe:
+            pipe.rpush(key, data)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def count_quests(self, npc_id: str) -> int:
+        return await self.redis_client.llen(keys.quest_pool(npc_id))
+
+
+class MemoryStorage(StorageBackend):
+    """In-process store for single-worker deployments, tests and benchmarks
+
+    Nothing survives a restart and nothing is shared between workers, so
+    run it with one uvicorn worker. Every operation runs without yielding
+    to the event loop, which makes each one atomic.
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, ...], Any] = {}
+        self._expires: Dict[Tuple[str, ...], float] = {}
+
+    def _get(self, key: Tuple[str, ...], default: Any = None) -> Any:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            del self._expires[key]
+        return self._data.get(key, default)
+
+    def _set(self, key: Tuple[str, ...], value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = value
+        if ttl is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.monotonic() + ttl
+
+    def _delete(self, *keys: Tuple[str, ...]) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    async def get_npc(self, npc_id: str) -> Optional[str]:
+        return self._get(("npc", npc_id))
+
+    async def set_npc(self, npc_id: str, data: str) -> None:
+        self._set(("npc", npc_id), data)
+
+    async def delete_npc(self, npc_id: str) -> None:
+        self._delete(
+            ("npc", npc_id),
+            ("npc_stats", npc_id),
+            ("quest_pool", npc_id)
+        )
+        for player_id in self._data.pop(("npc_players", npc_id), set()):
+            self._delete_pair(player_id, npc_id)
+            self._data.get(("player_npcs", player_id), set()).discard(npc_id)
+
+    async def delete_player(self, player_id: str) -> None:
+        for npc_id in self._data.pop(("player_npcs", player_id), set()):
+            self._delete_pair(player_id, npc_id)
+            self._data.get(("npc_players", npc_id), set()).discard(player_id)
+
+    def _delete_pair(self, player_id: str, npc_id: str) -> None:
+        self._delete(
+            ("conversation", player_id, npc_id),
+            ("summary", player_id, npc_id),
+            ("reputation", player_id, npc_id),
+            ("ltm", player_id, npc_id),
+            ("ltm_count", player_id, npc_id)
+        )
+
+    def _index(self, player_id: str, npc_id: str) -> None:
+        self._data.setdefault(("npc_players", npc_id), set()).add(player_id)
+        self._data.setdefault(("player_npcs", player_id), set()).add(npc_id)
+
+    def _append(self, player_id: str, npc_id: str, entry: bytes) -> int:
+        key = ("conversation", player_id, npc_id)
+        entries = [entry] + self._get(key, [])[:CONVERSATION_MAX_ENTRIES - 1]
+        self._set(key, entries, CONVERSATION_TTL_SECONDS)
+        self._index(player_id, npc_id)
+        return len(entries)
+
+    def _adjust(self, player_id: str, npc_id: str, change: int) -> int:
+        key = ("reputation", player_id, npc_id)
+        value = clamp_reputation(self._get(key, 0) + change)
+        self._set(key, value)
+        self._index(player_id, npc_id)
+        return value
+
+    def _incr(self, key: Tuple[str, ...]) -> int:
+        value = self._get(key, 0) + 1
+        self._set(key, value)
+        return value
+
+    async def append_conversation(self, player_id: str, npc_id: str, entry: bytes) -> None:
+        self._append(player_id, npc_id, entry)
+
+    async def get_conversation(
+        self,
+        player_id: str,
+        npc_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[bytes]:
+        entries = self._get(("conversation", player_id, npc_id), [])
+        return entries[offset:] if limit is None else entries[offset:offset + limit]
+
+    async def load_chat_context(
+        self,
+        player_id: str,
+        npc_id: str,
+        history_limit: int,
+        include_npc: bool
+    ) -> Tuple[List[bytes], int, Optional[str], Optional[str]]:
+        return (
+            self._get(("conversation", player_id, npc_id), [])[:history_limit],
+            self._get(("reputation", player_id, npc_id), 0),
+            self._get(("summary", player_id, npc_id)),
+            self._get(("npc", npc_id)) if include_npc else None
+        )
+
+    async def commit_chat_turns(
+        self,
+        turns: List[ChatTurn],
+        turn_ids: Optional[List[str]] = None
+    ) -> List[Tuple[int, int]]:
+        # Nothing here can fail halfway, so turn ids are not needed
+        results = []
+        for player_id, npc_id, entry, reputation_change in turns:
+            reputation = self._adjust(player_id, npc_id, reputation_change)
+            length = self._append(player_id, npc_id, entry)
+            self._incr(("npc_stats", npc_id))
+            results.append((reputation, length))
+        return results
+
+    async def get_summary(self, player_id: str, npc_id: str) -> Optional[str]:
+        return self._get(("summary", player_id, npc_id))
+
+    async def get_compaction_input(
+        self,
+        player_id: str,
+        npc_id: str,
+        keep_recent: int
+    ) -> Tuple[List[bytes], Optional[str]]:
+        entries = self._get(("conversation", player_id, npc_id), [])
+        return entries[keep_recent:], self._get(("summary", player_id, npc_id))
+
+    async def store_summary(self, player_id: str, npc_id: str, summary: str, trim: int) -> None:
+        self._set(("summary", player_id, npc_id), summary)
+        key = ("conversation", player_id, npc_id)
+        entries = self._get(key)
+        if entries is not None:
+            self._data[key] = entries[:max(0, len(entries) - trim)]
+
+    async def increment_conversation_count(self, npc_id: str) -> int:
+        return self._incr(("npc_stats", npc_id))
+
+    async def get_conversation_count(self, npc_id: str) -> int:
+        return self._get(("npc_stats", npc_id), 0)
+
+    async def get_reputation(self, player_id: str, npc_id: str) -> int:
+        return self._get(("reputation", player_id, npc_id), 0)
+
+    async def set_reputation(self, player_id: str, npc_id: str, reputation: int) -> None:
+        self._set(("reputation", player_id, npc_id), clamp_reputation(reputation))
+        self._index(player_id, npc_id)
+
+    async def adjust_reputations(self, changes: List[Tuple[str, str, int]]) -> List[int]:
+        return [self._adjust(player_id, npc_id, change) for player_id, npc_id, change in changes]
+
+    async def acquire_lock(self, name: str, ttl: int) -> bool:
+        if self._get(("lock", name)) is not None:
+            return False
+        self._set(("lock", name), 1, ttl)
+        return True
+
+    async def release_lock(self, name: str) -> None:
+        self._delete(("lock", name))
+
+    async def take_token(self, name: str, rate: float, burst: int) -> float:
+        state, wait = refill_bucket(self._get(("bucket", name)), time.monotonic(), rate, burst)
+        self._set(("bucket", name), state, bucket_ttl(rate, burst))
+        return wait
+
+    async def append_ltm(self, player_id: str, npc_id: str, record: bytes, max_entries: int, ttl: int) -> None:
+        records = self._get(("ltm", player_id, npc_id), [])
+        records.append(record)
+        del records[:-max_entries]
+        self._set(("ltm", player_id, npc_id), records, ttl)
+        self._set(("ltm_count", player_id, npc_id), self._get(("ltm_count", player_id, npc_id), 0) + 1, ttl)
+        self._index(player_id, npc_id)
+
+    async def read_ltm(self, player_id: str, npc_id: str, last: Optional[int] = None) -> Tuple[int, List[bytes]]:
+        records = self._get(("ltm", player_id, npc_id), [])
+        count = self._get(("ltm_count", player_id, npc_id), 0)
+        return count, list(records if last is None else records[-last:])
+
+    async def pop_quest(self, npc_id: str) -> Tuple[Optional[str], int]:
+        quests = self._get(("quest_pool", npc_id))
+        if not quests:
+            return None, 0
+        data = quests.pop(0)
+        if not quests:
+            self._delete(("quest_pool", npc_id))
+        return data, len(quests)
+
+    async def push_quest(self, npc_id: str, data: str, ttl: int) -> None:
+        self._set(("quest_pool", npc_id), self._get(("quest_pool", npc_id), []) + [data], ttl)
+
+    async def count_quests(self, npc_id: str) -> int:
+        return len(self._get(("quest_pool", npc_id), []))
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS npcs (npc_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS npc_stats (npc_id TEXT PRIMARY KEY, conversations INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (player_id, npc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversation_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    entry BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversation_entries_by_pair ON conversation_entries (player_id, npc_id, id);
+CREATE INDEX IF NOT EXISTS conversation_entries_by_npc ON conversation_entries (npc_id);
+CREATE INDEX IF NOT EXISTS conversations_by_npc ON conversations (npc_id);
+CREATE TABLE IF NOT EXISTS summaries (
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (player_id, npc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS summaries_by_npc ON summaries (npc_id);
+CREATE TABLE IF NOT EXISTS reputations (
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (player_id, npc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reputations_by_npc ON reputations (npc_id);
+CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ltm_logs (
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (player_id, npc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ltm_logs_by_npc ON ltm_logs (npc_id);
+CREATE TABLE IF NOT EXISTS ltm_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id TEXT NOT NULL,
+    npc_id TEXT NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ltm_entries_by_pair ON ltm_entries (player_id, npc_id, id);
+CREATE INDEX IF NOT EXISTS ltm_entries_by_npc ON ltm_entries (npc_id);
+CREATE TABLE IF NOT EXISTS quest_pools (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    npc_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quest_pools_by_npc ON quest_pools (npc_id, id);
+CREATE TABLE IF NOT EXISTS quest_pool_expiry (npc_id TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS npc_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    npc_id TEXT NOT NULL
+);
+"""
+
+# Marks the end of the SQLite write queue
+_STOP = object()
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite store for single-node deployments
+
+    The database runs in WAL mode so readers never block the writer.
+    Reads use a small pool of threads with one connection each. All
+    writes go through one writer thread: operations queued while a
+    transaction is being committed are applied together in the next
+    one (group commit), each inside its own savepoint so a failing
+    operation doesn't take the rest of its batch down with it.
+
+    Workers on the same node can share the file; NPC invalidations are
+    delivered by polling a small log table.
+    """
+
+    backend = "sqlite"
+
+    # Seconds between polls of the NPC invalidation log
+    INVALIDATION_POLL_INTERVAL = 1.0
+    # Invalidation log rows kept for slow pollers
+    INVALIDATION_LOG_SIZE = 1000
+    # Seconds between sweeps of expired conversations, long-term memory, locks and quest pools
+    PURGE_INTERVAL = 3600.0
+
+    def __init__(self, path: str, max_batch: int = 100, read_threads: int = 4):
+        self.path = path
+        self.max_batch = max(1, max_batch)
+        self._read_executor = ThreadPoolExecutor(max_workers=max(1, read_threads), thread_name_prefix="sqlite-read")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.batches = 0
+        self.writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    async def start(self) -> None:
+        if self._writer_task is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._write_executor,
+            lambda: self._thread_connection().executescript(SQLITE_SCHEMA)
+        )
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+
+    async def close(self) -> None:
+        """Apply every queued write, then close the connections"""
+        if self._writer_task is not None:
+            self._queue.put_nowait(_STOP)
+            await self._writer_task
+            self._writer_task = None
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+
+    async def _read(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `operation(connection)` on a reader thread, in one snapshot"""
+        def run():
+            connection = self._thread_connection()
+            connection.execute("BEGIN")
+            try:
+                return operation(connection)
+            finally:
+                connection.execute("COMMIT")
+
+        return await asyncio.get_running_loop().run_in_executor(self._read_executor, run)
+
+    async def _write(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Queue `operation(connection)` for the next write transaction and wait for its result"""
+        if self._queue is None:
+            raise RuntimeError("SQLite storage is not started")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if _STOP in batch:
+                stopping = True
+                batch = [item for item in batch if item is not _STOP]
+            if time.time() - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = time.time()
+                batch.append((self._purge_expired, None))
+            if not batch:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    self._write_executor, self._apply_batch, [operation for operation, _ in batch]
+                )
+            except Exception as e:
+                print(f"SQLite write batch failed: {e}")
+                results = [(False, e)] * len(batch)
+            self.batches += 1
+            self.writes += len(batch)
+            for (_, future), (ok, value) in zip(batch, results):
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply_batch(self, operations: List[Callable]) -> List[Tuple[bool, Any]]:
+        connection = self._thread_connection()
+        results = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for operation in operations:
+                connection.execute("SAVEPOINT op")
+                try:
+                    results.append((True, operation(connection)))
+                except Exception as e:
+                    connection.execute("ROLLBACK TO op")
+                    results.append((False, e))
+                connection.execute("RELEASE op")
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        return results
+
+    @staticmethod
+    def _purge_expired(connection: sqlite3.Connection) -> None:
+        now = time.time()
+        connection.execute(
+            "DELETE FROM conversation_entries WHERE (player_id, npc_id) IN "
+            "(SELECT player_id, npc_id FROM conversations WHERE expires_at <= ?)",
+            (now,)
+        )
+        connection.execute("DELETE FROM conversations WHERE expires_at <= ?", (now,))
+        connection.execute(
+            "DELETE FROM ltm_entries WHERE (player_id, npc_id) IN "
+            "(SELECT player_id, npc_id FROM ltm_logs WHERE expires_at <= ?)",
+            (now,)
+        )
+        connection.execute("DELETE FROM ltm_logs WHERE expires_at <= ?", (now,))
+        connection.execute(
+            "DELETE FROM quest_pools WHERE npc_id IN (SELECT npc_id FROM quest_pool_expiry WHERE expires_at <= ?)",
+            (now,)
+        )
+        connection.execute("DELETE FROM quest_pool_expiry WHERE expires_at <= ?", (now,))
+        connection.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+        connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+
+    # NPCs
+
+    async def get_npc(self, npc_id: str) -> Optional[str]:
+        def read(connection):
+            row = connection.execute("SELECT data FROM npcs WHERE npc_id = ?", (npc_id,)).fetchone()
+            return row[0] if row else None
+
+        return await self._read(read)
+
+    async def set_npc(self, npc_id: str, data: str) -> None:
+        def write(connection):
+            connection.execute("INSERT OR REPLACE INTO npcs (npc_id, data) VALUES (?, ?)", (npc_id, data))
+
+        await self._write(write)
+
+    async def delete_npc(self, npc_id: str) -> None:
+        # Every table is indexed by npc_id, so this is one short transaction
+        def write(connection):
+            for table in (
+                "npcs", "npc_stats", "ltm_entries", "ltm_logs", "quest_pools", "quest_pool_expiry",
+                "conversation_entries", "conversations", "summaries", "reputations"
+            ):
+                connection.execute(f"DELETE FROM {table} WHERE npc_id = ?", (npc_id,))
+
+        await self._write(write)
+
+    async def delete_player(self, player_id: str) -> None:
+        def write(connection):
+            for table in (
+                "conversation_entries", "conversations", "summaries", "reputations", "ltm_entries", "ltm_logs"
+            ):
+                connection.execute(f"DELETE FROM {table} WHERE player_id = ?", (player_id,))
+
+        await self._write(write)
+
+    async def publish_npc_invalidation(self, npc_id: str) -> None:
+        def write(connection):
+            seq = connection.execute("INSERT INTO npc_invalidations (npc_id) VALUES (?)", (npc_id,)).lastrowid
+            connection.execute("DELETE FROM npc_invalidations WHERE seq <= ?", (seq - self.INVALIDATION_LOG_SIZE,))
+
+        await self._write(write)
+
+    async def listen_npc_invalidations(self, on_message: Callable[[Optional[str]], None]) -> None:
+        def latest(connection):
+            return connection.execute("SELECT COALESCE(MAX(seq), 0) FROM npc_invalidations").fetchone()[0]
+
+        last_seq = None
+        while True:
+            try:
+                if last_seq is None:
+                    last_seq = await self._read(latest)
+                    on_message(None)
+                await asyncio.sleep(self.INVALIDATION_POLL_INTERVAL)
+                rows = await self._read(lambda connection: connection.execute(
+                    "SELECT seq, npc_id FROM npc_invalidations WHERE seq > ? ORDER BY seq", (last_seq,)
+                ).fetchall())
+                if rows and rows[0][0] > last_seq + 1:
+                    # A gap means rows were pruned (or rolled back) before
+                    # this worker saw them; drop everything to be safe
+                    on_message(None)
+                for seq, npc_id in rows:
+                    on_message(npc_id)
+                    last_seq = seq
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"NPC invalidation listener error: {e}")
+                last_seq = None
+                await asyncio.sleep(1.0)
+
+    # Conversations
+
+    @staticmethod
+    def _conversation_alive(connection: sqlite3.Connection, player_id: str, npc_id: str) -> bool:
+        row = connection.execute(
+            "SELECT expires_at FROM conversations WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()
+        return row is not None and row[0] > time.time()
+
+    @classmethod
+    def _read_entries(
+        cls,
+        connection: sqlite3.Connection,
+        player_id: str,
+        npc_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[bytes]:
+        if not cls._conversation_alive(connection, player_id, npc_id):
+            return []
+        rows = connection.execute(
+            "SELECT entry FROM conversation_entries WHERE player_id = ? AND npc_id = ? "
+            "ORDER BY id DESC LIMIT ? OFFSET ?",
+            (player_id, npc_id, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @classmethod
+    def _append_entry(cls, connection: sqlite3.Connection, player_id: str, npc_id: str, entry: bytes) -> int:
+        if not cls._conversation_alive(connection, player_id, npc_id):
+            connection.execute(
+                "DELETE FROM conversation_entries WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+            )
+        connection.execute(
+            "INSERT INTO conversation_entries (player_id, npc_id, entry) VALUES (?, ?, ?)",
+            (player_id, npc_id, entry)
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO conversations (player_id, npc_id, expires_at) VALUES (?, ?, ?)",
+            (player_id, npc_id, time.time() + CONVERSATION_TTL_SECONDS)
+        )
+        # Keep the newest CONVERSATION_MAX_ENTRIES
+        connection.execute(
+            "DELETE FROM conversation_entries WHERE player_id = ? AND npc_id = ? AND id <= ("
+            "SELECT id FROM conversation_entries WHERE player_id = ? AND npc_id = ? "
+            "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (player_id, npc_id, player_id, npc_id, CONVERSATION_MAX_ENTRIES)
+        )
+        return connection.execute(
+            "SELECT COUNT(*) FROM conversation_entries WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()[0]
+
+    @staticmethod
+    def _adjust_reputation(connection: sqlite3.Connection, player_id: str, npc_id: str, change: int) -> int:
+        row = connection.execute(
+            "SELECT value FROM reputations WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()
+        value = clamp_reputation((row[0] if row else 0) + change)
+        connection.execute(
+            "INSERT OR REPLACE INTO reputations (player_id, npc_id, value) VALUES (?, ?, ?)",
+            (player_id, npc_id, value)
+        )
+        return value
+
+    @staticmethod
+    def _increment_count(connection: sqlite3.Connection, npc_id: str) -> int:
+        connection.execute(
+            "INSERT INTO npc_stats (npc_id, conversations) VALUES (?, 1) "
+            "ON CONFLICT (npc_id) DO UPDATE SET conversations = conversations + 1",
+            (npc_id,)
+        )
+        return connection.execute("SELECT conversations FROM npc_stats WHERE npc_id = ?", (npc_id,)).fetchone()[0]
+
+    @staticmethod
+    def _read_summary(connection: sqlite3.Connection, player_id: str, npc_id: str) -> Optional[str]:
+        row = connection.execute(
+            "SELECT summary FROM summaries WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _read_reputation(connection: sqlite3.Connection, player_id: str, npc_id: str) -> int:
+        row = connection.execute(
+            "SELECT value FROM reputations WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()
+        return row[0] if row else 0
+
+    async def append_conversation(self, player_id: str, npc_id: str, entry: bytes) -> None:
+        await self._write(lambda connection: self._append_entry(connection, player_id, npc_id, entry))
+
+    async def get_conversation(
+        self,
+        player_id: str,
+        npc_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[bytes]:
+        return await self._read(lambda connection: self._read_entries(connection, player_id, npc_id, limit, offset))
+
+    async def load_chat_context(
+        self,
+        player_id: str,
+        npc_id: str,
+        history_limit: int,
+        include_npc: bool
+    ) -> Tuple[List[bytes], int, Optional[str], Optional[str]]:
+        def read(connection):
+            npc = None
+            if include_npc:
+                row = connection.execute("SELECT data FROM npcs WHERE npc_id = ?", (npc_id,)).fetchone()
+                npc = row[0] if row else None
+            return (
+                self._read_entries(connection, player_id, npc_id, history_limit),
+                self._read_reputation(connection, player_id, npc_id),
+                self._read_summary(connection, player_id, npc_id),
+                npc
+            )
+
+        return await self._read(read)
+
+    async def commit_chat_turns(
+        self,
+        turns: List[ChatTurn],
+        turn_ids: Optional[List[str]] = None
+    ) -> List[Tuple[int, int]]:
+        # A failed transaction is rolled back whole, so turn ids are not needed
+        if not turns:
+            return []
+
+        def write(connection):
+            results = []
+            for player_id, npc_id, entry, reputation_change in turns:
+                reputation = self._adjust_reputation(connection, player_id, npc_id, reputation_change)
+                length = self._append_entry(connection, player_id, npc_id, entry)
+                self._increment_count(connection, npc_id)
+                results.append((reputation, length))
+            return results
+
+        return await self._write(write)
+
+    async def get_summary(self, player_id: str, npc_id: str) -> Optional[str]:
+        return await self._read(lambda connection: self._read_summary(connection, player_id, npc_id))
+
+    async def get_compaction_input(
+        self,
+        player_id: str,
+        npc_id: str,
+        keep_recent: int
+    ) -> Tuple[List[bytes], Optional[str]]:
+        return await self._read(lambda connection: (
+            self._read_entries(connection, player_id, npc_id, offset=keep_recent),
+            self._read_summary(connection, player_id, npc_id)
+        ))
+
+    async def store_summary(self, player_id: str, npc_id: str, summary: str, trim: int) -> None:
+        def write(connection):
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries (player_id, npc_id, summary) VALUES (?, ?, ?)",
+                (player_id, npc_id, summary)
+            )
+            # Newest entries have the highest ids, so only the summarized tail goes
+            connection.execute(
+                "DELETE FROM conversation_entries WHERE id IN ("
+                "SELECT id FROM conversation_entries WHERE player_id = ? AND npc_id = ? ORDER BY id LIMIT ?)",
+                (player_id, npc_id, trim)
+            )
+
+        await self._write(write)
+
+    # Counters and reputation
+
+    async def increment_conversation_count(self, npc_id: str) -> int:
+        return await self._write(lambda connection: self._increment_count(connection, npc_id))
+
+    async def get_conversation_count(self, npc_id: str) -> int:
+        def read(connection):
+            row = connection.execute("SELECT conversations FROM npc_stats WHERE npc_id = ?", (npc_id,)).fetchone()
+            return row[0] if row else 0
+
+        return await self._read(read)
+
+    async def get_reputation(self, player_id: str, npc_id: str) -> int:
+        return await self._read(lambda connection: self._read_reputation(connection, player_id, npc_id))
+
+    async def set_reputation(self, player_id: str, npc_id: str, reputation: int) -> None:
+        def write(connection):
+            connection.execute(
+                "INSERT OR REPLACE INTO reputations (player_id, npc_id, value) VALUES (?, ?, ?)",
+                (player_id, npc_id, clamp_reputation(reputation))
+            )
+
+        await self._write(write)
+
+    async def adjust_reputations(self, changes: List[Tuple[str, str, int]]) -> List[int]:
+        if not changes:
+            return []
+        return await self._write(lambda connection: [
+            self._adjust_reputation(connection, player_id, npc_id, change)
+            for player_id, npc_id, change in changes
+        ])
+
+    # Locks
+
+    async def acquire_lock(self, name: str, ttl: int) -> bool:
+        def write(connection):
+            now = time.time()
+            connection.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO locks (name, expires_at) VALUES (?, ?)", (name, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+        return await self._write(write)
+
+    async def release_lock(self, name: str) -> None:
+        def write(connection):
+            connection.execute("DELETE FROM locks WHERE name = ?", (name,))
+
+        await self._write(write)
+
+    # Rate limits
+
+    async def take_token(self, name: str, rate: float, burst: int) -> float:
+        # Runs in the writer's transaction, so workers sharing the file see one bucket
+        def write(connection):
+            now = time.time()
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (name,)
+            ).fetchone()
+            (tokens, updated_at), wait = refill_bucket(row, now, rate, burst)
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (name, tokens, updated_at, now + bucket_ttl(rate, burst))
+            )
+            return wait
+
+        return await self._write(write)
+
+    # Long-term memory log
+
+    @staticmethod
+    def _ltm_count(connection: sqlite3.Connection, player_id: str, npc_id: str) -> int:
+        """Records ever appended to a pair's log; 0 once the log has expired"""
+        row = connection.execute(
+            "SELECT count, expires_at FROM ltm_logs WHERE player_id = ? AND npc_id = ?", (player_id, npc_id)
+        ).fetchone()
+        return row[0] if row is not None and row[1] > time.time() else 0
+
+    async def append_ltm(self, player_id: str, npc_id: str, record: bytes, max_entries: int, ttl: int) -> None:
+        def write(connection):
+            count = self._ltm_count(connection, player_id, npc_id)
+            if not count:
+                connection.execute("DELETE FROM ltm_entries WHERE player_id = ? AND npc_id = ?", (player_id, npc_id))
+            connection.execute(
+                "INSERT INTO ltm_entries (player_id, npc_id, record) VALUES (?, ?, ?)", (player_id, npc_id, record)
+            )
+            connection.execute(
+                "DELETE FROM ltm_entries WHERE player_id = ? AND npc_id = ? AND id <= ("
+                "SELECT id FROM ltm_entries WHERE player_id = ? AND npc_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (player_id, npc_id, player_id, npc_id, max_entries)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO ltm_logs (player_id, npc_id, count, expires_at) VALUES (?, ?, ?, ?)",
+                (player_id, npc_id, count + 1, time.time() + ttl)
+            )
+
+        await self._write(write)
+
+    async def read_ltm(self, player_id: str, npc_id: str, last: Optional[int] = None) -> Tuple[int, List[bytes]]:
+        def read(connection):
+            count = self._ltm_count(connection, player_id, npc_id)
+            if not count:
+                return 0, []
+            rows = connection.execute(
+                "SELECT record FROM ltm_entries WHERE player_id = ? AND npc_id = ? ORDER BY id DESC LIMIT ?",
+                (player_id, npc_id, -1 if last is None else last)
+            ).fetchall()
+            return count, [record for record, in reversed(rows)]
+
+        return await self._read(read)
+
+    # Quest pools
+
+    @staticmethod
+    def _quest_pool_alive(connection: sqlite3.Connection, npc_id: str) -> bool:
+        row = connection.execute("SELECT expires_at FROM quest_pool_expiry WHERE npc_id = ?", (npc_id,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    async def pop_quest(self, npc_id: str) -> Tuple[Optional[str], int]:
+        def write(connection):
+            if not self._quest_pool_alive(connection, npc_id):
+                connection.execute("DELETE FROM quest_pools WHERE npc_id = ?", (npc_id,))
+                return None, 0
+            row = connection.execute(
+                "SELECT id, data FROM quest_pools WHERE npc_id = ? ORDER BY id LIMIT 1", (npc_id,)
+            ).fetchone()
+            if row is None:
+                return None, 0
+            connection.execute("DELETE FROM quest_pools WHERE id = ?", (row[0],))
+            remaining = connection.execute(
+                "SELECT COUNT(*) FROM quest_pools WHERE npc_id = ?", (npc_id,)
+            ).fetchone()[0]
+            return row[1], remaining
+
+        return await self._write(write)
+
+    async def push_quest(self, npc_id: str, data: str, ttl: int) -> None:
+        def write(connection):
+            if not self._quest_pool_alive(connection, npc_id):
+                connection.execute("DELETE FROM quest_pools WHERE npc_id = ?", (npc_id,))
+            connection.execute("INSERT INTO quest_pools (npc_id, data) VALUES (?, ?)", (npc_id, data))
+            connection.execute(
+                "INSERT OR REPLACE INTO quest_pool_expiry (npc_id, expires_at) VALUES (?, ?)",
+                (npc_id, time.time() + ttl)
+            )
+
+        await self._write(write)
+
+    async def count_quests(self, npc_id: str) -> int:
+        def read(connection):
+            if not self._quest_pool_alive(connection, npc_id):
+                return 0
+            return connection.execute("SELECT COUNT(*) FROM quest_pools WHERE npc_id = ?", (npc_id,)).fetchone()[0]
+
+        return await self._read(read)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "write_batches": self.batches,
+            "writes": self.writes,
+            "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0.0
+        }
+
+
+def create_storage_backend(settings) -> StorageBackend:
+    """Build the storage backend selected in Settings"""
+    if settings.storage_backend == "redis":
+        return RedisStorage(settings)
+    if settings.storage_backend == "memory":
+        return MemoryStorage()
+    if settings.storage_backend == "sqlite":
+        return SQLiteStorage(
+            settings.sqlite_path,
+            max_batch=settings.sqlite_max_batch,
+            read_threads=settings.sqlite_read_threads
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND '{settings.storage_backend}' (use redis, memory or sqlite)")
@@ -0,0 +1,43 @@
+import math
+from typing import Dict, List
+
+
+# Chat formats add a few tokens of framing per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Rough average for English text with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+# Typical stored exchange: a short player line and a few sentences of
+# reply, plus framing; the starting point before real turns are seen
+TYPICAL_TURN_TOKENS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate for a piece of text, no tokenizer required"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_turn_tokens(entry: Dict[str, str]) -> int:
+    """Estimated prompt tokens for one stored player/NPC exchange"""
+    return (
+        estimate_tokens(entry.get("player_message", ""))
+        + estimate_tokens(entry.get("npc_response", ""))
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+def pack_history(conversation_history: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """Keep the most recent exchanges that fit within a token budget
+
+    Expects and returns history newest-first, as stored in Redis.
+    """
+    packed = []
+    used = 0
+    for entry in conversation_history:
+        cost = estimate_turn_tokens(entry)
+        if used + cost > budget:
+            break
+        packed.append(entry)
+        used += cost
+    return packed
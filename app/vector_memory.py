@@ -0,0 +1,287 @@
+import asyncio
+import re
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.codec import decode_entries, encode_entry
+from app.models import MemoryEntry
+
+
+_TOKEN = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by do for from had has have he her his i if in is it its "
+    "me my no not of on or our she so that the their them they this to was we were what "
+    "when where which who will with you your".split()
+)
+
+
+class HashingEmbedder:
+    """CPU-only text embedder using the hashing trick
+
+    Words and word bigrams are hashed (crc32, stable across processes)
+    into a fixed number of signed buckets and the result is L2-normalized,
+    so cosine similarity is a plain dot product. No model files needed.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        tokens = [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into an (n, dim) float32 matrix of unit vectors"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += -1.0 if h & 0x80000000 else 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class VectorIndex:
+    """Append-only in-process vector index for one player-NPC pair
+
+    Rows are stored in a float32 buffer that doubles as it fills, up to
+    `capacity` rows. Once full, the oldest rows are dropped to make room.
+    """
+
+    def __init__(self, dim: int, capacity: int = 2000):
+        self.dim = dim
+        self.capacity = max(1, capacity)
+        self._vectors = np.zeros((min(64, self.capacity), dim), dtype=np.float32)
+        self.entries: List[MemoryEntry] = []
+        # Total records ever appended to the backing store and the newest
+        # of them, used for syncing
+        self.total = 0
+        self.last_record: Optional[bytes] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, vectors: np.ndarray, entries: Sequence[MemoryEntry]) -> None:
+        """Append a batch of rows"""
+        entries = list(entries)
+        if len(entries) > self.capacity:
+            vectors, entries = vectors[-self.capacity:], entries[-self.capacity:]
+
+        size = len(self.entries)
+        overflow = size + len(entries) - self.capacity
+        if overflow > 0:
+            # Drop a little extra so trimming doesn't happen on every append
+            drop = min(size, overflow + self.capacity // 10)
+            size -= drop
+            self._vectors[:size] = self._vectors[drop:drop + size]
+            del self.entries[:drop]
+
+        needed = size + len(entries)
+        if needed > len(self._vectors):
+            new_size = min(self.capacity, max(needed, 2 * len(self._vectors)))
+            self._vectors = np.resize(self._vectors, (new_size, self.dim))
+        self._vectors[size:needed] = vectors
+        self.entries.extend(entries)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        min_score: float = 0.0
+    ) -> List[List[Tuple[float, MemoryEntry]]]:
+        """Batched top-k cosine search; one result list per query row"""
+        size = len(self.entries)
+        if size == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self._vectors[:size].T
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                (float(scores[row, i]), self.entries[i])
+                for i in ordered
+                if scores[row, i] >= min_score
+            ])
+        return results
+
+
+class LongTermMemory:
+    """Relevance-based long-term memory of each player-NPC relationship
+
+    Exchanges are appended to a log per player-NPC pair in the storage
+    backend (in Redis, the list `ltm:{player_id:npc_id}` capped at
+    `max_entries`, with a running counter), encoded like conversation
+    entries. The log expires `ttl` seconds after the pair's last exchange.
+    Each worker keeps a VectorIndex for the pairs it served most recently,
+    at most `max_cached_entries` exchanges across all of them. A sync reads
+    the counter and the newest record, and the records appended since the
+    last sync only when there are any.
+    """
+
+    def __init__(
+        self,
+        storage,
+        dim: int = 256,
+        max_entries: int = 2000,
+        ttl: int = 2592000,
+        max_cached_entries: int = 20000,
+        top_k: int = 3,
+        min_score: float = 0.2,
+        compress_threshold: int = 512
+    ):
+        self.storage = storage
+        self.embedder = HashingEmbedder(dim)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_cached_entries = max_cached_entries
+        self.top_k = top_k
+        self.min_score = min_score
+        self.compress_threshold = compress_threshold
+        self._indexes: "OrderedDict[Tuple[str, str], VectorIndex]" = OrderedDict()
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # Rows held across all indexes
+        self.cached_entries = 0
+
+    async def add(self, player_id: str, npc_id: str, player_message: str, npc_response: str) -> bool:
+        """Record an exchange in the pair's long-term memory"""
+        entry = MemoryEntry(
+            timestamp=datetime.now().isoformat(),
+            player_message=player_message,
+            npc_response=npc_response
+        )
+        record = encode_entry(entry, self.compress_threshold)
+        try:
+            await self.storage.append_ltm(player_id, npc_id, record, self.max_entries, self.ttl)
+            return True
+        except Exception as e:
+            print(f"Error storing long-term memory: {e}")
+            return False
+
+    def _new_index(self) -> VectorIndex:
+        return VectorIndex(self.embedder.dim, capacity=min(self.max_entries, self.max_cached_entries))
+
+    def _keep(self, key: Tuple[str, str], index: VectorIndex, previous_size: int) -> None:
+        """Make `index` the most recently used, then evict the least recently
+        used others until the worker is back within its entry budget"""
+        self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        self.cached_entries += len(index) - previous_size
+        while self.cached_entries > self.max_cached_entries and len(self._indexes) > 1:
+            evicted, evicted_index = self._indexes.popitem(last=False)
+            self.cached_entries -= len(evicted_index)
+            self._locks.pop(evicted, None)
+
+    def _append_records(self, index: VectorIndex, records: Iterable[bytes]) -> None:
+        entries = decode_entries(records)
+        if entries:
+            texts = [f"{entry.player_message}\n{entry.npc_response}" for entry in entries]
+            index.add(self.embedder.embed(texts), entries)
+
+    async def _sync(self, player_id: str, npc_id: str) -> VectorIndex:
+        """Bring this worker's index of the pair up to date with the storage backend"""
+        key = (player_id, npc_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(key)
+            previous_size = len(index) if index is not None else 0
+            # Usually nothing changed: the counter and newest record tell
+            count, newest = await self.storage.read_ltm(player_id, npc_id, 1)
+            if index is not None and count == index.total and (newest or [None])[-1] == index.last_record:
+                self._keep(key, index, previous_size)
+                return index
+
+            tail = None
+            if index is not None and count > index.total:
+                # Read just the new records and the one before them, which
+                # must be the last one indexed: a log that was deleted (or
+                # expired) and written again can reach any count with
+                # different records
+                count, tail = await self.storage.read_ltm(player_id, npc_id, count - index.total + 1)
+                new = count - index.total
+                if 0 < new < len(tail) and tail[-new - 1] == index.last_record:
+                    self._append_records(index, tail[-new:])
+                else:
+                    tail = None
+            if tail is None:
+                # First load, or the log expired, was deleted or was trimmed
+                # past what this worker has indexed
+                index = self._new_index()
+                count, tail = await self.storage.read_ltm(player_id, npc_id, index.capacity)
+                self._append_records(index, tail)
+            index.total = count
+            index.last_record = tail[-1] if tail else None
+            self._keep(key, index, previous_size)
+            return index
+
+    async def search(
+        self,
+        player_id: str,
+        npc_id: str,
+        query: str,
+        k: Optional[int] = None,
+        exclude: Iterable[MemoryEntry] = ()
+    ) -> List[MemoryEntry]:
+        """Most relevant past exchanges between this player and NPC, skipping
+        any already present in `exclude` (e.g. the recent history window)"""
+        exclude = {(entry.player_message, entry.npc_response) for entry in exclude}
+        k = self.top_k if k is None else k
+        try:
+            index = await self._sync(player_id, npc_id)
+        except Exception as e:
+            print(f"Error syncing long-term memory: {e}")
+            return []
+
+        matches = index.search(
+            self.embedder.embed([query]),
+            k + len(exclude),
+            min_score=self.min_score
+        )[0]
+        return [
+            entry for _, entry in matches
+            if (entry.player_message, entry.npc_response) not in exclude
+        ][:k]
+
+    async def search_batch(
+        self,
+        player_id: str,
+        npc_id: str,
+        queries: Sequence[str],
+        k: Optional[int] = None
+    ) -> List[List[Tuple[float, MemoryEntry]]]:
+        """Top-k (score, entry) matches for many queries against one pair in one pass"""
+        index = await self._sync(player_id, npc_id)
+        return index.search(
+            self.embedder.embed(queries),
+            self.top_k if k is None else k,
+            min_score=self.min_score
+        )
+
+    def forget(self, npc_id: str) -> None:
+        """Drop this worker's indexes of every player's relationship with an NPC"""
+        self._drop([key for key in self._indexes if key[1] == npc_id])
+
+    def forget_player(self, player_id: str) -> None:
+        """Drop this worker's indexes of a player's relationships with every NPC"""
+        self._drop([key for key in self._indexes if key[0] == player_id])
+
+    def _drop(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        # Other workers notice the deleted logs on their next sync
+        for key in pairs:
+            self.cached_entries -= len(self._indexes.pop(key))
+            self._locks.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {
+            "indexes": len(self._indexes),
+            "cached_entries": self.cached_entries,
+            "max_cached_entries": self.max_cached_entries
+        }
@@ -0,0 +1,196 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app import metrics
+from app.models import MemoryEntry
+
+
+# (player_id, npc_id, player_message, npc_response, commit result), for committed turns
+CommitCallback = Callable[[str, str, str, str, Optional[Tuple[int, int]]], Awaitable[None]]
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Persist chat turns in the background instead of on the request path
+
+    Turns are queued in-process and a consumer task applies them in
+    batches, one MULTI/EXEC per batch. Each turn carries an id, so a batch
+    whose commit failed (possibly after reaching the store) can be retried
+    without applying its turns twice. A batch that keeps failing is retried
+    one turn at a time, and only the turns that still fail are dropped.
+    Each player-NPC pair remembers its latest pending write so the next
+    turn of that pair can wait for it (read-your-writes within this
+    worker). `close()` drains everything still queued.
+    """
+
+    def __init__(
+        self,
+        memory_manager,
+        max_batch: int = 100,
+        flush_interval: float = 0.005,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+        on_commit: Optional[CommitCallback] = None
+    ):
+        self.memory_manager = memory_manager
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.on_commit = on_commit
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.committed = 0
+        self.batches = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """Start the consumer (called from the app lifespan)"""
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._consume())
+
+    async def close(self) -> None:
+        """Apply every queued turn, then stop the consumer"""
+        if self._task is None:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(
+        self,
+        player_id: str,
+        npc_id: str,
+        player_message: str,
+        npc_response: str,
+        reputation_change: int,
+        context: Dict[str, str] = None
+    ) -> None:
+        """Queue a chat turn; only waits when the queue is full"""
+        memory_entry = MemoryEntry(
+            timestamp=datetime.now().isoformat(),
+            player_message=player_message,
+            npc_response=npc_response,
+            context=context or {}
+        )
+        turn = (player_id, npc_id, memory_entry, reputation_change)
+        turn_id = uuid.uuid4().hex
+
+        if self._task is None or self._closing:
+            # Not running (or shutting down): write through
+            await self._apply([(turn, turn_id, None)])
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        self._pending[(player_id, npc_id)] = done
+        await self._queue.put((turn, turn_id, done))
+
+    async def wait_for(self, player_id: str, npc_id: str) -> None:
+        """Wait until every queued turn for this pair has been persisted"""
+        done = self._pending.get((player_id, npc_id))
+        if done is not None:
+            await asyncio.shield(done)
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._apply(batch)
+
+        # Turns that were waiting on a full queue when close() was called
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            await self._apply(leftovers)
+
+    async def _commit(self, turns: List[Tuple], turn_ids: List[str], retries: int) -> Optional[List[Tuple[int, int]]]:
+        """Commit turns, retrying transient failures; None if they still fail"""
+        for attempt in range(retries + 1):
+            try:
+                return await self.memory_manager.commit_chat_turns(turns, turn_ids)
+            except Exception as e:
+                if attempt == retries:
+                    print(f"Error persisting {len(turns)} chat turns: {e}")
+                    return None
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def _apply(self, batch: List[Tuple[Tuple, str, Optional[asyncio.Future]]]) -> None:
+        """Commit a batch, retrying transient failures, then release waiters"""
+        turns = [turn for turn, _, _ in batch]
+        turn_ids = [turn_id for _, turn_id, _ in batch]
+        start = time.perf_counter()
+        results = await self._commit(turns, turn_ids, self.max_retries)
+        if results is None:
+            # Don't let one bad turn sink the others: retry them one at a
+            # time (once each, so an outage doesn't stall the queue for
+            # long); those the batch already committed are skipped by id
+            results = []
+            for turn, turn_id in zip(turns, turn_ids):
+                result = await self._commit([turn], [turn_id], retries=1) if len(turns) > 1 else None
+                results.append(result[0] if result else None)
+        dropped = results.count(None)
+        if dropped:
+            print(f"Dropping {dropped} chat turns that could not be persisted")
+        self.committed += len(turns) - dropped
+        self.failed += dropped
+        self.batches += 1
+        metrics.observe_stage("write_behind_flush", time.perf_counter() - start)
+
+        if self.on_commit is not None:
+            outcomes = await asyncio.gather(
+                *(
+                    self.on_commit(player_id, npc_id, entry.player_message, entry.npc_response, result)
+                    for (player_id, npc_id, entry, _), result in zip(turns, results)
+                    if result is not None
+                ),
+                return_exceptions=True
+            )
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    print(f"Error in write-behind commit callback: {outcome}")
+
+        for (player_id, npc_id, _, _), (_, _, done) in zip(turns, batch):
+            if done is None:
+                continue
+            done.set_result(None)
+            if self._pending.get((player_id, npc_id)) is done:
+                del self._pending[(player_id, npc_id)]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "pending_pairs": len(self._pending),
+            "committed": self.committed,
+            "batches": self.batches,
+            "failed": self.failed
+        }
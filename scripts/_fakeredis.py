@@ -0,0 +1,26 @@
+"""
+Helper: In-process Redis for the check and benchmark scripts
+Location: scripts/_fakeredis.py
+"""
+import sys
+
+
+def install_fakeredis() -> None:
+    """Make every redis.asyncio.Redis client in this process talk to one in-process fakeredis server"""
+    try:
+        import fakeredis
+    except ImportError:
+        print('fakeredis is not installed; pip install "fakeredis[lua]" or pass --redis-host')
+        sys.exit(2)
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+
+    class _FakeRedis(fakeredis.FakeAsyncRedis):
+        # RedisStorage builds clients from pools; keep each pool's decoding mode
+        def __init__(self, *args, connection_pool=None, **kwargs):
+            if connection_pool is not None:
+                kwargs["decode_responses"] = connection_pool.connection_kwargs.get("decode_responses", False)
+            super().__init__(server=server, decode_responses=kwargs.get("decode_responses", False))
+
+    redis.asyncio.Redis = _FakeRedis
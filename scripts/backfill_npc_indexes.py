@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Script: Backfill the player-NPC index sets
+Location: scripts/backfill_npc_indexes.py
+
+The Redis backend keeps `npc_players:{npc_id}` and `player_npcs:{player_id}`
+sets up to date on every write, and deleting an NPC or player only cascades
+to the pairs found there. Data written before the indexes existed is not in
+them; this walks the keys of every player-NPC pair with SCAN
+(on every node of a cluster) and adds every pair it finds. SADD is
+idempotent, so it is safe to run while the service is live and to re-run.
+Keys still in the pre-hash-tag layout are migrated first by
+scripts/migrate_key_layout.py.
+
+Pair keys are `<prefix>:{player_id:npc_id}`; ids containing ':' are split
+using the NPC ids found under `npc:*`, falling back to the last ':'.
+
+Usage:
+    python scripts/backfill_npc_indexes.py --dry-run
+    python scripts/backfill_npc_indexes.py --batch 1000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from app import keys
+from app.config import get_settings
+
+
+def split_pair(rest: str, npc_ids: set):
+    """(player_id, npc_id) from the part of a key after its prefix"""
+    parts = rest.split(":")
+    # Prefer the longest known NPC id so ids with ':' still split correctly
+    for i in range(1, len(parts)):
+        npc_id = ":".join(parts[i:])
+        if npc_id in npc_ids:
+            return ":".join(parts[:i]), npc_id
+    player_id, _, npc_id = rest.rpartition(":")
+    return player_id, npc_id
+
+
+def connect(host: str, port: int, db: int, cluster: bool):
+    """A sync client for a single node or, with `cluster`, a whole cluster"""
+    if cluster:
+        return redis.RedisCluster(host=host, port=port, decode_responses=True)
+    return redis.Redis(host=host, port=port, db=db, decode_responses=True)
+
+
+def tagged_id(key: str, prefix: str) -> str:
+    """The id inside the hash tag of `<prefix>:{id}...`"""
+    return key[len(prefix) + 2:key.rindex("}")]
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Backfill the player-NPC index sets")
+    parser.add_argument("--host", default=settings.redis_host)
+    parser.add_argument("--port", type=int, default=settings.redis_port)
+    parser.add_argument("--db", type=int, default=settings.redis_db)
+    parser.add_argument("--cluster", action="store_true", default=settings.redis_cluster,
+                        help="Connect to a Redis Cluster through --host/--port")
+    parser.add_argument("--batch", type=int, default=500, help="SCAN COUNT hint and pipeline size")
+    parser.add_argument("--dry-run", action="store_true", help="Count pairs without writing")
+    args = parser.parse_args()
+
+    client = connect(args.host, args.port, args.db, args.cluster)
+    npc_ids = {tagged_id(key, "npc") for key in client.scan_iter(match="npc:{*", count=args.batch)}
+
+    pairs = set()
+    scanned = 0
+    for prefix in keys.PAIR_KEY_PREFIXES:
+        for key in client.scan_iter(match=f"{prefix}:{{*", count=args.batch):
+            player_id, npc_id = split_pair(tagged_id(key, prefix), npc_ids)
+            if not player_id or not npc_id:
+                continue
+            pairs.add((player_id, npc_id))
+            scanned += 1
+            if scanned % 10000 == 0:
+                print(f"  {scanned} keys scanned...")
+
+    if not args.dry_run:
+        pipe = client.pipeline(transaction=False)
+        for index, (player_id, npc_id) in enumerate(pairs, 1):
+            pipe.sadd(keys.npc_players(npc_id), player_id)
+            pipe.sadd(keys.player_npcs(player_id), npc_id)
+            if index % args.batch == 0:
+                pipe.execute()
+        pipe.execute()
+
+    action = "would index" if args.dry_run else "indexed"
+    npcs = len({npc_id for _, npc_id in pairs})
+    print(f"Scanned {scanned} keys, {action} {len(pairs)} player-NPC pairs across {npcs} NPCs")
+
+
+if __name__ == "__main__":
+    main()
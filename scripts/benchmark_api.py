@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Script: Load-test and benchmark the NPC API against local stand-ins
+Location: scripts/benchmark_api.py
+
+Starts the fake LLM server (scripts/fake_llm_server.py) and the API in
+subprocesses, seeds a set of NPCs and drives a weighted mix of /chat,
+/history and /quest/generate traffic from many players with a fixed
+number of concurrent clients. Reports throughput and p50/p95/p99 latency
+per endpoint and saves the run as JSON.
+
+Redis is a real server when --redis-host is given, otherwise an
+in-process fakeredis (pip install "fakeredis[lua]") inside the API
+process. The traffic pattern is driven by --seed, so two runs with the
+same options send the same sequence of requests.
+
+Pass --baseline with an earlier results file to compare against it; the
+script exits 1 if any endpoint's p95 latency rose, or its throughput
+fell, by more than --tolerance.
+
+Usage:
+    python scripts/benchmark_api.py --duration 30 --concurrency 32 --output results.json
+    python scripts/benchmark_api.py --provider ollama --latency 0.2 --tokens-per-second 40
+    python scripts/benchmark_api.py --mix chat=0.6,history=0.3,quest=0.1 --redis-host localhost
+    python scripts/benchmark_api.py --env WRITE_BEHIND_ENABLED=true --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from _fakeredis import install_fakeredis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "scripts")
+
+ENDPOINTS = ("chat", "history", "quest")
+PERSONALITIES = ("friendly", "aggressive", "mysterious", "merchant", "wise", "comedic")
+PLAYER_MESSAGES = (
+    "Hello there!",
+    "What do you sell?",
+    "Any news from the capital?",
+    "Thank you for your help, friend.",
+    "I need a weapon for the road.",
+    "Have you seen anything strange lately?",
+    "Get out of my way.",
+    "Can you tell me about this town?"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int) -> None:
+    """Run the API in this process (the --serve child), on fakeredis unless REDIS_HOST is set"""
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    if os.environ.get("BENCHMARK_FAKEREDIS") == "true":
+        install_fakeredis()
+
+    import uvicorn
+
+    uvicorn.run("app.main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than zero")
+    return mix
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    requests = len(ordered) + errors
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0
+    }
+
+
+def _start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env)
+
+
+async def _wait_ready(client, url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before it was ready")
+        try:
+            response = await client.get(url)
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+class LoadGenerator:
+    """Closed-loop clients sending a seeded, weighted mix of requests"""
+
+    def __init__(self, client, npc_ids: List[str], players: int, mix: Dict[str, float], seed: int):
+        self.client = client
+        self.npc_ids = npc_ids
+        self.player_ids = [f"bench-player-{i}" for i in range(players)]
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.seed = seed
+        self.latencies: Dict[str, List[float]] = {name: [] for name in self.names}
+        self.errors: Dict[str, int] = {name: 0 for name in self.names}
+        self.error_samples: List[str] = []
+        self.recording = False
+
+    async def _request(self, endpoint: str, rng: random.Random):
+        player_id = rng.choice(self.player_ids)
+        npc_id = rng.choice(self.npc_ids)
+        if endpoint == "chat":
+            return await self.client.post("/chat", json={
+                "player_id": player_id,
+                "npc_id": npc_id,
+                "message": rng.choice(PLAYER_MESSAGES)
+            })
+        if endpoint == "history":
+            return await self.client.get(f"/history/{player_id}/{npc_id}", params={"limit": 20})
+        return await self.client.post("/quest/generate", json={"player_id": player_id, "npc_id": npc_id})
+
+    async def _client_loop(self, index: int, deadline: float, budget: Optional[List[int]]) -> None:
+        rng = random.Random(f"{self.seed}:{index}")
+        while time.monotonic() < deadline:
+            if budget is not None:
+                if budget[0] <= 0:
+                    return
+                budget[0] -= 1
+            endpoint = rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self._request(endpoint, rng)
+                failed = response.status_code >= 400
+                detail = f"{endpoint}: HTTP {response.status_code} {response.text[:200]}"
+            except Exception as e:
+                failed = True
+                detail = f"{endpoint}: {type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+            if not self.recording:
+                continue
+            if failed:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(detail)
+            else:
+                self.latencies[endpoint].append(elapsed)
+
+    async def run(self, concurrency: int, duration: float, requests: Optional[int], warmup: float) -> float:
+        """Run warm-up then the measured phase; returns the measured wall time"""
+        if warmup > 0:
+            await asyncio.gather(*[
+                self._client_loop(-1 - i, time.monotonic() + warmup, None) for i in range(concurrency)
+            ])
+        self.recording = True
+        budget = [requests] if requests else None
+        deadline = time.monotonic() + (duration if not requests else float("inf"))
+        start = time.perf_counter()
+        await asyncio.gather(*[self._client_loop(i, deadline, budget) for i in range(concurrency)])
+        return time.perf_counter() - start
+
+    def results(self, elapsed: float) -> Dict:
+        endpoints = {
+            name: _summarize(self.latencies[name], self.errors[name], elapsed)
+            for name in self.names
+        }
+        everything = [latency for name in self.names for latency in self.latencies[name]]
+        overall = _summarize(everything, sum(self.errors.values()), elapsed)
+        return {"overall": overall, "endpoints": endpoints, "error_samples": self.error_samples}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of this run against a baseline results file"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        before = baseline.get("results", {}).get("endpoints", {}).get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if before["throughput_rps"] and current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def _print_report(run: Dict) -> None:
+    results = run["results"]
+    print(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(results["endpoints"].items()) + [("overall", results["overall"])]
+    for name, row in rows:
+        print(f"{name:<10} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}")
+    for sample in results["error_samples"]:
+        print(f"  error: {sample}")
+
+
+async def _benchmark(args, mix: Dict[str, float]) -> Dict:
+    import httpx
+
+    env = dict(os.environ)
+    env.update({"PYTHONUNBUFFERED": "1", "DEMO_MODE": "false"})
+    processes = []
+    fake_port = None
+    if args.provider == "demo":
+        env["DEMO_MODE"] = "true"
+    else:
+        fake_port = _free_port()
+        fake_args = [os.path.join(SCRIPTS, "fake_llm_server.py"), "--port", str(fake_port),
+                     "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+                     "--log-level", "warning"]
+        processes.append(_start_process(fake_args, env))
+        if args.provider == "ollama":
+            env.update({"USE_OLLAMA": "true", "OLLAMA_BASE_URL": f"http://127.0.0.1:{fake_port}"})
+        else:
+            env.update({
+                "USE_OLLAMA": "false",
+                "OPENAI_API_KEY": "fake",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1"
+            })
+    if args.redis_host:
+        env.update({
+            "REDIS_HOST": args.redis_host,
+            "REDIS_PORT": str(args.redis_port),
+            "REDIS_DB": str(args.redis_db),
+            "BENCHMARK_FAKEREDIS": "false"
+        })
+    else:
+        env["BENCHMARK_FAKEREDIS"] = "true"
+    for override in args.env:
+        key, _, value = override.partition("=")
+        env[key] = value
+
+    app_port = _free_port()
+    app_process = _start_process([os.path.abspath(__file__), "--serve", str(app_port)], env)
+    processes.append(app_process)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=args.timeout
+        ) as client:
+            if fake_port is not None:
+                await _wait_ready(client, f"http://127.0.0.1:{fake_port}/stats", processes[0])
+            await _wait_ready(client, "/", app_process)
+
+            # Fresh NPC ids per run keep repeated runs against a real Redis independent
+            run_id = uuid.uuid4().hex[:8]
+            npc_ids = [f"bench-{run_id}-npc-{i}" for i in range(args.npcs)]
+            for i, npc_id in enumerate(npc_ids):
+                response = await client.post("/npc", json={
+                    "npc_id": npc_id,
+                    "name": f"Bench NPC {i}",
+                    "personality": PERSONALITIES[i % len(PERSONALITIES)],
+                    "background": "A villager who answers travelers' questions all day.",
+                    "location": "Benchmark Square"
+                })
+                response.raise_for_status()
+
+            generator = LoadGenerator(client, npc_ids, args.players, mix, args.seed)
+            elapsed = await generator.run(args.concurrency, args.duration, args.requests, args.warmup)
+            results = generator.results(elapsed)
+
+            cache_stats = (await client.get("/stats/cache")).json()
+            llm_stats = None
+            if fake_port is not None:
+                llm_stats = (await client.get(f"http://127.0.0.1:{fake_port}/stats")).json()
+
+            if not args.keep_data:
+                for npc_id in npc_ids:
+                    await client.delete(f"/npc/{npc_id}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "provider": args.provider,
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "redis": f"{args.redis_host}:{args.redis_port}/{args.redis_db}" if args.redis_host else "fakeredis",
+            "mix": mix,
+            "npcs": args.npcs,
+            "players": args.players,
+            "concurrency": args.concurrency,
+            "duration": None if args.requests else args.duration,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "env": args.env
+        },
+        "environment": {
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "results": results,
+        "cache_stats": cache_stats,
+        "llm_stats": llm_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the NPC API against local stand-ins")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--provider", choices=("openai", "ollama", "demo"), default="openai",
+                        help="Fake LLM flavour to run against; demo skips the LLM entirely")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake LLM token rate")
+    parser.add_argument("--redis-host", help="Use this Redis instead of fakeredis")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=0)
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("chat=0.7,history=0.2,quest=0.1"),
+                        help="Endpoint weights, e.g. chat=0.7,history=0.2,quest=0.1")
+    parser.add_argument("--npcs", type=int, default=20)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests instead of --duration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of unmeasured traffic first")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the API process (repeatable)")
+    parser.add_argument("--keep-data", action="store_true", help="Don't delete the benchmark NPCs afterwards")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative p95/throughput regression against --baseline")
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args.serve)
+        return
+
+    run = asyncio.run(_benchmark(args, args.mix))
+    _print_report(run)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(run["results"], baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Script: Compare conversation entry storage formats
+Location: scripts/benchmark_conversation_encoding.py
+
+Builds a synthetic conversation list and reports, per format, the encoded
+payload size and the time to decode a full history read:
+
+  json            legacy pydantic JSON, json.loads + model validation
+  msgpack         versioned msgpack, trusted fast path (no validation)
+  msgpack+valid   versioned msgpack with full validation
+
+With --redis, each list is also written to Redis and MEMORY USAGE is
+reported, which includes per-element and list encoding overhead.
+
+Usage:
+    python scripts/benchmark_conversation_encoding.py --entries 50 --rounds 2000
+    python scripts/benchmark_conversation_encoding.py --redis --host localhost
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.codec import decode_entry, encode_entry, encode_entry_json
+from app.models import MemoryEntry
+
+
+WORDS = (
+    "the traveler asked about the old mine north of town where the dwarves "
+    "once worked iron and silver before the dragon came and the roads closed "
+    "merchant coin sword shield potion quest reward village guard captain"
+).split()
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + "."
+
+
+def make_entries(count: int, long_ratio: float, seed: int = 7):
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=3)
+    entries = []
+    for i in range(count):
+        long_reply = rng.random() < long_ratio
+        entries.append(MemoryEntry(
+            timestamp=(start + timedelta(minutes=i)).isoformat(),
+            player_message=_sentence(rng, 4, 20),
+            npc_response=_sentence(rng, 60, 160) if long_reply else _sentence(rng, 10, 40),
+            context={"reputation": str(rng.randint(-100, 100))}
+        ))
+    return entries
+
+
+def time_decode(encoded, decode, rounds: int, repeats: int = 5) -> float:
+    """Best-of-`repeats` microseconds to decode the whole list once"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for raw in encoded:
+                decode(raw)
+        best = min(best, (time.perf_counter() - start) / rounds)
+    return best * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare conversation entry storage formats")
+    parser.add_argument("--entries", type=int, default=50, help="Entries per conversation list")
+    parser.add_argument("--long-ratio", type=float, default=0.2, help="Share of long NPC replies")
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--compress-threshold", type=int, default=512)
+    parser.add_argument("--redis", action="store_true", help="Also measure MEMORY USAGE in Redis")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries, args.long_ratio)
+    formats = {
+        "json": (
+            [encode_entry_json(entry) for entry in entries],
+            decode_entry
+        ),
+        "msgpack": (
+            [encode_entry(entry, args.compress_threshold) for entry in entries],
+            decode_entry
+        ),
+        "msgpack+valid": (
+            [encode_entry(entry, args.compress_threshold) for entry in entries],
+            lambda raw: decode_entry(raw, validate=True)
+        ),
+    }
+
+    client = None
+    if args.redis:
+        import redis
+        client = redis.Redis(host=args.host, port=args.port)
+
+    baseline_bytes = baseline_us = None
+    print(f"{args.entries} entries per list, {args.rounds} rounds")
+    print(f"{'format':<15}{'payload B':>12}{'size':>8}{'decode us':>12}{'speedup':>9}{'redis B':>10}")
+    for name, (encoded, decode) in formats.items():
+        size = sum(len(raw) for raw in encoded)
+        decode_us = time_decode(encoded, decode, args.rounds)
+        baseline_bytes = baseline_bytes or size
+        baseline_us = baseline_us or decode_us
+
+        redis_bytes = "-"
+        if client is not None:
+            key = f"bench:conversation:{name}"
+            client.delete(key)
+            client.rpush(key, *encoded)
+            redis_bytes = str(client.memory_usage(key, samples=0))
+            client.delete(key)
+
+        print(
+            f"{name:<15}{size:>12}{size / baseline_bytes:>8.0%}"
+            f"{decode_us:>12.1f}{baseline_us / decode_us:>8.1f}x{redis_bytes:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Script: Benchmark the storage backends on the chat hot path
+Location: scripts/benchmark_storage_backends.py
+
+Drives the same seeded workload through every StorageBackend: committing
+chat turns, loading chat context, reading history, adjusting reputation
+and reading NPC definitions, from many concurrent tasks. Prints
+throughput and p50/p95/p99 latency per operation and backend, and can
+save the results as JSON.
+
+Redis is an in-process fakeredis unless --redis-host is given, so its
+numbers only mean something against a real server.
+
+Usage:
+    python scripts/benchmark_storage_backends.py
+    python scripts/benchmark_storage_backends.py --backends sqlite,memory --ops 20000 --concurrency 64
+    python scripts/benchmark_storage_backends.py --redis-host localhost --output storage.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _fakeredis import install_fakeredis
+from benchmark_api import percentile
+from check_storage_backends import BACKENDS, build_backend
+
+OPERATIONS = ("commit_turn", "load_context", "history", "reputation", "get_npc")
+
+
+async def _seed(storage, npcs: int) -> None:
+    for i in range(npcs):
+        await storage.set_npc(f"bench-npc-{i}", json.dumps({"npc_id": f"bench-npc-{i}", "name": f"NPC {i}"}))
+
+
+async def _operation(storage, name: str, rng: random.Random, players: int, npcs: int, entry: bytes) -> None:
+    player_id = f"bench-player-{rng.randrange(players)}"
+    npc_id = f"bench-npc-{rng.randrange(npcs)}"
+    if name == "commit_turn":
+        await storage.commit_chat_turns([(player_id, npc_id, entry, rng.randint(-3, 3))])
+    elif name == "load_context":
+        await storage.load_chat_context(player_id, npc_id, 10, include_npc=True)
+    elif name == "history":
+        await storage.get_conversation(player_id, npc_id, limit=20)
+    elif name == "reputation":
+        await storage.adjust_reputations([(player_id, npc_id, rng.randint(-3, 3))])
+    else:
+        await storage.get_npc(npc_id)
+
+
+async def _benchmark_backend(name: str, args, directory: str) -> Dict:
+    storage = build_backend(name, args, directory)
+    await storage.start()
+    latencies: Dict[str, List[float]] = {operation: [] for operation in OPERATIONS}
+    # A typical encoded chat turn
+    entry = os.urandom(180)
+    try:
+        await _seed(storage, args.npcs)
+        remaining = [args.ops]
+
+        async def worker(index: int) -> None:
+            rng = random.Random(f"{args.seed}:{index}")
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                operation = rng.choice(OPERATIONS)
+                start = time.perf_counter()
+                await _operation(storage, operation, rng, args.players, args.npcs, entry)
+                latencies[operation].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(i) for i in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+        stats = storage.stats()
+    finally:
+        await storage.close()
+
+    results = {"throughput_ops": round(args.ops / elapsed, 1), "storage": stats, "operations": {}}
+    for operation, samples in latencies.items():
+        ordered = sorted(samples)
+        results["operations"][operation] = {
+            "ops": len(ordered),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3)
+        }
+    return results
+
+
+async def _run(args) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends:
+            results[name] = await _benchmark_backend(name, args, directory)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storage backends on the chat hot path")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"Comma-separated subset of {', '.join(BACKENDS)}")
+    parser.add_argument("--ops", type=int, default=5000, help="Operations per backend")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--npcs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--redis-host", help="Use this Redis instead of fakeredis")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--sqlite-max-batch", type=int, default=100)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+    args.backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+
+    if "redis" in args.backends:
+        if args.redis_host:
+            os.environ.update({
+                "REDIS_HOST": args.redis_host,
+                "REDIS_PORT": str(args.redis_port),
+                "REDIS_DB": str(args.redis_db)
+            })
+        else:
+            install_fakeredis()
+
+    results = asyncio.run(_run(args))
+
+    print(f"{'backend':<8} {'operation':<13} {'ops':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, backend in results.items():
+        for operation, row in backend["operations"].items():
+            print(f"{name:<8} {operation:<13} {row['ops']:>7} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+        print(f"{name:<8} {'total':<13} {backend['throughput_ops']:>7} ops/s  {backend['storage']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Script: Verify admission control, rate limiting and graceful degradation
+Location: scripts/check_admission.py
+
+Checks the LLM admission queue on its own:
+
+- waiting calls get slots by priority (chat before quests before summaries)
+- a queued quest pool refill waits for a player's quest that queued after it
+- a full queue turns away its least urgent request
+- a call that can't start before its deadline is rejected at once, and one
+  whose deadline passes while it waits is rejected then
+- a request sharing another's single-flight call makes its own call when
+  the shared one is rejected for the other request's deadline
+
+then drives the app in-process against the fake LLM server with
+ADMISSION_ENABLED and a small LLM_MAX_CONCURRENCY:
+
+- a burst far larger than the LLM can serve in time: every chat answers
+  within about the deadline, late ones with an in-character fallback
+- a player sending faster than their bucket allows gets 429 + Retry-After
+- an NPC over its bucket answers with fallback replies
+
+Exits non-zero if any check fails.
+
+Usage:
+    python scripts/check_admission.py
+    python scripts/check_admission.py --storage redis --chats 80 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _fakeredis import install_fakeredis
+from benchmark_api import percentile
+from check_llm_concurrency import _free_port, _start_server
+from fake_llm_server import create_app
+
+REPLY = "Well met, traveler."
+
+
+async def _hold(queue, priority: int, order: list, name: str, deadline=None) -> None:
+    async with queue.slot(priority, deadline):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+
+async def check_priority_order(args) -> None:
+    from app.admission import PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_QUEST, AdmissionQueue
+
+    queue = AdmissionQueue(slots=1)
+    order = []
+    await queue.acquire(PRIORITY_CHAT)
+    tasks = [
+        asyncio.create_task(_hold(queue, priority, order, name))
+        for priority, name in [(PRIORITY_BACKGROUND, "summary"), (PRIORITY_QUEST, "quest"), (PRIORITY_CHAT, "chat")]
+    ]
+    await asyncio.sleep(0.01)
+    queue.release()
+    await asyncio.gather(*tasks)
+    print(f"  served in order: {order}")
+    assert order == ["chat", "quest", "summary"], order
+
+
+async def check_queue_bound(args) -> None:
+    from app.admission import PRIORITY_BACKGROUND, PRIORITY_CHAT, AdmissionQueue, AdmissionRejected
+
+    queue = AdmissionQueue(slots=1, max_queue=2)
+    order = []
+    await queue.acquire(PRIORITY_CHAT)
+    background = [asyncio.create_task(_hold(queue, PRIORITY_BACKGROUND, order, f"summary{i}")) for i in range(2)]
+    await asyncio.sleep(0.01)
+    # A chat pushes out the newest summary; another summary is turned away
+    chat = asyncio.create_task(_hold(queue, PRIORITY_CHAT, order, "chat"))
+    await asyncio.sleep(0.01)
+    try:
+        await queue.acquire(PRIORITY_BACKGROUND)
+        raise AssertionError("a full queue admitted a less urgent request")
+    except AdmissionRejected as e:
+        assert e.reason == "queue_full", e.reason
+    queue.release()
+    results = await asyncio.gather(*background, chat, return_exceptions=True)
+    print(f"  served: {order}, rejected: {queue.rejected}")
+    assert order == ["chat", "summary0"], order
+    assert isinstance(results[1], AdmissionRejected), results
+    assert queue.rejected == {"queue_full": 2}, queue.rejected
+
+
+async def check_deadlines(args) -> None:
+    from app.admission import PRIORITY_CHAT, AdmissionQueue, AdmissionRejected, deadline_after
+
+    queue = AdmissionQueue(slots=1)
+    # Teach the queue that a slot is held for about 0.2s
+    async with queue.slot(PRIORITY_CHAT):
+        await asyncio.sleep(0.2)
+
+    await queue.acquire(PRIORITY_CHAT)
+    start = time.perf_counter()
+    try:
+        await queue.acquire(PRIORITY_CHAT, deadline_after(0.05))
+        raise AssertionError("admitted a call that could not start in time")
+    except AdmissionRejected as e:
+        assert e.reason == "deadline", e.reason
+    rejected_in = time.perf_counter() - start
+    assert rejected_in < 0.01, f"rejection took {rejected_in:.3f}s"
+
+    # Nothing is known about slot times yet, so this one waits and times out
+    queue.service_time = None
+    start = time.perf_counter()
+    try:
+        await queue.acquire(PRIORITY_CHAT, deadline_after(0.1))
+        raise AssertionError("a waiter outlived its deadline")
+    except AdmissionRejected as e:
+        assert e.reason == "deadline", e.reason
+    waited = time.perf_counter() - start
+    queue.release()
+    print(f"  rejected up front in {rejected_in * 1000:.1f} ms, after waiting {waited * 1000:.0f} ms; {queue.stats()}")
+    assert 0.09 <= waited < 0.2, waited
+    assert queue.active == 0 and not queue.stats()["waiting"], queue.stats()
+
+
+async def check_shared_call_rejection(args) -> None:
+    from app.admission import AdmissionRejected
+    from app.single_flight import SingleFlight
+
+    flights = SingleFlight()
+
+    async def tight_deadline():
+        await asyncio.sleep(0.05)
+        raise AdmissionRejected("deadline")
+
+    async def own_call():
+        return "own reply"
+
+    leader = asyncio.create_task(flights.do("key", tight_deadline, retry_on=(AdmissionRejected,)))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("key", own_call, retry_on=(AdmissionRejected,)))
+    results = await asyncio.gather(leader, follower, return_exceptions=True)
+    print(f"  leader: {results[0]!r}, follower: {results[1]!r}; {flights.stats()}")
+    assert isinstance(results[0], AdmissionRejected), results
+    assert results[1] == "own reply", results
+    assert flights.stats()["retried"] == 1, flights.stats()
+
+
+async def check_pool_refill_priority(args) -> None:
+    import json
+    from app.admission import PRIORITY_CHAT, AdmissionQueue
+    from app.llm_service import LLMService
+
+    service = LLMService()
+    service.admission = AdmissionQueue(slots=1)
+    order = []
+
+    async def complete(kind, messages, max_tokens, temperature, output_format=None):
+        order.append(kind)
+        return json.dumps({
+            "title": "Lost Goods", "description": "Find the crate", "difficulty": "easy",
+            "reward": "10 gold", "objectives": ["Find the crate"]
+        })
+
+    service.router.complete = complete
+    await service.admission.acquire(PRIORITY_CHAT)
+    refill = asyncio.create_task(service.request_quest("Garrick", "A trader", "merchant", call_kind="quest_pool"))
+    await asyncio.sleep(0.01)
+    player = asyncio.create_task(service.generate_quest("Garrick", "A trader", "merchant"))
+    await asyncio.sleep(0.01)
+    service.admission.release()
+    await asyncio.gather(refill, player)
+    print(f"  served in order: {order}")
+    assert order == ["quest", "quest_pool"], order
+
+
+async def _chat(client, player_id: str, npc_id: str, message: str = "Any work for me?"):
+    start = time.perf_counter()
+    response = await client.post("/chat", json={"player_id": player_id, "npc_id": npc_id, "message": message})
+    return response, time.perf_counter() - start
+
+
+async def _create_npcs(client, count: int, prefix: str):
+    npc_ids = [f"{prefix}-{i}" for i in range(count)]
+    for npc_id in npc_ids:
+        response = await client.post("/npc", json={
+            "npc_id": npc_id,
+            "name": "Garrick",
+            "personality": "merchant",
+            "background": "Sells odds and ends at the crossroads",
+            "response_cache": False
+        })
+        assert response.status_code == 201, response.text
+    return npc_ids
+
+
+async def _burst(client, npc_ids, chats: int, label: str):
+    results = await asyncio.gather(*[
+        _chat(client, f"{label}-player-{i}", npc_ids[i % len(npc_ids)]) for i in range(chats)
+    ])
+    assert all(response.status_code == 200 for response, _ in results), [r.status_code for r, _ in results]
+    served = sorted(elapsed for response, elapsed in results if not response.json()["degraded"])
+    degraded = sorted(elapsed for response, elapsed in results if response.json()["degraded"])
+    return results, served, degraded
+
+
+async def check_overload(args, client, main) -> None:
+    from app.llm_service import LLMService
+    from app.personality import PersonalityEngine
+    from app.models import PersonalityType
+
+    # Spread over NPCs so only the LLM queue, not the NPC buckets, limits
+    npc_ids = await _create_npcs(client, 8, "overload")
+    unbounded = -(-args.chats // args.limit) * args.latency
+    print(f"  {args.chats} chats at once, {args.limit} LLM slots, {args.latency}s per call: without admission "
+          f"control the last one would wait ~{unbounded:.1f}s; deadline {args.deadline}s")
+    # The first burst also teaches the service how long calls take
+    for label in ("cold", "warm"):
+        results, served, degraded = await _burst(client, npc_ids, args.chats, label)
+        latencies = sorted(elapsed for _, elapsed in results)
+        print(f"  {label}: {len(served)} LLM replies (p50 {percentile(served, 0.5):.2f}s), "
+              f"{len(degraded)} fallback replies (p50 {percentile(degraded, 0.5):.2f}s), "
+              f"overall p99 {percentile(latencies, 0.99):.2f}s")
+        assert served and degraded, (len(served), len(degraded))
+        assert percentile(latencies, 0.99) < args.deadline + 0.5, latencies[-5:]
+    print(f"  queue: {main.llm_service.admission.stats()}")
+    # Once call times are known, hopeless requests are answered up front
+    assert percentile(degraded, 0.5) < args.deadline / 2, degraded
+
+    bodies = [response.json() for response, _ in results]
+    assert all(body["npc_response"] == REPLY for body in bodies if not body["degraded"]), bodies[:3]
+    greeting = PersonalityEngine.PERSONALITY_PROMPTS[PersonalityType.MERCHANT]["example"]
+    assert all(body["npc_response"] == greeting for body in bodies if body["degraded"]), bodies[:3]
+    # A returning player gets the templated reply to their words instead
+    assert LLMService.persona_reply("merchant", "Got any swords?") == \
+        "Ah, a customer! You mentioned 'Got any swords?...' I have just what you need! The finest goods at reasonable prices."
+
+
+async def check_player_rate_limit(args, client, main) -> None:
+    npc_id, = await _create_npcs(client, 1, "spam")
+    burst = main.settings.admission_player_burst
+    results = await asyncio.gather(*[_chat(client, "spammer", npc_id, f"Hey #{i}") for i in range(burst + 5)])
+    limited = [response for response, _ in results if response.status_code == 429]
+    print(f"  {len(results)} chats from one player: {len(results) - len(limited)} admitted, {len(limited)} got 429 "
+          f"(Retry-After {limited[0].headers.get('retry-after') if limited else None})")
+    assert len(limited) == 5, [response.status_code for response, _ in results]
+    assert all(int(response.headers["retry-after"]) >= 1 for response in limited)
+    # Other players are unaffected
+    response, _ = await _chat(client, "bystander", npc_id)
+    assert response.status_code == 200, response.text
+
+
+async def check_npc_rate_limit(args, client, main) -> None:
+    from app import metrics
+
+    npc_id, = await _create_npcs(client, 1, "popular")
+    burst = main.settings.admission_npc_burst
+    before = metrics.DEGRADED_REPLIES.value(reason="npc_rate_limit")
+    results = await asyncio.gather(*[_chat(client, f"fan-{i}", npc_id) for i in range(burst + 5)])
+    limited = metrics.DEGRADED_REPLIES.value(reason="npc_rate_limit") - before
+    print(f"  {len(results)} chats with one NPC: {limited:g} answered from templates by its bucket")
+    assert all(response.status_code == 200 for response, _ in results)
+    assert limited == 5, limited
+
+
+UNIT_CHECKS = [
+    check_priority_order, check_queue_bound, check_deadlines, check_shared_call_rejection,
+    check_pool_refill_priority
+]
+APP_CHECKS = [check_overload, check_player_rate_limit, check_npc_rate_limit]
+
+
+async def _run_check(check, *check_args) -> bool:
+    print(f"{check.__name__}:")
+    try:
+        await check(*check_args)
+        print("  ✅ passed")
+        return True
+    except AssertionError as e:
+        print(f"  ❌ failed: {e}")
+        return False
+
+
+async def _run(args) -> bool:
+    import httpx
+
+    ok = True
+    for check in UNIT_CHECKS:
+        ok = await _run_check(check, args) and ok
+
+    from app import main
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            for check in APP_CHECKS:
+                ok = await _run_check(check, args, client, main) and ok
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify admission control, rate limiting and graceful degradation")
+    parser.add_argument("--storage", choices=["memory", "redis", "sqlite"], default="memory",
+                        help="Where the token buckets live (redis is an in-process fakeredis)")
+    parser.add_argument("--chats", type=int, default=40, help="Size of the overload burst")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM latency")
+    parser.add_argument("--limit", type=int, default=2, help="LLM_MAX_CONCURRENCY to apply")
+    parser.add_argument("--deadline", type=float, default=1.5, help="ADMISSION_CHAT_DEADLINE to apply")
+    args = parser.parse_args()
+
+    port = _free_port()
+    server = _start_server(create_app(latency=args.latency, reply=REPLY), port)
+    os.environ.update({
+        "DEMO_MODE": "false",
+        "USE_OLLAMA": "false",
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "LLM_MAX_CONCURRENCY": str(args.limit),
+        "SINGLE_FLIGHT_ENABLED": "false",
+        "LTM_ENABLED": "false",
+        "STORAGE_BACKEND": args.storage,
+        "ADMISSION_ENABLED": "true",
+        "ADMISSION_CHAT_DEADLINE": str(args.deadline),
+        "ADMISSION_PLAYER_RATE": "0.1",
+        "ADMISSION_PLAYER_BURST": "5",
+        "ADMISSION_NPC_RATE": "0.01",
+        "ADMISSION_NPC_BURST": str(args.chats)
+    })
+    if args.storage == "redis":
+        install_fakeredis()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["SQLITE_PATH"] = os.path.join(directory, "npc.db")
+        ok = asyncio.run(_run(args))
+    server.should_exit = True
+    if not ok:
+        sys.exit(1)
+    print("✅ Admission control checks passed")
+
+
+if __name__ == "__main__":
+    main()
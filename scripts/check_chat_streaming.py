@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Script: Verify token-streaming chat over SSE and WebSocket
+Location: scripts/check_chat_streaming.py
+
+Drives the app in-process against the fake LLM server:
+
+- /chat/stream sends the reply as `token` events that add up to the
+  `done` event's reply, and stores the turn
+- /ws/chat serves several turns on one socket, and answers frames that
+  aren't JSON, aren't a JSON object, aren't a valid Message or name an
+  unknown NPC with an `error` frame while keeping the socket open
+- a provider that dies mid-reply ends the SSE stream with an `error`
+  event and the WebSocket turn with an `error` frame, and the partial
+  reply is not stored
+
+Exits non-zero if any check fails.
+
+Usage:
+    python scripts/check_chat_streaming.py
+    python scripts/check_chat_streaming.py --provider ollama
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_llm_concurrency import _free_port, _start_server
+from fake_llm_server import create_app
+
+REPLY = "Well met, traveler. What brings you to the crossroads?"
+NPC_ID = "stream-npc"
+
+
+def _sse_events(client, player_id: str, message: str = "Hello there"):
+    """(event, data) pairs of one /chat/stream response"""
+    events = []
+    with client.stream("POST", "/chat/stream", json={
+        "player_id": player_id, "npc_id": NPC_ID, "message": message
+    }) as response:
+        assert response.status_code == 200, response.status_code
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def _history(client, player_id: str):
+    response = client.get(f"/history/{player_id}/{NPC_ID}")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _ws_turn(websocket, frame):
+    """Send one frame and collect the frames answering it"""
+    if isinstance(frame, str):
+        websocket.send_text(frame)
+    else:
+        websocket.send_json(frame)
+    frames = []
+    while True:
+        reply = websocket.receive_json()
+        frames.append(reply)
+        if reply["type"] in ("done", "error"):
+            return frames
+
+
+def check_sse(client, fake) -> None:
+    events = _sse_events(client, "sse-player")
+    tokens = [data["token"] for event, data in events if event == "token"]
+    print(f"  {len(tokens)} token events, then {events[-1][0]}")
+    assert events[-1][0] == "done", events
+    assert len(tokens) > 1, tokens
+    assert "".join(tokens) == REPLY == events[-1][1]["npc_response"], events
+    history = _history(client, "sse-player")
+    assert [entry["npc_response"] for entry in history] == [REPLY], history
+
+
+def check_websocket(client, fake) -> None:
+    with client.websocket_connect("/ws/chat") as websocket:
+        turn = {"player_id": "ws-player", "npc_id": NPC_ID, "message": "Hello there"}
+        frames = _ws_turn(websocket, turn)
+        assert frames[-1]["type"] == "done", frames
+        assert "".join(f["token"] for f in frames if f["type"] == "token") == REPLY, frames
+
+        bad_frames = {
+            "not JSON": "{not json",
+            "a JSON list": "[1, 2]",
+            "a JSON string": '"hello"',
+            "missing fields": {"player_id": "ws-player"},
+            "unknown NPC": {**turn, "npc_id": "nobody"}
+        }
+        for label, frame in bad_frames.items():
+            frames = _ws_turn(websocket, frame)
+            print(f"  {label}: {frames[-1]}")
+            assert [f["type"] for f in frames] == ["error"], frames
+
+        # The socket survived every bad frame
+        frames = _ws_turn(websocket, {**turn, "message": "Still there?"})
+        assert frames[-1]["type"] == "done", frames
+    assert len(_history(client, "ws-player")) == 2
+
+
+def check_interrupted_stream(client, fake) -> None:
+    fake.state.fail_after = 3
+    # The fake server logs a traceback for every stream it cuts off
+    logging.getLogger("uvicorn.error").setLevel(logging.CRITICAL)
+    try:
+        events = _sse_events(client, "cut-player")
+        print(f"  SSE: {[event for event, _ in events]}")
+        assert events[-1][0] == "error", events
+        assert not any(event == "done" for event, _ in events), events
+
+        with client.websocket_connect("/ws/chat") as websocket:
+            frames = _ws_turn(websocket, {"player_id": "cut-player", "npc_id": NPC_ID, "message": "Hi"})
+            print(f"  WebSocket: {[f['type'] for f in frames]}")
+            assert frames[-1]["type"] == "error", frames
+    finally:
+        fake.state.fail_after = 0
+    assert _history(client, "cut-player") == [], _history(client, "cut-player")
+
+
+CHECKS = [check_sse, check_websocket, check_interrupted_stream]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify token-streaming chat over SSE and WebSocket")
+    parser.add_argument("--provider", choices=["openai", "ollama"], default="openai")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency")
+    args = parser.parse_args()
+
+    port = _free_port()
+    fake = create_app(latency=args.latency, reply=REPLY)
+    server = _start_server(fake, port)
+    os.environ.update({
+        "DEMO_MODE": "false",
+        "USE_OLLAMA": str(args.provider == "ollama").lower(),
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{port}",
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "STORAGE_BACKEND": "memory",
+        "SINGLE_FLIGHT_ENABLED": "false",
+        "LTM_ENABLED": "false"
+    })
+
+    from fastapi.testclient import TestClient
+    from app import main as app_main
+
+    ok = True
+    with TestClient(app_main.app) as client:
+        response = client.post("/npc", json={
+            "npc_id": NPC_ID,
+            "name": "Garrick",
+            "personality": "merchant",
+            "background": "Sells odds and ends at the crossroads"
+        })
+        assert response.status_code == 201, response.text
+        for check in CHECKS:
+            print(f"{check.__name__}:")
+            try:
+                check(client, fake)
+                print("  ✅ passed")
+            except AssertionError as e:
+                print(f"  ❌ failed: {e}")
+                ok = False
+    server.should_exit = True
+    if not ok:
+        sys.exit(1)
+    print("✅ Chat streaming checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Script: Verify that concurrent chats overlap on the OpenAI path
+Location: scripts/check_llm_concurrency.py
+
+Starts the fake OpenAI-compatible server in-process, points LLMService at
+it and fires a burst of concurrent generations. Exits non-zero if the
+calls ran one after another instead of overlapping, or if more calls
+were in flight than LLM_MAX_CONCURRENCY allows.
+
+Usage:
+    python scripts/check_llm_concurrency.py --chats 20 --latency 0.5 --limit 8
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+
+from fake_llm_server import create_app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(fake_app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(fake_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run(chats: int) -> float:
+    from app.llm_service import LLMService
+
+    service = LLMService()
+    start = time.perf_counter()
+    replies = await asyncio.gather(*[
+        service.generate_response(
+            system_prompt="You are a test NPC.",
+            user_message=f"Hello #{i}"
+        )
+        for i in range(chats)
+    ])
+    elapsed = time.perf_counter() - start
+    assert all(reply == "Well met, traveler." for reply in replies), replies
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=8, help="LLM_MAX_CONCURRENCY to apply")
+    args = parser.parse_args()
+
+    port = _free_port()
+    fake_app = create_app(latency=args.latency)
+    server = _start_server(fake_app, port)
+
+    os.environ.update({
+        "DEMO_MODE": "false",
+        "USE_OLLAMA": "false",
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "LLM_MAX_CONCURRENCY": str(args.limit)
+    })
+
+    elapsed = asyncio.run(_run(args.chats))
+    server.should_exit = True
+
+    serial_time = args.chats * args.latency
+    max_in_flight = fake_app.state.max_in_flight
+    print(f"{args.chats} chats in {elapsed:.2f}s (serial would take {serial_time:.2f}s), "
+          f"max in flight: {max_in_flight}, limit: {args.limit}")
+
+    if max_in_flight < 2 or elapsed >= serial_time / 2:
+        print("❌ Chats did not overlap")
+        sys.exit(1)
+    if max_in_flight > args.limit:
+        print("❌ Concurrency limit was exceeded")
+        sys.exit(1)
+    print("✅ Chats overlapped within the concurrency limit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Script: Verify LLM backend routing, failover and hedging
+Location: scripts/check_llm_router.py
+
+Starts fake Ollama/OpenAI-compatible servers in-process and drives
+LLMRouter through them:
+
+- weighted least-outstanding routing splits load by weight
+- a dead tier-0 backend is ejected by its circuit breaker and calls fail
+  over to tier 1, for completions and streams
+- with hedging on, a backend whose requests sometimes stall no longer
+  sets the p99 latency
+- a call that started before the breaker opened and ends without a
+  verdict does not let a second half-open probe out
+
+Exits non-zero if any check fails.
+
+Usage:
+    python scripts/check_llm_router.py
+    python scripts/check_llm_router.py --calls 600 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_api import percentile
+from check_llm_concurrency import _free_port, _start_server
+from fake_llm_server import create_app
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def _router(backends, **settings):
+    from app.config import Settings
+    from app.llm_router import LLMRouter, create_llm_backends
+
+    settings = Settings(llm_backends=backends, llm_circuit_failure_threshold=3, **settings)
+    return LLMRouter(
+        create_llm_backends(settings),
+        hedge_enabled=settings.llm_hedge_enabled,
+        hedge_quantile=settings.llm_hedge_quantile,
+        hedge_min_samples=settings.llm_hedge_min_samples
+    )
+
+
+async def _drive(router, calls: int, concurrency: int):
+    """Run `calls` completions from `concurrency` tasks; returns (latencies, errors)"""
+    latencies = []
+    errors = [0]
+    remaining = [calls]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                await router.complete("chat", MESSAGES)
+            except Exception:
+                errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return sorted(latencies), errors[0]
+
+
+async def check_weighted_routing(args, servers) -> None:
+    heavy, light = servers["a"], servers["b"]
+    router = _router([
+        {"name": "heavy", "provider": "ollama", "base_url": heavy.url, "weight": 3},
+        {"name": "light", "provider": "ollama", "base_url": light.url, "weight": 1}
+    ])
+    await router.start()
+    try:
+        _, errors = await _drive(router, args.calls, args.concurrency)
+    finally:
+        await router.close()
+    counts = {backend.name: backend.calls for backend in router.backends}
+    print(f"  calls by backend: {counts}")
+    assert errors == 0, errors
+    ratio = counts["heavy"] / max(1, counts["light"])
+    assert 2.0 <= ratio <= 4.5, f"expected about 3:1, got {ratio:.2f}"
+
+
+async def check_failover(args, servers) -> None:
+    router = _router([
+        {"name": "dead", "provider": "ollama", "base_url": f"http://127.0.0.1:{_free_port()}"},
+        {"name": "overflow", "provider": "openai", "api_key": "fake", "base_url": f"{servers['a'].url}/v1", "tier": 1}
+    ])
+    await router.start()
+    try:
+        _, errors = await _drive(router, 50, 4)
+        chunks = [chunk async for chunk in router.stream("stream", MESSAGES)]
+    finally:
+        await router.close()
+    dead, overflow = router.backends
+    print(f"  dead: {dead.calls} calls, breaker {dead.breaker.state}; overflow: {overflow.calls} calls")
+    assert errors == 0, errors
+    assert dead.breaker.state == "open", dead.breaker.state
+    # Calls already in flight when the breaker opened may also have failed
+    assert dead.calls <= 3 + 4, dead.calls
+    assert "".join(chunks) == "Well met, traveler.", chunks
+
+
+async def check_hedging(args, servers) -> None:
+    results = {}
+    for hedge in (False, True):
+        router = _router(
+            [
+                {"name": "a", "provider": "ollama", "base_url": servers["flaky_a"].url},
+                {"name": "b", "provider": "ollama", "base_url": servers["flaky_b"].url}
+            ],
+            llm_hedge_enabled=hedge,
+            llm_hedge_min_samples=20
+        )
+        await router.start()
+        try:
+            latencies, errors = await _drive(router, args.calls, args.concurrency)
+        finally:
+            await router.close()
+        assert errors == 0, errors
+        results[hedge] = percentile(latencies, 0.99)
+        print(f"  hedging {'on ' if hedge else 'off'}: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, "
+              f"p99 {results[hedge] * 1000:.0f} ms, hedges {router.hedges} ({router.hedge_wins} won)")
+    assert results[True] < results[False] / 2, results
+
+
+async def check_breaker_probe(args, servers) -> None:
+    from app.llm_router import CircuitBreaker
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    stale = breaker.start_call()
+    breaker.record_failure()
+    assert breaker.state == "open", breaker.state
+    await asyncio.sleep(0.1)
+    probe = breaker.start_call()
+    assert stale is False and probe is True, (stale, probe)
+    assert not breaker.available()
+    # A cancelled hedge from before the breaker opened ends while the probe is in flight
+    breaker.release(stale)
+    assert not breaker.available(), "stale call re-opened the half-open slot"
+    breaker.release(probe)
+    assert breaker.available()
+
+
+CHECKS = [check_weighted_routing, check_failover, check_hedging, check_breaker_probe]
+
+
+class _Server:
+    def __init__(self, **options):
+        port = _free_port()
+        self.server = _start_server(create_app(**options), port)
+        self.url = f"http://127.0.0.1:{port}"
+
+
+async def _run(args, servers) -> bool:
+    ok = True
+    for check in CHECKS:
+        print(f"{check.__name__}:")
+        try:
+            await check(args, servers)
+            print("  ✅ passed")
+        except AssertionError as e:
+            print(f"  ❌ failed: {e}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify LLM backend routing, failover and hedging")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="Normal fake LLM latency")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Latency of a stalled request")
+    parser.add_argument("--slow-fraction", type=float, default=0.03, help="Share of stalled requests")
+    args = parser.parse_args()
+
+    servers = {
+        "a": _Server(latency=args.latency),
+        "b": _Server(latency=args.latency),
+        "flaky_a": _Server(latency=args.latency, slow_fraction=args.slow_fraction,
+                           slow_latency=args.slow_latency, seed=1),
+        "flaky_b": _Server(latency=args.latency, slow_fraction=args.slow_fraction,
+                           slow_latency=args.slow_latency, seed=2)
+    }
+    ok = asyncio.run(_run(args, servers))
+    for server in servers.values():
+        server.server.should_exit = True
+    if not ok:
+        sys.exit(1)
+    print("✅ LLM router checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Script: Conformance checks for the storage backends
+Location: scripts/check_storage_backends.py
+
+Runs the same behavioural checks against every StorageBackend (Redis,
+in-process memory and SQLite) and against MemoryManager on top of each,
+so a new or changed backend can't drift from the others: ordering and
+caps of conversation lists, atomic and clamped reputation updates,
+retried chat turn commits (directly and through the write-behind queue),
+compaction trimming, locks, rate-limit token buckets, long-term memory
+logs and the per-worker indexes built from them, quest pools, NPC and
+player deletion (including the cascade of per-player data), cross-worker
+invalidation and, for Redis, that keys used together share a cluster
+slot.
+
+Redis is an in-process fakeredis (pip install "fakeredis[lua]") unless
+--redis-host is given. SQLite uses a temporary file.
+
+Usage:
+    python scripts/check_storage_backends.py
+    python scripts/check_storage_backends.py --backends sqlite,memory
+    python scripts/check_storage_backends.py --redis-host localhost --redis-db 15
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from typing import Awaitable, Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _fakeredis import install_fakeredis
+
+BACKENDS = ("redis", "memory", "sqlite")
+
+
+def build_backend(name: str, args, directory: str):
+    """A fresh backend for `name`; Redis settings come from the environment set in main()"""
+    from app.config import get_settings
+    from app.storage import MemoryStorage, RedisStorage, SQLiteStorage
+
+    if name == "redis":
+        return RedisStorage(get_settings())
+    if name == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(os.path.join(directory, f"{uuid.uuid4().hex}.db"), max_batch=args.sqlite_max_batch)
+
+
+def _ids():
+    suffix = uuid.uuid4().hex[:8]
+    return f"conformance-player-{suffix}", f"conformance-npc-{suffix}"
+
+
+async def check_npcs(storage) -> None:
+    _, npc_id = _ids()
+    assert await storage.get_npc(npc_id) is None
+    await storage.set_npc(npc_id, '{"name": "A"}')
+    await storage.set_npc(npc_id, '{"name": "B"}')
+    assert await storage.get_npc(npc_id) == '{"name": "B"}'
+
+    await storage.increment_conversation_count(npc_id)
+    await storage.push_quest(npc_id, "quest", 60)
+    await storage.delete_npc(npc_id)
+    assert await storage.get_npc(npc_id) is None
+    assert await storage.get_conversation_count(npc_id) == 0
+    assert await storage.count_quests(npc_id) == 0
+
+
+async def check_conversations(storage) -> None:
+    from app.storage import CONVERSATION_MAX_ENTRIES
+
+    player_id, npc_id = _ids()
+    assert await storage.get_conversation(player_id, npc_id) == []
+    for i in range(CONVERSATION_MAX_ENTRIES + 5):
+        await storage.append_conversation(player_id, npc_id, f"entry-{i}".encode())
+
+    entries = await storage.get_conversation(player_id, npc_id)
+    last = CONVERSATION_MAX_ENTRIES + 4
+    assert len(entries) == CONVERSATION_MAX_ENTRIES, len(entries)
+    assert entries[0] == f"entry-{last}".encode(), entries[0]
+    assert entries[-1] == f"entry-{last - CONVERSATION_MAX_ENTRIES + 1}".encode(), entries[-1]
+    assert await storage.get_conversation(player_id, npc_id, limit=2) == entries[:2]
+    assert await storage.get_conversation(player_id, npc_id, limit=3, offset=4) == entries[4:7]
+    assert await storage.get_conversation(player_id, npc_id, offset=45) == entries[45:]
+    # Binary entries round-trip untouched
+    await storage.append_conversation(player_id, npc_id, b"\x01\x00\xff")
+    assert (await storage.get_conversation(player_id, npc_id, limit=1)) == [b"\x01\x00\xff"]
+
+
+async def check_chat_turns(storage) -> None:
+    player_id, npc_id = _ids()
+    await storage.set_npc(npc_id, "{}")
+    assert await storage.commit_chat_turns([]) == []
+    results = await storage.commit_chat_turns([
+        (player_id, npc_id, b"one", 60),
+        (player_id, npc_id, b"two", 60),
+        (player_id, npc_id, b"three", -5)
+    ])
+    assert results == [(60, 1), (100, 2), (95, 3)], results
+    assert await storage.get_conversation_count(npc_id) == 3
+
+    entries, reputation, summary, npc = await storage.load_chat_context(player_id, npc_id, 2, include_npc=True)
+    assert entries == [b"three", b"two"], entries
+    assert (reputation, summary, npc) == (95, None, "{}"), (reputation, summary, npc)
+    *_, npc = await storage.load_chat_context(player_id, npc_id, 2, include_npc=False)
+    assert npc is None
+
+    # Turns committed before under the same id are not applied again
+    turns = [(player_id, npc_id, b"four", -10), (player_id, npc_id, b"five", -10)]
+    assert await storage.commit_chat_turns(turns[:1], ["t4"]) == [(85, 4)]
+    results = await storage.commit_chat_turns(turns, ["t4", "t5"])
+    if storage.backend == "redis":
+        from app import keys
+
+        assert results == [(85, 4), (75, 5)], results
+        assert await storage.get_conversation_count(npc_id) == 5
+        # A turn whose commit went through but whose count didn't is counted on retry, once
+        await storage.redis_client.set(keys.chat_turn(player_id, npc_id, "t6"), 1)
+        for _ in range(2):
+            assert await storage.commit_chat_turns([(player_id, npc_id, b"six", 0)], ["t6"]) == [(75, 5)]
+            assert await storage.get_conversation_count(npc_id) == 6
+    await storage.delete_npc(npc_id)
+    await _drain_cascades(storage)
+
+
+async def check_write_behind(storage) -> None:
+    from app.memory import MemoryManager
+    from app.write_behind import WriteBehindQueue
+
+    class FlakyManager(MemoryManager):
+        """Loses the reply of the first commit after applying it, and
+        always fails batches holding a poisoned turn"""
+        lost_reply = True
+
+        async def commit_chat_turns(self, turns, turn_ids=None):
+            if any(entry.player_message == "poison" for _, _, entry, _ in turns):
+                raise ValueError("poisoned turn")
+            results = await super().commit_chat_turns(turns, turn_ids)
+            if self.lost_reply:
+                self.lost_reply = False
+                raise ConnectionError("reply lost")
+            return results
+
+    player_id, npc_id = _ids()
+    committed = []
+
+    async def on_commit(player_id, npc_id, player_message, npc_response, result):
+        committed.append((player_message, result))
+
+    queue = WriteBehindQueue(FlakyManager(storage=storage), flush_interval=0.05, max_retries=1, on_commit=on_commit)
+    await queue.start()
+    for message, change in [("one", 5), ("poison", 5), ("two", 5)]:
+        await queue.submit(player_id, npc_id, message, "reply", change)
+    await queue.close()
+
+    stats = queue.stats()
+    assert (stats["committed"], stats["failed"]) == (2, 1), stats
+    assert [message for message, _ in committed] == ["one", "two"], committed
+    if storage.backend == "redis":
+        # The first attempt did reach the store; the retry didn't apply it again
+        assert await storage.get_reputation(player_id, npc_id) == 10
+        assert len(await storage.get_conversation(player_id, npc_id)) == 2
+    await storage.delete_player(player_id)
+    await _drain_cascades(storage)
+
+
+async def check_compaction(storage) -> None:
+    player_id, npc_id = _ids()
+    for i in range(8):
+        await storage.append_conversation(player_id, npc_id, f"e{i}".encode())
+    older, summary = await storage.get_compaction_input(player_id, npc_id, keep_recent=3)
+    assert older == [b"e4", b"e3", b"e2", b"e1", b"e0"], older
+    assert summary is None
+
+    # A turn stored while the summary was being written must survive the trim
+    await storage.append_conversation(player_id, npc_id, b"e8")
+    await storage.store_summary(player_id, npc_id, "summary", trim=len(older))
+    assert await storage.get_summary(player_id, npc_id) == "summary"
+    remaining = await storage.get_conversation(player_id, npc_id)
+    assert remaining == [b"e8", b"e7", b"e6", b"e5"], remaining
+    assert await storage.get_compaction_input(player_id, npc_id, keep_recent=10) == ([], "summary")
+
+
+async def check_reputation(storage) -> None:
+    player_id, npc_id = _ids()
+    assert await storage.get_reputation(player_id, npc_id) == 0
+    await storage.set_reputation(player_id, npc_id, 250)
+    assert await storage.get_reputation(player_id, npc_id) == 100
+    assert await storage.adjust_reputations([]) == []
+    assert await storage.adjust_reputations([
+        (player_id, npc_id, -150),
+        (player_id, npc_id, -100),
+        (player_id, f"{npc_id}-other", 7)
+    ]) == [-50, -100, 7]
+
+    # Concurrent increments are never lost
+    other_player, _ = _ids()
+    await asyncio.gather(*[storage.adjust_reputations([(other_player, npc_id, 1)]) for _ in range(50)])
+    assert await storage.get_reputation(other_player, npc_id) == 50
+
+
+async def check_locks(storage) -> None:
+    name = f"conformance_lock:{uuid.uuid4().hex}"
+    assert await storage.acquire_lock(name, 60)
+    assert not await storage.acquire_lock(name, 60)
+    await storage.release_lock(name)
+    assert await storage.acquire_lock(name, 1)
+    await asyncio.sleep(1.2)
+    assert await storage.acquire_lock(name, 60), "lock did not expire"
+    await storage.release_lock(name)
+
+
+async def check_rate_limits(storage) -> None:
+    from app import keys
+
+    player_id, _ = _ids()
+    name = keys.rate_limit("player", player_id)
+    # Burst of 3, then empty; refills at 10 tokens per second
+    for _ in range(3):
+        assert await storage.take_token(name, 10.0, 3) == 0.0
+    retry_after = await storage.take_token(name, 10.0, 3)
+    assert 0.0 < retry_after <= 0.1, retry_after
+    await asyncio.sleep(0.25)
+    assert await storage.take_token(name, 10.0, 3) == 0.0, "bucket did not refill"
+    assert await storage.take_token(name, 10.0, 3) == 0.0
+    assert await storage.take_token(name, 10.0, 3) > 0.0, "bucket refilled past its rate"
+    # Buckets are independent
+    assert await storage.take_token(keys.rate_limit("player", player_id + "-other"), 10.0, 3) == 0.0
+
+
+async def check_long_term_memory(storage) -> None:
+    player_id, npc_id = _ids()
+    other_player, _ = _ids()
+    for i in range(7):
+        await storage.append_ltm(player_id, npc_id, f"r{i}".encode(), max_entries=5, ttl=60)
+    await storage.append_ltm(other_player, npc_id, b"other", max_entries=5, ttl=60)
+    assert await storage.read_ltm(player_id, npc_id) == (7, [b"r2", b"r3", b"r4", b"r5", b"r6"])
+    assert await storage.read_ltm(player_id, npc_id, last=2) == (7, [b"r5", b"r6"])
+    # Each player-NPC pair has its own log and cap
+    assert await storage.read_ltm(other_player, npc_id) == (1, [b"other"])
+
+    await storage.append_ltm(player_id, npc_id, b"r7", max_entries=5, ttl=1)
+    await asyncio.sleep(1.2)
+    assert await storage.read_ltm(player_id, npc_id) == (0, []), "long-term memory did not expire"
+    await storage.append_ltm(player_id, npc_id, b"r8", max_entries=5, ttl=60)
+    assert await storage.read_ltm(player_id, npc_id) == (1, [b"r8"])
+    await storage.delete_npc(npc_id)
+    await _drain_cascades(storage)
+
+
+async def check_long_term_memory_index(storage) -> None:
+    from app.vector_memory import LongTermMemory
+
+    player_id, npc_id = _ids()
+    # Two workers sharing the store
+    worker, other_worker = LongTermMemory(storage), LongTermMemory(storage)
+    await worker.add(player_id, npc_id, "Where is the lost sword?", "In the old mine")
+    for ltm in (worker, other_worker):
+        assert [e.npc_response for e in await ltm.search(player_id, npc_id, "lost sword")] == ["In the old mine"]
+
+    # A sync reads one record when nothing changed, and only the new ones otherwise
+    reads = []
+    read_ltm = storage.read_ltm
+
+    async def counting_read_ltm(player_id, npc_id, last=None):
+        reads.append(last)
+        return await read_ltm(player_id, npc_id, last)
+
+    storage.read_ltm = counting_read_ltm
+    try:
+        await worker.search(player_id, npc_id, "lost sword")
+        await worker.add(player_id, npc_id, "And the shield?", "Sold long ago")
+        await worker.add(player_id, npc_id, "The helmet?", "Buried")
+        await worker.search(player_id, npc_id, "shield")
+    finally:
+        del storage.read_ltm
+    assert reads == [1, 1, 3], reads
+
+    await storage.delete_player(player_id)
+    worker.forget_player(player_id)
+    await _drain_cascades(storage)
+    assert worker.stats()["cached_entries"] == 0
+    # The other worker's index is rebuilt, even once the log is back at the same length
+    await worker.add(player_id, npc_id, "Any news?", "None today")
+    for ltm in (worker, other_worker):
+        assert [e.npc_response for e in await ltm.search(player_id, npc_id, "lost sword")] == []
+        assert [e.npc_response for e in await ltm.search(player_id, npc_id, "any news")] == ["None today"]
+    await storage.delete_player(player_id)
+    await _drain_cascades(storage)
+
+
+async def check_quest_pool(storage) -> None:
+    _, npc_id = _ids()
+    assert await storage.pop_quest(npc_id) == (None, 0)
+    for i in range(3):
+        await storage.push_quest(npc_id, f"q{i}", ttl=60)
+    assert await storage.count_quests(npc_id) == 3
+    assert await storage.pop_quest(npc_id) == ("q0", 2)
+    assert await storage.pop_quest(npc_id) == ("q1", 1)
+
+    await storage.push_quest(npc_id, "q3", ttl=1)
+    await asyncio.sleep(1.2)
+    assert await storage.count_quests(npc_id) == 0, "quest pool did not expire"
+    assert await storage.pop_quest(npc_id) == (None, 0)
+
+
+async def check_invalidations(storage) -> None:
+    received = []
+    ready = asyncio.Event()
+
+    def on_message(npc_id):
+        received.append(npc_id)
+        ready.set()
+
+    if hasattr(storage, "INVALIDATION_POLL_INTERVAL"):
+        storage.INVALIDATION_POLL_INTERVAL = 0.05
+    listener = asyncio.create_task(storage.listen_npc_invalidations(on_message))
+    try:
+        await asyncio.sleep(0.2)
+        if listener.done():
+            # Nothing can be shared with another worker, so there is nothing to hear
+            assert storage.backend == "memory", f"{storage.backend} listener exited early"
+            await storage.publish_npc_invalidation("anything")
+            return
+        await asyncio.wait_for(ready.wait(), 2.0)
+        assert received[0] is None, "listener should start by clearing the cache"
+        await storage.publish_npc_invalidation("npc-a")
+        await storage.publish_npc_invalidation("npc-b")
+        for _ in range(40):
+            if "npc-b" in received:
+                break
+            await asyncio.sleep(0.05)
+        assert [npc_id for npc_id in received if npc_id] == ["npc-a", "npc-b"], received
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+async def check_key_layout(storage) -> None:
+    if storage.backend != "redis":
+        return
+    from redis.crc import key_slot
+    from app import keys
+
+    # Keys used together in one script or transaction must share a cluster slot
+    for player_id, npc_id in [_ids(), ("player:with:colons", "npc:with}brace")]:
+        pair_keys = keys.pair_keys(player_id, npc_id) + (keys.chat_turn(player_id, npc_id, "turn"),)
+        assert len({key_slot(key.encode()) for key in pair_keys}) == 1
+        npc_keys = keys.npc_owned_keys(npc_id) + (
+            keys.npc_players(npc_id), keys.cascade_pending(npc_id), keys.cascade_staging("npc", npc_id),
+            keys.counted_turn(npc_id, "turn")
+        )
+        assert len({key_slot(key.encode()) for key in npc_keys}) == 1
+        player_keys = (keys.player_npcs(player_id), keys.cascade_staging("player", player_id))
+        assert len({key_slot(key.encode()) for key in player_keys}) == 1
+
+
+async def _drain_cascades(storage) -> None:
+    from app.cascade_delete import CascadeDeleter
+
+    deleter = CascadeDeleter(storage, batch_size=2, pause=0)
+    while True:
+        job = await storage.next_cascade_job()
+        if job is None:
+            return
+        await deleter.run_job(job)
+
+
+async def check_cascade_delete(storage) -> None:
+    _, npc_id = _ids()
+    _, other_npc = _ids()
+    players = [_ids()[0] for _ in range(5)]
+    for player_id in players:
+        await storage.commit_chat_turns([
+            (player_id, npc_id, b"turn", 10),
+            (player_id, other_npc, b"turn", 20)
+        ])
+        await storage.store_summary(player_id, npc_id, "summary", trim=0)
+        await storage.append_ltm(player_id, npc_id, b"record", max_entries=10, ttl=60)
+    await storage.set_npc(npc_id, "{}")
+
+    await storage.delete_npc(npc_id)
+    assert await storage.get_npc(npc_id) is None
+    await _drain_cascades(storage)
+    assert not await storage.cascade_pending(npc_id)
+    for player_id in players:
+        assert await storage.get_conversation(player_id, npc_id) == []
+        assert await storage.get_reputation(player_id, npc_id) == 0
+        assert await storage.get_summary(player_id, npc_id) is None
+        assert await storage.read_ltm(player_id, npc_id) == (0, [])
+        # Other NPCs are untouched
+        assert await storage.get_conversation(player_id, other_npc) == [b"turn"]
+        assert await storage.get_reputation(player_id, other_npc) == 20
+
+    await storage.append_ltm(players[0], other_npc, b"record", max_entries=10, ttl=60)
+    await storage.delete_player(players[0])
+    await _drain_cascades(storage)
+    assert await storage.get_conversation(players[0], other_npc) == []
+    assert await storage.read_ltm(players[0], other_npc) == (0, [])
+    assert await storage.get_reputation(players[0], other_npc) == 0
+    assert await storage.get_reputation(players[1], other_npc) == 20
+
+    # Deleting the NPC again (nothing left to cascade) is harmless
+    await storage.delete_npc(npc_id)
+    await storage.delete_npc(other_npc)
+    await _drain_cascades(storage)
+    assert await storage.get_reputation(players[1], other_npc) == 0
+
+
+async def check_memory_manager(storage) -> None:
+    from app.memory import MemoryManager
+    from app.models import NPCResponse
+
+    player_id, npc_id = _ids()
+    manager = MemoryManager(storage=storage)
+    npc = NPCResponse(npc_id=npc_id, name="Tester", personality="wise", background="b", location="l")
+    assert await manager.store_npc(npc, {"neutral": "prompt"})
+    assert (await manager.get_npc(npc_id))["system_prompts"] == {"neutral": "prompt"}
+
+    assert await manager.commit_chat_turn(player_id, npc_id, "hi", "hello", 5) == (5, 1)
+    assert await manager.store_conversation(player_id, npc_id, "bye", "farewell")
+    history = await manager.get_conversation_history(player_id, npc_id, limit=5)
+    assert [entry.player_message for entry in history] == ["bye", "hi"], history
+    loaded_npc, history, reputation, summary = await manager.load_chat_context(player_id, npc_id)
+    assert loaded_npc["name"] == "Tester" and len(history) == 2 and reputation == 5 and summary is None
+
+    async def summarize(previous, entries):
+        return f"{previous}|" + ",".join(entry.player_message for entry in entries)
+
+    # Corrupt entries (cut-off msgpack, cut-off zlib, bad JSON) are skipped, not fatal
+    from app.codec import encode_entry
+
+    good = await manager.get_conversation_history(player_id, npc_id, limit=5)
+    for raw in (
+        encode_entry(good[0])[:-3],
+        encode_entry(good[0].model_copy(update={"npc_response": "x" * 600}), compress_threshold=1)[:-5],
+        b'{"timestamp": '
+    ):
+        await storage.append_conversation(player_id, npc_id, raw)
+    history = await manager.get_conversation_history(player_id, npc_id, limit=10)
+    assert [entry.player_message for entry in history] == ["bye", "hi"], history
+    _, history, _, _ = await manager.load_chat_context(player_id, npc_id, history_limit=10)
+    assert [entry.player_message for entry in history] == ["bye", "hi"], history
+
+    # The one entry kept is the newest, corrupt one; both good turns are folded
+    assert await manager.compact_conversation(player_id, npc_id, keep_recent=1, summarize=summarize)
+    assert await manager.get_conversation_summary(player_id, npc_id) == "None|hi,bye"
+    assert await manager.adjust_player_reputation(player_id, npc_id, 10) == 15
+    assert await manager.delete_npc(npc_id)
+    assert await manager.get_npc(npc_id) is None
+
+
+CHECKS: List[Callable[..., Awaitable[None]]] = [
+    check_npcs,
+    check_conversations,
+    check_chat_turns,
+    check_write_behind,
+    check_compaction,
+    check_reputation,
+    check_locks,
+    check_rate_limits,
+    check_long_term_memory,
+    check_long_term_memory_index,
+    check_quest_pool,
+    check_invalidations,
+    check_cascade_delete,
+    check_key_layout,
+    check_memory_manager
+]
+
+
+async def _run_backend(name: str, args, directory: str) -> int:
+    storage = build_backend(name, args, directory)
+    await storage.start()
+    failures = 0
+    try:
+        for check in CHECKS:
+            try:
+                await check(storage)
+                print(f"  ✅ {check.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"  ❌ {check.__name__}: {type(e).__name__}: {e}")
+    finally:
+        await storage.close()
+    return failures
+
+
+async def _run(args) -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends:
+            print(f"{name}:")
+            failures += await _run_backend(name, args, directory)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformance checks for the storage backends")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"Comma-separated subset of {', '.join(BACKENDS)}")
+    parser.add_argument("--redis-host", help="Use this Redis instead of fakeredis")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--sqlite-max-batch", type=int, default=100)
+    args = parser.parse_args()
+    args.backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+
+    if "redis" in args.backends:
+        if args.redis_host:
+            os.environ.update({
+                "REDIS_HOST": args.redis_host,
+                "REDIS_PORT": str(args.redis_port),
+                "REDIS_DB": str(args.redis_db)
+            })
+        else:
+            install_fakeredis()
+
+    failures = asyncio.run(_run(args))
+    if failures:
+        print(f"❌ {failures} check(s) failed")
+        sys.exit(1)
+    print("✅ All backends conform")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Script: Local fake OpenAI- and Ollama-compatible LLM server
+Location: scripts/fake_llm_server.py
+
+Stands in for a real provider when testing or benchmarking the NPC API.
+Each completion waits a configurable latency (time to first token), then
+produces a canned reply at a configurable token rate, optionally streamed
+word by word as OpenAI-style SSE chunks or Ollama-style NDJSON lines.
+Requests asking for structured output (OpenAI `response_format`, Ollama
+`format`) get a canned quest as JSON. A fraction of requests can be made
+to stall (--slow-fraction, --slow-latency) to mimic a GPU box with a bad
+tail, and streams can be cut off after a number of words (--fail-after)
+to mimic a provider dying mid-reply. The server tracks how many requests are in flight at once so
+callers can check that generations overlap.
+
+Usage:
+    python scripts/fake_llm_server.py --port 9100 --latency 0.5 --tokens-per-second 50
+    OPENAI_BASE_URL=http://localhost:9100/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+    USE_OLLAMA=true OLLAMA_BASE_URL=http://localhost:9100 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+
+QUEST_REPLY = {
+    "title": "The Lost Shipment",
+    "description": "A wagon of supplies vanished on the forest road.",
+    "difficulty": "medium",
+    "reward": "150 gold",
+    "objectives": ["Search the forest road", "Recover the supplies", "Return to town"]
+}
+
+
+def create_app(
+    latency: float = 0.5,
+    reply: str = "Well met, traveler.",
+    token_delay: float = 0.0,
+    slow_fraction: float = 0.0,
+    slow_latency: float = 0.0,
+    seed: int = 0,
+    fail_after: int = 0
+) -> FastAPI:
+    """Build the fake server app"""
+    fake = FastAPI(title="Fake LLM Server")
+    fake.state.latency = latency
+    fake.state.slow_fraction = slow_fraction
+    fake.state.slow_latency = slow_latency
+    rng = random.Random(seed)
+    fake.state.token_delay = token_delay
+    fake.state.reply = reply
+    # Streams drop the connection after this many words (0 = never)
+    fake.state.fail_after = fail_after
+    fake.state.in_flight = 0
+    fake.state.max_in_flight = 0
+    fake.state.requests = 0
+
+    def _track_start():
+        fake.state.requests += 1
+        fake.state.in_flight += 1
+        fake.state.max_in_flight = max(fake.state.max_in_flight, fake.state.in_flight)
+
+    @fake.get("/stats")
+    async def stats():
+        return {
+            "requests": fake.state.requests,
+            "in_flight": fake.state.in_flight,
+            "max_in_flight": fake.state.max_in_flight
+        }
+
+    async def _read_body(request: Request):
+        """The JSON body, or None when the client gave up (e.g. a cancelled hedge)"""
+        try:
+            return await request.json()
+        except ClientDisconnect:
+            return None
+
+    def _latency() -> float:
+        """Time to first token for one request"""
+        if fake.state.slow_fraction and rng.random() < fake.state.slow_fraction:
+            return fake.state.slow_latency
+        return fake.state.latency
+
+    def _reply(structured: bool) -> str:
+        return json.dumps(QUEST_REPLY) if structured else fake.state.reply
+
+    def _words(text: str):
+        words = text.split(" ")
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _check_cut_off(sent: int) -> None:
+        if fake.state.fail_after and sent >= fake.state.fail_after:
+            raise ConnectionError("fake provider failure mid-stream")
+
+    async def _generate(text: str) -> None:
+        """Simulate a full non-streamed generation"""
+        await asyncio.sleep(_latency() + fake.state.token_delay * len(_words(text)))
+
+    async def _openai_stream(completion_id: str, model: str, text: str):
+        try:
+            await asyncio.sleep(_latency())
+            for sent, word in enumerate(_words(text)):
+                _check_cut_off(sent)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(fake.state.token_delay)
+            yield "data: [DONE]\n\n"
+        finally:
+            fake.state.in_flight -= 1
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await _read_body(request)
+        if body is None:
+            return Response(status_code=499)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "fake")
+        text = _reply(bool(body.get("response_format")))
+        _track_start()
+        if body.get("stream"):
+            return StreamingResponse(_openai_stream(completion_id, model, text), media_type="text/event-stream")
+
+        try:
+            await _generate(text)
+        finally:
+            fake.state.in_flight -= 1
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    async def _ollama_stream(model: str, text: str):
+        try:
+            await asyncio.sleep(_latency())
+            for sent, word in enumerate(_words(text)):
+                _check_cut_off(sent)
+                line = {"model": model, "message": {"role": "assistant", "content": word}, "done": False}
+                yield json.dumps(line) + "\n"
+                await asyncio.sleep(fake.state.token_delay)
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True}) + "\n"
+        finally:
+            fake.state.in_flight -= 1
+
+    @fake.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await _read_body(request)
+        if body is None:
+            return Response(status_code=499)
+        model = body.get("model", "fake")
+        text = _reply(body.get("format") is not None)
+        _track_start()
+        # Ollama streams unless told otherwise
+        if body.get("stream", True):
+            return StreamingResponse(_ollama_stream(model, text), media_type="application/x-ndjson")
+
+        try:
+            await _generate(text)
+        finally:
+            fake.state.in_flight -= 1
+
+        return {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": text},
+            "done": True
+        }
+
+    return fake
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Token rate; overrides --token-delay when set")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Share of requests that stall")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Seconds before the first token when stalled")
+    parser.add_argument("--reply", default="Well met, traveler.", help="Canned chat reply")
+    parser.add_argument("--fail-after", type=int, default=0, help="Cut streams off after this many words")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    token_delay = 1.0 / args.tokens_per_second if args.tokens_per_second > 0 else args.token_delay
+    uvicorn.run(
+        create_app(
+            latency=args.latency,
+            reply=args.reply,
+            token_delay=token_delay,
+            slow_fraction=args.slow_fraction,
+            slow_latency=args.slow_latency,
+            fail_after=args.fail_after
+        ),
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level
+    )
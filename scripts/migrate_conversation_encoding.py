@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Script: Re-encode stored conversation entries
+Location: scripts/migrate_conversation_encoding.py
+
+Walks every `conversation:*` list with SCAN and rewrites its entries in
+the target format (msgpack by default, or back to legacy JSON), keeping
+entry order and the remaining TTL. Each list is rewritten under
+WATCH/MULTI, so a chat turn landing mid-migration simply retries that key.
+
+Usage:
+    python scripts/migrate_conversation_encoding.py --dry-run
+    python scripts/migrate_conversation_encoding.py --to msgpack --batch 500
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from app.codec import decode_entry, encode_entry, encode_entry_json, is_legacy_entry
+from app.config import get_settings
+
+
+def _reencode(entries, target: str, compress_threshold: int):
+    encoded = []
+    for raw in entries:
+        if (target == "json") == is_legacy_entry(raw):
+            encoded.append(raw)
+            continue
+        entry = decode_entry(raw, validate=True)
+        if target == "json":
+            encoded.append(encode_entry_json(entry))
+        else:
+            encoded.append(encode_entry(entry, compress_threshold))
+    return encoded
+
+
+def migrate_key(client, key: bytes, target: str, compress_threshold: int, dry_run: bool):
+    """Rewrite one list; returns (entries, bytes before, bytes after, changed)"""
+    while True:
+        with client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(key)
+                entries = pipe.lrange(key, 0, -1)
+                ttl_ms = pipe.pttl(key)
+                encoded = _reencode(entries, target, compress_threshold)
+                before = sum(len(raw) for raw in entries)
+                after = sum(len(raw) for raw in encoded)
+                changed = encoded != entries
+                if dry_run or not changed or not entries:
+                    pipe.unwatch()
+                    return len(entries), before, after, changed
+
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *encoded)
+                if ttl_ms and ttl_ms > 0:
+                    pipe.pexpire(key, ttl_ms)
+                pipe.execute()
+                return len(entries), before, after, changed
+            except redis.WatchError:
+                continue
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Re-encode stored conversation entries")
+    parser.add_argument("--host", default=settings.redis_host)
+    parser.add_argument("--port", type=int, default=settings.redis_port)
+    parser.add_argument("--db", type=int, default=settings.redis_db)
+    parser.add_argument("--to", choices=["msgpack", "json"], default="msgpack")
+    parser.add_argument("--compress-threshold", type=int, default=settings.conversation_compress_threshold)
+    parser.add_argument("--batch", type=int, default=500, help="SCAN COUNT hint")
+    parser.add_argument("--dry-run", action="store_true", help="Report sizes without writing")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=False)
+
+    keys = changed_keys = entries = before = after = 0
+    for key in client.scan_iter(match="conversation:*", count=args.batch):
+        count, size_before, size_after, changed = migrate_key(
+            client, key, args.to, args.compress_threshold, args.dry_run
+        )
+        keys += 1
+        changed_keys += int(changed)
+        entries += count
+        before += size_before
+        after += size_after
+        if keys % 1000 == 0:
+            print(f"  {keys} keys scanned...")
+
+    action = "would rewrite" if args.dry_run else "rewrote"
+    print(f"Scanned {keys} conversation keys ({entries} entries), {action} {changed_keys}")
+    if before:
+        print(f"Entry payload: {before} -> {after} bytes ({after / before:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Script: Move keys to the hash-tagged layout
+Location: scripts/migrate_key_layout.py
+
+Keys used to be named without hash tags: `npc:<npc_id>`,
+`npc_stats:<npc_id>:conversations`, `conversation:<player_id>:<npc_id>`
+and `reputation:<player_id>:<npc_id>` (ids inserted as-is). app/keys.py
+now tags them so each player-NPC pair and each NPC lives in one Redis
+Cluster slot. This walks the old names with SCAN and moves every key to
+its new name, keeping its value and TTL:
+
+- in place (no --target-host): RENAMENX on the same server
+- to another server or a cluster (--target-host, --target-cluster):
+  DUMP on the source, RESTORE on the target, then delete the source key
+
+A key whose new name already exists is left alone and reported, unless
+--replace is given. Run it with the service stopped, or at least with the
+new version deployed, so nothing writes old names meanwhile. Then run
+scripts/backfill_npc_indexes.py so deletes can find the moved keys.
+
+Usage:
+    python scripts/migrate_key_layout.py --dry-run
+    python scripts/migrate_key_layout.py
+    python scripts/migrate_key_layout.py --target-host redis-cluster-0 --target-cluster
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from app import keys
+from app.config import get_settings
+from backfill_npc_indexes import connect, split_pair
+
+# Old prefix -> builder of the new key from the id(s) that followed it
+PAIR_KEYS = {"conversation": keys.conversation, "reputation": keys.reputation}
+
+
+def _is_legacy(key: str, prefix: str) -> bool:
+    return not key.startswith(prefix + ":{")
+
+
+def legacy_keys(client, npc_ids: set, batch: int):
+    """Yield (old key, new key) for every key still in the old layout"""
+    for key in client.scan_iter(match="npc:*", count=batch):
+        if _is_legacy(key, "npc"):
+            yield key, keys.npc(key[len("npc:"):])
+    for key in client.scan_iter(match="npc_stats:*:conversations", count=batch):
+        if _is_legacy(key, "npc_stats"):
+            yield key, keys.npc_conversation_count(key[len("npc_stats:"):-len(":conversations")])
+    for prefix, build in PAIR_KEYS.items():
+        for key in client.scan_iter(match=f"{prefix}:*", count=batch):
+            if _is_legacy(key, prefix):
+                player_id, npc_id = split_pair(key[len(prefix) + 1:], npc_ids)
+                if player_id and npc_id:
+                    yield key, build(player_id, npc_id)
+
+
+def move_key(source, target, key: str, new_key: str, replace: bool) -> bool:
+    """Move one key; returns False when the new name was taken"""
+    if target is None:
+        if replace:
+            source.rename(key, new_key)
+            return True
+        return bool(source.renamenx(key, new_key))
+
+    dump = source.dump(key)
+    if dump is None:
+        # Expired or deleted since the scan
+        return True
+    ttl_ms = source.pttl(key)
+    try:
+        target.restore(new_key, max(ttl_ms, 0), dump, replace=replace)
+    except redis.ResponseError as e:
+        if "BUSYKEY" in str(e):
+            return False
+        raise
+    source.delete(key)
+    return True
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Move keys to the hash-tagged layout")
+    parser.add_argument("--host", default=settings.redis_host)
+    parser.add_argument("--port", type=int, default=settings.redis_port)
+    parser.add_argument("--db", type=int, default=settings.redis_db)
+    parser.add_argument("--target-host", help="Copy into this server instead of renaming in place")
+    parser.add_argument("--target-port", type=int, default=6379)
+    parser.add_argument("--target-db", type=int, default=0)
+    parser.add_argument("--target-cluster", action="store_true", help="The target is a Redis Cluster")
+    parser.add_argument("--batch", type=int, default=500, help="SCAN COUNT hint")
+    parser.add_argument("--replace", action="store_true", help="Overwrite keys that already exist under the new name")
+    parser.add_argument("--dry-run", action="store_true", help="List what would move without writing")
+    args = parser.parse_args()
+
+    # DUMP payloads are binary, so the source connection must not decode
+    source = redis.Redis(host=args.host, port=args.port, db=args.db)
+    target = None
+    if args.target_host:
+        target = connect(args.target_host, args.target_port, args.target_db, args.target_cluster)
+
+    scanner = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=True)
+    npc_ids = {key[len("npc:"):] for key in scanner.scan_iter(match="npc:*", count=args.batch)
+               if _is_legacy(key, "npc")}
+
+    moved = taken = 0
+    for key, new_key in legacy_keys(scanner, npc_ids, args.batch):
+        if args.dry_run:
+            print(f"  {key} -> {new_key}")
+            moved += 1
+            continue
+        if not move_key(source, target, key, new_key, args.replace):
+            taken += 1
+            print(f"  skipped {key}: {new_key} already exists")
+            continue
+        moved += 1
+        if moved % 1000 == 0:
+            print(f"  {moved} keys moved...")
+
+    action = "would move" if args.dry_run else "moved"
+    print(f"{action.capitalize()} {moved} keys to the hash-tagged layout, {taken} skipped")
+
+
+if __name__ == "__main__":
+    main()